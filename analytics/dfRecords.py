@@ -1,10 +1,119 @@
+import numpy as np
 import pandas as pd
+
+from utils.utils import HOURS_REGEX, MINUTES_REGEX
+
+
+MONEY_COLUMNS = ['total', 'tripFare', 'subtotal', 'insurance', 'HST', 'TNC']
+LOCATION_COLUMNS = {'pickupLocation': 'pickup', 'dropOffLocation': 'dropOff'}
+ADDRESS_FIELDS = {
+    'street_number': 'StreetNumber',
+    'street': 'Street',
+    'city': 'City',
+    'province': 'Province',
+    'postal': 'Postal',
+}
+CATEGORY_COLUMNS = ['driver', 'compressorName', 'pickupCity', 'pickupProvince', 'dropOffCity', 'dropOffProvince']
+DATE_FORMAT = '%a, %d %b %Y'
+TIME_FORMAT = '%I:%M %p'
+
+
 class DFRecords:
-    def __init__(self, records):
-        self.recordDF = pd.DataFrame(records)
-    
+    """
+    Trip records as a typed DataFrame.
+
+    Money columns are float64 (CA$ prefixes stripped), date is datetime64 and
+    pickUpTime/dropTime are full datetimes on that date, distance is a float and
+    duration is float minutes, driverRating is a float, and driver, compressor and
+    city/province columns are categorical. pickupLocation/dropOffLocation are
+    flattened into pickupCity, dropOffPostal, ... columns. emailText is dropped
+    unless includeEmailText=True. Conversions are vectorized column ops run over
+    the distinct values of each column.
+    Pass typed=False for the raw pd.DataFrame(records) frame.
+    """
+    def __init__(self, records, typed=True, includeEmailText=False):
+        if not typed:
+            self.recordDF = pd.DataFrame(records)
+            return
+        raw = pd.DataFrame(records)
+        if not includeEmailText:
+            raw = raw.drop(columns=['emailText', 'emailArchive'], errors='ignore')
+        self.recordDF = self._typed(raw)
+
+    @classmethod
+    def fromCollection(cls, dbOps, db, collection, query=None, columns=None, batch_size=1000, **kwargs):
+        """
+        Build the frame straight from a streaming cursor, pulling only `columns`
+        (default: every field except the compressed emailText) from the server.
+        """
+        projection = {column: 1 for column in columns} if columns else {'emailText': 0, 'emailArchive': 0}
+        return cls(dbOps.iterItemsByQuery(query or {}, db, collection, projection=projection,
+                                          batch_size=batch_size), **kwargs)
+
+    @staticmethod
+    def _by_unique(series, convert):
+        # Receipts repeat the same prices, dates and times over and over, so run the
+        # vectorized conversion over the distinct values only and broadcast back
+        codes, uniques = pd.factorize(series.astype('string'), use_na_sentinel=True)
+        # A trailing NA converts to the missing value of the right dtype; missing
+        # values (code -1) take it, which also covers a column with no values at all
+        converted = convert(pd.Series([*uniques, pd.NA], dtype='string'))
+        result = converted.take(np.where(codes < 0, len(uniques), codes)).reset_index(drop=True)
+        result.index = series.index
+        return result
+
+    @staticmethod
+    def _money(values):
+        return pd.to_numeric(values.str.replace(r'[^\d.\-]', '', regex=True), errors='coerce').astype('float64')
+
+    @staticmethod
+    def _duration(values):
+        # Same patterns as utils.parseDuration, which types the stored durations
+        hours = pd.to_numeric(values.str.extract(HOURS_REGEX.pattern, expand=False), errors='coerce')
+        minutes = pd.to_numeric(values.str.extract(MINUTES_REGEX.pattern, expand=False), errors='coerce')
+        duration = hours.fillna(0) * 60 + minutes.fillna(0)
+        return duration.where(hours.notna() | minutes.notna()).astype('float64')
+
+    @classmethod
+    def _typed(cls, raw):
+        df = raw
+
+        for column in MONEY_COLUMNS:
+            if column in df.columns:
+                df[column] = cls._by_unique(df[column], cls._money)
+
+        if 'date' in df.columns:
+            df['date'] = cls._by_unique(df['date'], lambda v: pd.to_datetime(v, format=DATE_FORMAT, errors='coerce'))
+            for column in ('pickUpTime', 'dropTime'):
+                if column in df.columns:
+                    clock = cls._by_unique(df[column], lambda v: pd.to_datetime(
+                        v.str.strip(), format=TIME_FORMAT, errors='coerce') - pd.Timestamp('1900-01-01'))
+                    df[column] = df['date'] + clock
+
+        if 'distance' in df.columns:
+            df['distance'] = cls._by_unique(df['distance'], lambda v: pd.to_numeric(
+                v.str.extract(r'(\d+(?:\.\d+)?)', expand=False), errors='coerce').astype('float64'))
+
+        if 'duration' in df.columns:
+            df['duration'] = cls._by_unique(df['duration'], cls._duration)
+
+        if 'driverRating' in df.columns:
+            df['driverRating'] = pd.to_numeric(df['driverRating'], errors='coerce').astype('float64')
+
+        for column, prefix in LOCATION_COLUMNS.items():
+            if column not in df.columns:
+                continue
+            locations = pd.DataFrame(
+                [loc if isinstance(loc, dict) else {} for loc in df[column].tolist()],
+                index=df.index,
+                columns=list(ADDRESS_FIELDS))
+            locations.columns = [prefix + suffix for suffix in ADDRESS_FIELDS.values()]
+            df = pd.concat([df.drop(columns=[column]), locations], axis=1)
+
+        for column in CATEGORY_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+        return df
+
     def getRecordDF(self):
         return self.recordDF
-    
-
-            
@@ -0,0 +1,200 @@
+import os
+import json
+import shutil
+from datetime import datetime
+
+import pandas as pd
+from bson import ObjectId
+
+from analytics.dfRecords import DFRecords, CATEGORY_COLUMNS
+from database.dbOperations import NO_EMAIL_TEXT, UPDATED_FIELD, utc_now
+from utils.metrics import get_logger
+
+try:
+    import pyarrow  # noqa: F401  (parquet engine)
+except ImportError:
+    pyarrow = None
+
+
+MONTH_FORMAT = '%Y-%m'
+SYNC_FILE = '_sync.json'
+# Partition of trips whose date does not parse; sorts after every month
+UNKNOWN_MONTH = 'unknown'
+
+log = get_logger('parquetCache')
+
+
+class TripCache:
+    """
+    Local columnar cache of the trips collection, partitioned by trip month:
+
+        <cacheDir>/month=2025-07/part.parquet
+        <cacheDir>/_sync.json          {"lastId": "...", "syncedAt": "...", "partitions": {"2025-07": 212}}
+
+    sync() reads only the trips inserted since the last sync (their ObjectId is
+    above the stored lastId) or updated in place since then (DBOperations stamps
+    updatedAt on every update), groups them by month in that one pass and merges
+    them into just those partitions. read() loads only the requested columns and
+    months, so opening a notebook on years of trips does not touch Mongo at all.
+    Trips without a parseable date go to the month=unknown partition, which only
+    a read() without an end month includes. Deleted trips are not tracked; run
+    sync(full=True) after deleting.
+
+    Usage:
+        cache = TripCache('./cache/trips', dbOps, dbName, collectionName)
+        cache.sync()
+        df = cache.read(columns=['date', 'total', 'driver'], start='2025-01', end='2025-06')
+    """
+    def __init__(self, cacheDir, dbOps, db, collection):
+        if pyarrow is None:
+            raise ImportError('TripCache needs pyarrow: pip install pyarrow')
+        self.cacheDir = cacheDir
+        self.dbOps = dbOps
+        self.db = db
+        self.collection = collection
+        self.state = self._load_state()
+
+    def _load_state(self):
+        path = os.path.join(self.cacheDir, SYNC_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'lastId': None, 'syncedAt': None, 'partitions': {}}
+
+    def _save_state(self):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        path = os.path.join(self.cacheDir, SYNC_FILE)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+    def _partition_dir(self, month):
+        return os.path.join(self.cacheDir, f'month={month}')
+
+    def _partition_file(self, month):
+        return os.path.join(self._partition_dir(month), 'part.parquet')
+
+    def sync(self, full=False):
+        """
+        Refresh the partitions touched by trips inserted or updated since the last sync
+        (or rebuild every partition when full=True) in one pass over the changed trips.
+        Returns the list of months that were rewritten.
+        """
+        lastId = self.state['lastId'] if not full else None
+        syncedAt = self.state.get('syncedAt') if not full else None
+        query = {}
+        if lastId:
+            changed = [{'_id': {'$gt': ObjectId(lastId)}}]
+            # Trips stored before the cache tracked updates have no syncedAt to compare with
+            if syncedAt:
+                changed.append({UPDATED_FIELD: {'$gte': datetime.fromisoformat(syncedAt)}})
+            query = {'$or': changed}
+        # Updates stamped while this pass runs are picked up again next time
+        started = utc_now()
+
+        docs = list(self.dbOps.iterItemsByQuery(query, self.db, self.collection, projection=NO_EMAIL_TEXT,
+                                                sort=[('_id', 1)]))
+        changedIds = {str(doc['_id']) for doc in docs}
+        # Trips at or below the stored lastId were cached before and are being updated
+        updatedIds = {str(doc['_id']) for doc in docs if lastId and str(doc['_id']) <= lastId}
+        if docs:
+            # Sorted by _id, and updated trips sort at or below the stored lastId
+            lastId = max(lastId or '', str(docs[-1]['_id']))
+        df = DFRecords(docs).getRecordDF() if docs else pd.DataFrame()
+
+        if full:
+            shutil.rmtree(self.cacheDir, ignore_errors=True)
+            self.state = {'lastId': None, 'syncedAt': None, 'partitions': {}}
+
+        months = set()
+        if len(df):
+            df['_id'] = df['_id'].astype(str)
+            if 'date' in df.columns:
+                month = df['date'].dt.strftime(MONTH_FORMAT).fillna(UNKNOWN_MONTH)
+            else:
+                month = pd.Series(UNKNOWN_MONTH, index=df.index)
+            undated = int((month == UNKNOWN_MONTH).sum())
+            if undated:
+                log.warning("%d trips without a parseable date cached under month=%s", undated, UNKNOWN_MONTH)
+            for key, rows in df.groupby(month, sort=True):
+                updatedIds -= self._write_partition(key, rows.reset_index(drop=True), changedIds)
+                months.add(key)
+        # Updated trips not found in their new month had their date changed: drop them
+        # from their old partition. Only such moves make the sync look at other partitions
+        for key in self.months():
+            if not updatedIds:
+                break
+            if key in months:
+                continue
+            cached = pd.read_parquet(self._partition_file(key), columns=['_id'])
+            if cached['_id'].isin(updatedIds).any():
+                updatedIds -= self._write_partition(key, None, changedIds)
+                months.add(key)
+
+        self.state['lastId'] = lastId
+        self.state['syncedAt'] = started.isoformat()
+        self._save_state()
+        return sorted(months)
+
+    def _write_partition(self, month, rows, changedIds):
+        """
+        Swap in the partition of `month`: its cached rows minus `changedIds`, plus `rows`.
+        A partition left empty is removed. Returns the changed ids it held before.
+        """
+        frames = []
+        replaced = set()
+        if os.path.exists(self._partition_file(month)):
+            cached = pd.read_parquet(self._partition_file(month))
+            stale = cached['_id'].isin(changedIds)
+            replaced = set(cached['_id'][stale])
+            frames.append(cached[~stale])
+        if rows is not None:
+            frames.append(rows)
+        frames = [frame for frame in frames if len(frame)]
+
+        partition = self._partition_dir(month)
+        if not frames:
+            # Every trip moved out (a date correction); a schema-less stub would break read(columns=...)
+            shutil.rmtree(partition, ignore_errors=True)
+            self.state['partitions'].pop(month, None)
+            return replaced
+        df = pd.concat(frames, ignore_index=True)
+        for column in df.columns:
+            # Categories of the cached and the new rows differ; read() restores the dtype
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+
+        tmp = f'{partition}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        df.to_parquet(os.path.join(tmp, 'part.parquet'), index=False)
+        shutil.rmtree(partition, ignore_errors=True)
+        os.replace(tmp, partition)
+        self.state['partitions'][month] = len(df)
+        return replaced
+
+    def months(self):
+        return sorted(self.state['partitions'])
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        Load cached trips as a typed DataFrame.
+
+        Args:
+            columns (list): Columns to read (default: all)
+            start (str): First month to include, 'YYYY-MM'
+            end (str): Last month to include, 'YYYY-MM'
+        """
+        months = [m for m in self.months() if (start is None or m >= start) and (end is None or m <= end)]
+        if not months:
+            return pd.DataFrame(columns=columns)
+        frames = [pd.read_parquet(os.path.join(self._partition_dir(m), 'part.parquet'), columns=columns)
+                  for m in months]
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        for column in df.columns:
+            if column in CATEGORY_COLUMNS:
+                df[column] = df[column].astype('category')
+        return df
@@ -0,0 +1,215 @@
+from datetime import datetime
+
+from pymongo.errors import OperationFailure
+
+from utils.tripFields import TYPED_VERSION
+from utils.metrics import get_logger
+
+
+log = get_logger('tripReports')
+
+# Report dimension -> (aggregation group key, column of the DFRecords frame)
+GROUP_KEYS = {
+    'month': ({'$dateToString': {'format': '%Y-%m', 'date': '$tripDate'}}, 'month'),
+    'driver': ('$driver', 'driver'),
+    'city': ('$pickupLocation.city', 'pickupCity'),
+}
+# Typed cents field -> DFRecords money column
+MONEY_COLUMNS = {'totalCents': 'total', 'tripFareCents': 'tripFare', 'HSTCents': 'HST', 'TNCCents': 'TNC'}
+# Fields the pandas fallback pulls
+FALLBACK_COLUMNS = ['date', 'driver', 'pickupLocation', 'distance', *MONEY_COLUMNS.values()]
+
+
+class TripReports():
+    """
+    Common spending reports computed by the server. Each report is a $match /
+    $group (or $bucket) aggregation over the typed trip fields (tripDate,
+    totalCents, distanceKm, ...), so only the handful of result rows crosses the
+    network instead of every trip.
+
+    When the pipeline cannot run (pushdown=False, trips not yet migrated by
+    DBOperations.migrateTypedFields, or a server/driver that lacks an operator)
+    the same report is computed in pandas over DFRecords, with identical rows.
+    `lastMethod` tells which path served the last report.
+
+    Dates are 'YYYY-MM-DD' strings or datetimes; start is inclusive, end exclusive.
+    Money is returned both as exact integer cents and as dollars.
+
+    Usage:
+        reports = TripReports(dbOps, dbName, collectionName)
+        for row in reports.spend('driver', start='2025-07-01', end='2025-08-01'):
+            print(row['driver'], row['trips'], row['total'])
+    """
+    def __init__(self, dbOps, db, collection, pushdown=True):
+        self.dbOps = dbOps
+        self.db = db
+        self.collection = collection
+        self.pushdown = pushdown
+        self.lastMethod = None
+
+    # --- reports ---
+
+    def spend(self, by='month', start=None, end=None):
+        """Trips and spending per month, driver or pickup city"""
+        return self._grouped(by, ['totalCents'], start, end)
+
+    def taxTotals(self, by=None, start=None, end=None):
+        """HST and TNC recovery fees, overall (by=None) or per month/driver/city"""
+        return self._grouped(by, ['HSTCents', 'TNCCents'], start, end)
+
+    def farePerKm(self, by=None, start=None, end=None):
+        """Trip fare per kilometre over the trips that report a distance"""
+        rows = self._grouped(by, ['tripFareCents', 'distanceKm'], start, end, withDistance=True)
+        for row in rows:
+            row['farePerKm'] = row['tripFare'] / row['distanceKm'] if row['distanceKm'] else None
+        return rows
+
+    def totalHistogram(self, boundaries, start=None, end=None):
+        """
+        Trips per total-amount bucket. boundaries are ascending dollar amounts; each
+        row covers [lower, upper), and totals outside them land in the 'other' row.
+        """
+        cents = [round(boundary * 100) for boundary in boundaries]
+        if self._can_push_down():
+            pipeline = [
+                {'$match': {**self._date_match(start, end), 'totalCents': {'$exists': True}}},
+                {'$bucket': {'groupBy': '$totalCents', 'boundaries': cents, 'default': 'other',
+                             'output': {'trips': {'$sum': 1}, 'totalCents': {'$sum': '$totalCents'}}}},
+            ]
+            try:
+                docs = self.dbOps.aggregate(pipeline, self.db, self.collection)
+                self.lastMethod = 'pushdown'
+                return self._histogram_rows({doc['_id']: doc for doc in docs}, cents)
+            except (OperationFailure, NotImplementedError) as e:
+                log.warning("totalHistogram pushdown failed, falling back to pandas: %s", e)
+        df = self._frame(start, end)
+        df = df[df['totalCents'].notna()]
+        docs = {}
+        for lower, upper in zip(cents, cents[1:]):
+            inside = df[(df['totalCents'] >= lower) & (df['totalCents'] < upper)]
+            if len(inside):
+                docs[lower] = {'trips': len(inside), 'totalCents': int(inside['totalCents'].sum())}
+        other = df[(df['totalCents'] < cents[0]) | (df['totalCents'] >= cents[-1])]
+        if len(other):
+            docs['other'] = {'trips': len(other), 'totalCents': int(other['totalCents'].sum())}
+        self.lastMethod = 'pandas'
+        return self._histogram_rows(docs, cents)
+
+    # --- pushdown ---
+
+    def _can_push_down(self):
+        if not self.pushdown:
+            return False
+        # One unmigrated trip would be missing from every server-side sum
+        stale = self.dbOps.findItemsByQuery({'typedVersion': {'$ne': TYPED_VERSION}}, self.db, self.collection,
+                                            limit=1, projection={'_id': 1})
+        if stale:
+            log.warning("%s.%s has trips without typed fields; reporting in pandas until migrateTypedFields has run",
+                        self.db, self.collection)
+        return not stale
+
+    @staticmethod
+    def _day(value):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+    def _date_match(self, start, end):
+        if start is None and end is None:
+            return {}
+        bounds = {}
+        if start is not None:
+            bounds['$gte'] = self._day(start)
+        if end is not None:
+            bounds['$lt'] = self._day(end)
+        return {'tripDate': bounds}
+
+    def _grouped(self, by, sums, start, end, withDistance=False):
+        if by is not None and by not in GROUP_KEYS:
+            raise ValueError(f"by must be None or one of {tuple(GROUP_KEYS)}")
+        if self._can_push_down():
+            match = self._date_match(start, end)
+            if withDistance:
+                match.update({'distanceKm': {'$gt': 0}, 'tripFareCents': {'$exists': True}})
+            group = {'_id': GROUP_KEYS[by][0] if by else None, 'trips': {'$sum': 1},
+                     **{field: {'$sum': f'${field}'} for field in sums}}
+            pipeline = [{'$match': match}, {'$group': group}]
+            try:
+                docs = self.dbOps.aggregate(pipeline, self.db, self.collection)
+                self.lastMethod = 'pushdown'
+                return self._rows(by, docs, sums)
+            except (OperationFailure, NotImplementedError) as e:
+                log.warning("Report pushdown failed, falling back to pandas: %s", e)
+        docs = self._pandas_grouped(by, sums, start, end, withDistance)
+        self.lastMethod = 'pandas'
+        return self._rows(by, docs, sums)
+
+    # --- pandas fallback ---
+
+    def _frame(self, start, end):
+        # pandas is only imported when a report cannot be pushed down
+        from analytics.dfRecords import DFRecords
+        df = DFRecords.fromCollection(self.dbOps, self.db, self.collection, columns=FALLBACK_COLUMNS).getRecordDF()
+        for field, column in MONEY_COLUMNS.items():
+            if column in df.columns:
+                df[field] = (df[column] * 100).round().astype('Int64')
+            else:
+                df[field] = None
+        df['distanceKm'] = df['distance'] if 'distance' in df.columns else None
+        if 'date' in df.columns:
+            df['month'] = df['date'].dt.strftime('%Y-%m')
+            if start is not None:
+                df = df[df['date'] >= self._day(start)]
+            if end is not None:
+                df = df[df['date'] < self._day(end)]
+        return df
+
+    def _pandas_grouped(self, by, sums, start, end, withDistance):
+        df = self._frame(start, end)
+        if withDistance:
+            df = df[(df['distanceKm'] > 0) & df['tripFareCents'].notna()]
+        if by is None:
+            if not len(df):
+                return []
+            return [{'_id': None, 'trips': len(df), **{field: df[field].sum() for field in sums}}]
+        column = GROUP_KEYS[by][1]
+        if column not in df.columns:
+            df[column] = None
+        # Same groups as $group: a missing key is its own (None) group
+        keys = df[column].astype(object).where(df[column].notna(), None)
+        grouped = df.groupby(keys, dropna=False, observed=True)
+        docs = []
+        for key, group in grouped:
+            docs.append({'_id': None if key != key else key, 'trips': len(group),
+                         **{field: group[field].sum() for field in sums}})
+        return docs
+
+    # --- result rows ---
+
+    @staticmethod
+    def _rows(by, docs, sums):
+        rows = []
+        for doc in docs:
+            row = {by or 'group': doc['_id'], 'trips': int(doc['trips'])}
+            for field in sums:
+                value = doc.get(field) or 0
+                if field.endswith('Cents'):
+                    row[field] = int(value)
+                    row[field[:-len('Cents')]] = int(value) / 100
+                else:
+                    row[field] = float(value)
+            rows.append(row)
+        rows.sort(key=lambda row: (row[by or 'group'] is not None, str(row[by or 'group'])))
+        return rows
+
+    @staticmethod
+    def _histogram_rows(docs, cents):
+        rows = []
+        for lower, upper in zip(cents, cents[1:]):
+            if lower in docs:
+                rows.append({'lower': lower / 100, 'upper': upper / 100, 'trips': int(docs[lower]['trips']),
+                             'totalCents': int(docs[lower]['totalCents']),
+                             'total': int(docs[lower]['totalCents']) / 100})
+        if 'other' in docs:
+            rows.append({'lower': None, 'upper': None, 'trips': int(docs['other']['trips']),
+                         'totalCents': int(docs['other']['totalCents']),
+                         'total': int(docs['other']['totalCents']) / 100})
+        return rows
@@ -0,0 +1,169 @@
+import sys
+import os
+import io
+import time
+import gzip
+import asyncio
+import imaplib
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox
+from benchmarks.syntheticMail import build_mailbox, write_parser_config
+
+
+# Sync ingest (one thread: fetch, parse, upsert in turn), the threaded IngestPipeline
+# and the asyncio ingest() against a fake IMAP server and a Mongo with simulated
+# per-call latency (mongomock behind a sleep), or a real server with --mongo-uri.
+#
+#   python benchmarks/benchAsyncIngest.py --size 2000 --imap-latency 0.01 --mongo-latency 0.02
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2035-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+KEY_FIELDS = [("eid", 1)]
+
+
+class LatentCollection():
+    """mongomock collection whose write calls sleep `latency` first, like a round trip to Atlas"""
+    WRITES = ("insert_one", "insert_many", "bulk_write")
+
+    def __init__(self, coll, latency, asynchronous):
+        self._coll = coll
+        self._latency = latency
+        self._async = asynchronous
+
+    def __getattr__(self, name):
+        attr = getattr(self._coll, name)
+        if name not in self.WRITES:
+            return attr
+        if self._async:
+            async def call(*args, **kwargs):
+                await asyncio.sleep(self._latency)
+                return attr(*args, **kwargs)
+        else:
+            def call(*args, **kwargs):
+                time.sleep(self._latency)
+                return attr(*args, **kwargs)
+        return call
+
+
+class LatentClient():
+    def __init__(self, client, latency, asynchronous=False):
+        self._client = client
+        self._latency = latency
+        self._async = asynchronous
+
+    def __getitem__(self, db):
+        client = self
+
+        class _DB():
+            def __getitem__(self, collection):
+                return LatentCollection(client._client[db][collection], client._latency, client._async)
+        return _DB()
+
+
+def make_clients(args):
+    """(sync client, async client factory, count(client) -> stored docs)"""
+    if args.mongo_uri:
+        from pymongo import MongoClient, AsyncMongoClient
+        sync = MongoClient(args.mongo_uri)
+        return sync, lambda: AsyncMongoClient(args.mongo_uri), lambda db, coll: sync[db][coll].count_documents({})
+    import mongomock
+    backend = mongomock.MongoClient()
+    return (LatentClient(backend, args.mongo_latency), lambda: LatentClient(backend, args.mongo_latency, True),
+            lambda db, coll: backend[db][coll].count_documents({}))
+
+
+def reset(args, sync, db, coll):
+    raw = sync._client if isinstance(sync, LatentClient) else sync
+    raw[db].drop_collection(coll)
+    raw[db][coll].create_index(KEY_FIELDS, unique=True)
+
+
+def connect(server):
+    from utils.email_agent import Email
+    client = Email("bench@example.com", "secret", "127.0.0.1")
+    client.mail = imaplib.IMAP4("127.0.0.1", server.port)
+    client.mail.login(client.email, client.app_password)
+    client.mail.select("inbox")
+    return client
+
+
+def run_sequential(server, sync, db, coll):
+    from database.dbOperations import DBOperations
+    from utils.parsePool import parse_trips
+    client = connect(server)
+    dbOps = DBOperations(sync)
+    for batch in client.iter_search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX):
+        trips, _ = parse_trips(batch, workers=1, compressionAlgo=gzip)
+        dbOps.bulk_upsert(trips, db, coll, KEY_FIELDS, batch_size=200)
+    client.mail.logout()
+
+
+def run_pipeline(server, sync, db, coll):
+    from database.dbOperations import DBOperations
+    from utils.ingestPipeline import IngestPipeline
+    client = connect(server)
+    batches = client.iter_search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX)
+    IngestPipeline(DBOperations(sync), db, coll, insert_batch_size=200, keyFields=KEY_FIELDS).run(batches)
+    client.mail.logout()
+
+
+def run_async(server, asyncClient, db, coll):
+    from database.asyncDbOperations import AsyncDBOperations
+    from utils.asyncEmail import AsyncEmail
+    from utils.asyncIngest import ingest
+
+    async def main():
+        client = AsyncEmail("bench@example.com", "secret", "127.0.0.1", port=server.port, use_ssl=False)
+        await client.login()
+        await ingest(client, AsyncDBOperations(asyncClient()), db, coll, FROM_DATE, TO_DATE, KEYWORDS,
+                     SUBJECT_REGEX, keyFields=KEY_FIELDS, insert_batch_size=200)
+        await client.logout()
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2000)
+    parser.add_argument("--imap-latency", type=float, default=0.01)
+    parser.add_argument("--mongo-latency", type=float, default=0.02, help="ignored with --mongo-uri")
+    parser.add_argument("--mongo-uri", default=None, help="benchmark against a real mongod instead")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+
+    server = FakeIMAPServer({"INBOX": Mailbox(build_mailbox(args.size, hit_ratio=0.8))},
+                            latency=args.imap_latency).start()
+    sync, asyncClient, count = make_clients(args)
+    db, coll = "bench", "trips"
+    runs = [("sync sequential", lambda: run_sequential(server, sync, db, coll)),
+            ("threaded pipeline", lambda: run_pipeline(server, sync, db, coll)),
+            ("asyncio ingest", lambda: run_async(server, asyncClient, db, coll))]
+    try:
+        print(f"{'mode':>18} {'trips':>6} {'wall s':>8}")
+        stored = set()
+        for label, run in runs:
+            reset(args, sync, db, coll)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run()
+            elapsed = time.perf_counter() - start
+            stored.add(count(db, coll))
+            print(f"{label:>18} {count(db, coll):>6} {elapsed:>8.3f}")
+        assert len(stored) == 1, "modes stored a different number of trips"
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
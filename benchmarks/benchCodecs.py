@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import random
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.textCodecs import registry
+from benchmarks.syntheticMail import receipt_text
+
+
+# Per-record compression of synthetic receipts with every available codec, plus the
+# dictionary codecs trained on a separate sample: compression ratio and compress /
+# decompress throughput in MB/s of raw text. Every record must round-trip.
+#
+#   python benchmarks/benchCodecs.py --emails 5000 --train 500
+
+
+def measure(codec, corpus, repeat):
+    raw = sum(len(text) for text in corpus)
+    best_c = best_d = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blobs = [codec.compress(text) for text in corpus]
+        best_c = min(best_c, time.perf_counter() - start)
+        start = time.perf_counter()
+        texts = [codec.decompress(blob) for blob in blobs]
+        best_d = min(best_d, time.perf_counter() - start)
+    assert texts == corpus, f"{codec.key} does not round-trip"
+    size = sum(len(blob) for blob in blobs)
+    return raw / size, raw / best_c / 1e6, raw / best_d / 1e6, size / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--train", type=int, default=500, help="receipts in the dictionary training sample")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [receipt_text(rng, i).encode("utf-8") for i in range(args.emails)]
+    # Train on receipts the benchmark does not compress
+    sample_rng = random.Random(args.seed + 1)
+    sample = [receipt_text(sample_rng, i) for i in range(args.train)]
+
+    codecs = [registry.get(name) for name in registry.available()]
+    for name in registry.DICT_CODECS:
+        if registry.has(name):
+            start = time.perf_counter()
+            codec = registry.train(sample, name)
+            print(f"trained {codec.key} ({len(codec.dictionary)} bytes) in {time.perf_counter() - start:.2f}s")
+            codecs.append(codec)
+
+    raw = sum(len(text) for text in corpus)
+    print(f"{len(corpus)} receipts, {raw / len(corpus):.0f} bytes on average")
+    print(f"{'codec':>28} {'ratio':>7} {'bytes/rec':>10} {'comp MB/s':>10} {'decomp MB/s':>12}")
+    for codec in codecs:
+        ratio, comp, decomp, per_record = measure(codec, corpus, args.repeat)
+        label = f"{codec.name}+dict" if codec.dict_id else codec.name
+        print(f"{label:>28} {ratio:>7.2f} {per_record:>10.0f} {comp:>10.1f} {decomp:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import sys
+import os
+import time
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+import pandas as pd
+from analytics.dfRecords import DFRecords
+from benchmarks.syntheticMail import build_trip_records
+
+
+# Memory use and groupby latency of the raw object-dtype frame (money as "CA$23.45",
+# date as a display string, nested address dicts) versus the typed DFRecords frame.
+#
+#   python benchmarks/benchDFRecords.py --records 100000
+
+
+def raw_reports(df):
+    # What every report has to do today: re-parse strings row by row before grouping
+    total = df['total'].map(lambda s: float(s.replace('CA$', '').replace('$', '')) if s else None)
+    month = df['date'].map(lambda s: pd.Timestamp(s).to_period('M'))
+    city = df['pickupLocation'].map(lambda loc: loc.get('city') if loc else None)
+    return (total.groupby(month).sum(),
+            total.groupby(df['driver']).sum(),
+            total.groupby(city).mean())
+
+
+def typed_reports(df):
+    return (df.groupby(df['date'].dt.to_period('M'))['total'].sum(),
+            df.groupby('driver', observed=True)['total'].sum(),
+            df.groupby('pickupCity', observed=True)['total'].mean())
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    records = build_trip_records(args.records)
+
+    raw, raw_build_s = timed(lambda: DFRecords(records, typed=False).getRecordDF(), repeat=1)
+    typed, typed_build_s = timed(lambda: DFRecords(records).getRecordDF(), repeat=1)
+    raw_result, raw_s = timed(raw_reports, raw)
+    typed_result, typed_s = timed(typed_reports, typed)
+
+    # Same answers either way
+    assert (raw_result[0].round(2).values == typed_result[0].round(2).values).all()
+
+    mb = 1024 * 1024
+    print(f"records: {len(records)}")
+    print(f"{'':>8} {'build s':>8} {'memory MB':>10} {'3 groupbys s':>13}")
+    print(f"{'raw':>8} {raw_build_s:>8.2f} {raw.memory_usage(deep=True).sum() / mb:>10.1f} {raw_s:>13.3f}")
+    print(f"{'typed':>8} {typed_build_s:>8.2f} {typed.memory_usage(deep=True).sum() / mb:>10.1f} {typed_s:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
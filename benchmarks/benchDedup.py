@@ -0,0 +1,208 @@
+import sys
+import os
+import copy
+import time
+import random
+import argparse
+import tracemalloc
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# Content dedup of forwarded receipts. A share of the synthetic trips is repeated
+# under a new eid, as a forwarded copy gets a new IMAP id, and the trips are written
+# in insert batches through IngestPipeline._write into mongomock:
+#
+#   eid only      the unique eid index alone: forwarded copies are stored
+#   + index       plus the unique fingerprint index: the server rejects the copies
+#   + set/bloom   plus a TripDeduplicator: copies are dropped before the write
+#
+# Nothing is preloaded: each batch's fingerprints are checked with one $in lookup,
+# so a later run with a fresh TripDeduplicator still drops every stored trip.
+# Also reports fingerprint throughput, the memory and lookup cost of the exact set
+# versus the Bloom filter (for the fingerprints written in one run),
+# backfillFingerprints finding the copies stored by the eid-only run, and a batch
+# whose write failed being stored when it is retried.
+#
+#   python benchmarks/benchDedup.py --size 2000 --dup-ratio 0.3
+
+KEY_FIELDS = [("eid", 1)]
+EID_INDEX = {"keys": KEY_FIELDS, "unique": True}
+
+
+def forwarded_copies(records, ratio, seed):
+    rng = random.Random(seed)
+    copies = []
+    for record in rng.sample(records, int(len(records) * ratio)):
+        copy_ = copy.deepcopy(record)
+        copy_["eid"] = f"fwd-{record['eid']}"
+        copies.append(copy_)
+    trips = records + copies
+    rng.shuffle(trips)
+    return trips
+
+
+def fingerprint_index():
+    # The unique sparse fingerprint index as REPORT_INDEXES declares it
+    from database.indexManager import REPORT_INDEXES
+    return next(spec for spec in REPORT_INDEXES if spec["keys"] == [("fingerprint", 1)])
+
+
+def write_all(trips, mode, args):
+    import mongomock
+    from database.dbOperations import DBOperations
+    from database.indexManager import IndexManager, index_spec
+    from utils.ingestPipeline import IngestPipeline
+    from utils.tripDedup import TripDeduplicator
+    from utils.metrics import metrics
+
+    client = mongomock.MongoClient()
+    dbOps = DBOperations(client)
+    specs = [EID_INDEX] if mode == "eid only" else [EID_INDEX, fingerprint_index()]
+    IndexManager(client, "benchDedup", "trips", [index_spec(spec) for spec in specs]).ensure()
+    dedup = None
+    if mode == "+ set":
+        dedup = TripDeduplicator()
+    elif mode == "+ bloom":
+        dedup = TripDeduplicator(capacity=len(trips), error_rate=args.error_rate)
+    pipeline = IngestPipeline(dbOps, "benchDedup", "trips", insert_batch_size=args.batch, keyFields=KEY_FIELDS,
+                              dedup=dedup)
+    stats = {"trips": 0, "insert_batches": 0, "inserted": 0, "matched": 0, "duplicate": 0, "failed": 0,
+             "prefiltered": 0}
+
+    metrics.enabled = True
+    metrics.reset()
+    start = time.perf_counter()
+    for offset in range(0, len(trips), args.batch):
+        pipeline._write([dict(trip) for trip in trips[offset:offset + args.batch]], stats)
+    elapsed = time.perf_counter() - start
+    sent = metrics.snapshot().get("mongo_insert", {}).get("items", 0)
+    metrics.enabled = False
+    stored = client["benchDedup"]["trips"].count_documents({})
+    return dbOps, stats, sent, stored, elapsed, dedup
+
+
+def next_run(dbOps, trips, args):
+    """The same trips again with a new TripDeduplicator, as the next ingest run would see them"""
+    from utils.ingestPipeline import IngestPipeline
+    from utils.tripDedup import TripDeduplicator
+    pipeline = IngestPipeline(dbOps, "benchDedup", "trips", insert_batch_size=args.batch, keyFields=KEY_FIELDS,
+                              dedup=TripDeduplicator())
+    stats = {"trips": 0, "insert_batches": 0, "inserted": 0, "matched": 0, "duplicate": 0, "failed": 0,
+             "prefiltered": 0}
+    for offset in range(0, len(trips), args.batch):
+        pipeline._write([dict(trip) for trip in trips[offset:offset + args.batch]], stats)
+    return stats["prefiltered"]
+
+
+def retry_after_failure(records, args):
+    """A batch whose bulk_write raised is not remembered as stored: the retry writes it"""
+    import mongomock
+    from pymongo.errors import AutoReconnect
+    from database.dbOperations import DBOperations
+    from utils.ingestPipeline import IngestPipeline
+    from utils.tripDedup import TripDeduplicator
+
+    class FailingOnce(DBOperations):
+        failed = False
+
+        def bulk_upsert(self, *a, **kw):
+            if not self.failed:
+                self.failed = True
+                raise AutoReconnect("connection lost")
+            return super().bulk_upsert(*a, **kw)
+
+    client = mongomock.MongoClient()
+    pipeline = IngestPipeline(FailingOnce(client), "benchDedup", "trips", keyFields=KEY_FIELDS,
+                              dedup=TripDeduplicator())
+    stats = {"trips": 0, "insert_batches": 0, "inserted": 0, "matched": 0, "duplicate": 0, "failed": 0,
+             "prefiltered": 0}
+    batch = [dict(record) for record in records[:args.batch]]
+    try:
+        pipeline._write(batch, stats)
+    except AutoReconnect:
+        pass
+    pipeline._write(batch, stats)
+    return stats["prefiltered"], client["benchDedup"]["trips"].count_documents({})
+
+
+def filter_costs(fingerprints, probes, error_rate):
+    from utils.tripDedup import TripDeduplicator
+    rows = []
+    for label, capacity in (("set", None), ("bloom", len(fingerprints))):
+        tracemalloc.start()
+        dedup = TripDeduplicator(capacity=capacity, error_rate=error_rate)
+        for fingerprint in fingerprints:
+            dedup.add(fingerprint)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        false_hits = sum(probe in dedup for probe in probes)
+        lookup = (time.perf_counter() - start) / len(probes)
+        rows.append((label, memory, lookup, false_hits / len(probes)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2000, help="distinct receipts")
+    parser.add_argument("--dup-ratio", type=float, default=0.3, help="share of receipts forwarded once more")
+    parser.add_argument("--batch", type=int, default=500, help="trips per insert batch")
+    parser.add_argument("--filter-size", type=int, default=200000, help="fingerprints for the set/Bloom comparison")
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from utils.tripDedup import trip_fingerprint
+
+    records = build_trip_records(args.size, seed=args.seed)
+    start = time.perf_counter()
+    fingerprints = [trip_fingerprint(record) for record in records]
+    per_trip = (time.perf_counter() - start) / len(records)
+    assert None not in fingerprints and len(set(fingerprints)) == len(records), "distinct receipts collided"
+    print(f"fingerprint: {per_trip * 1e6:.1f} us/trip, {len(records)} receipts, no collisions")
+
+    trips = forwarded_copies(records, args.dup_ratio, args.seed)
+    print(f"\n{len(trips)} trips, {len(trips) - len(records)} forwarded copies, insert batches of {args.batch}")
+    print(f"{'mode':>10} {'stored':>7} {'sent':>6} {'rejected':>9} {'prefiltered':>12} {'wall s':>7}")
+    for mode in ("eid only", "+ index", "+ set", "+ bloom"):
+        dbOps, stats, sent, stored, elapsed, dedup = write_all(trips, mode, args)
+        print(f"{mode:>10} {stored:>7} {sent:>6} {stats['duplicate']:>9} {stats['prefiltered']:>12} {elapsed:>7.2f}")
+        if mode != "eid only":
+            assert stored == len(records), f"{mode}: duplicates were stored"
+        if mode == "+ set":
+            prefiltered = next_run(dbOps, trips, args)
+            assert prefiltered == len(trips), "a fresh deduplicator let stored trips through"
+        if mode == "eid only":
+            # Stored before fingerprints were indexed: the backfill finds the copies
+            from database.indexManager import IndexManager, index_spec
+            for doc in dbOps.client["benchDedup"]["trips"].find({}, {"_id": 1}):
+                dbOps.client["benchDedup"]["trips"].update_one({"_id": doc["_id"]}, {"$unset": {"fingerprint": ""}})
+            IndexManager(dbOps.client, "benchDedup", "trips", [index_spec(fingerprint_index())]).ensure()
+            result = dbOps.backfillFingerprints("benchDedup", "trips", batch_size=args.batch)
+            assert len(result["duplicate_ids"]) == stored - len(records)
+            backfill = f"backfill: {result['updated']} fingerprinted, {len(result['duplicate_ids'])} duplicates found"
+        if dedup is not None and dedup.bloom is not None:
+            bloom_stats = dedup.stats
+    print(backfill)
+    print(f"bloom: {bloom_stats['looked_up']} fingerprints looked up in batches, "
+          f"{bloom_stats['confirmed']} found stored")
+    prefiltered, stored = retry_after_failure(records, args)
+    assert prefiltered == 0 and stored == min(args.batch, len(records)), "a failed write was remembered as stored"
+    print(f"retry: {stored} trips of a failed batch stored on the second attempt")
+
+    rng = random.Random(args.seed + 1)
+    stored = [f"{rng.getrandbits(128):032x}" for _ in range(args.filter_size)]
+    probes = [f"{rng.getrandbits(128):032x}" for _ in range(50000)]
+    print(f"\n{args.filter_size} stored fingerprints, {len(probes)} probes of new ones")
+    print(f"{'filter':>7} {'memory MB':>10} {'ns/lookup':>10} {'false hit rate':>15}")
+    for label, memory, lookup, rate in filter_costs(stored, probes, args.error_rate):
+        print(f"{label:>7} {memory / 1e6:>10.1f} {lookup * 1e9:>10.0f} {rate:>15.4%}")
+
+
+if __name__ == "__main__":
+    main()
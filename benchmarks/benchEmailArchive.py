@@ -0,0 +1,148 @@
+import sys
+import os
+import gzip
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# Tiering emailText out of the trips collection with DBOperations.archiveEmailText:
+#
+#   size      average trip document and collection size before and after
+#   scan      an unprojected find over every trip, before and after
+#   migrate   trips/s, interrupted after --interrupt-pages pages, with a simulated crash
+#             between the archive append and the Mongo update of the next page (plus a
+#             torn record at the end of the segment), then resumed: every blob must be
+#             archived exactly once
+#   rehydrate single-record reads from the archive, and findItemsByQuery(decompress=True)
+#             over archived trips returning the original receipt text
+#   restore   restoreEmailText for one driver puts the blobs back in the collection
+#
+# Trips older than the median trip date are archived.
+#
+#   python benchmarks/benchEmailArchive.py --size 5000
+#   python benchmarks/benchEmailArchive.py --size 100000 --mongo-uri mongodb://localhost:27017
+
+DB = "benchEmailArchive"
+COLLECTION = "trips"
+
+
+def collection_bytes(client, args):
+    if args.mongo_uri:
+        return client[DB].command("collStats", COLLECTION)["size"]
+    import bson
+    return sum(len(bson.encode(doc)) for doc in client[DB][COLLECTION].find())
+
+
+def timed_scan(dbOps, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in dbOps.iterItemsByQuery({}, DB, COLLECTION))
+        timings.append(time.perf_counter() - start)
+    return min(timings), count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500, help="trips per archive page")
+    parser.add_argument("--interrupt-pages", type=int, default=2)
+    parser.add_argument("--segment-mb", type=float, default=0.25, help="small segments so the run rolls over a few")
+    parser.add_argument("--reads", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from database.dbOperations import DBOperations, ARCHIVE_FIELD
+    from database.indexManager import IndexManager
+    from utils.emailArchive import EmailArchive
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client[DB][COLLECTION].drop()
+    IndexManager(client, DB, COLLECTION).ensure()
+    records = build_trip_records(args.size, seed=args.seed, compressionAlgo=gzip)
+    originals = {record["eid"]: gzip.decompress(record["emailText"]).decode("utf-8") for record in records}
+    client[DB][COLLECTION].insert_many(records)
+    workdir = tempfile.mkdtemp(prefix="benchEmailArchive")
+    archive = EmailArchive(workdir, segment_bytes=int(args.segment_mb * 1024 * 1024))
+    dbOps = DBOperations(client, archive=archive)
+
+    before_bytes = collection_bytes(client, args)
+    before_s, _ = timed_scan(dbOps, args.repeat)
+    cutoff = sorted(record["tripDate"] for record in records)[len(records) // 2]
+    expected = sum(1 for record in records if record["tripDate"] < cutoff)
+
+    start = time.perf_counter()
+    first = dbOps.archiveEmailText(DB, COLLECTION, cutoff, batch_size=args.batch, max_pages=args.interrupt_pages)
+    # Crash after the archive append of the next page, before its Mongo update
+    pending = dbOps.findItemsByQuery({"tripDate": {"$lt": cutoff}, "emailText": {"$exists": True}}, DB, COLLECTION,
+                                     limit=args.batch, projection={"emailText": 1}, sort=[("_id", 1)])
+    archive.append_many((str(doc["_id"]), doc["emailText"]) for doc in pending)
+    archive.close()
+    # ... and a torn record the crash left behind, cut off when the archive is reopened
+    segments = sorted(name for name in os.listdir(workdir) if name.startswith("segment-"))
+    with open(os.path.join(workdir, segments[-1]), "ab") as f:
+        f.write(b"UMA1 torn write")
+    archive = dbOps.archive = EmailArchive(workdir, segment_bytes=int(args.segment_mb * 1024 * 1024))
+    second = dbOps.archiveEmailText(DB, COLLECTION, cutoff, batch_size=args.batch)
+    elapsed = time.perf_counter() - start
+    stats = archive.stats()
+    assert not first["done"] and second["done"]
+    assert first["archived"] + second["archived"] == expected == stats["records"], "a blob was archived twice"
+    assert first["bytes"] + second["bytes"] == stats["blob_bytes"], "moved bytes miscounted"
+    again = dbOps.archiveEmailText(DB, COLLECTION, cutoff, batch_size=args.batch)
+    assert again["archived"] == 0
+
+    after_bytes = collection_bytes(client, args)
+    after_s, count = timed_scan(dbOps, args.repeat)
+    print(f"{len(records)} trips, {expected} older than {cutoff:%Y-%m-%d} archived into {stats['segments']} segments "
+          f"({stats['segment_bytes'] / 1e6:.1f} MB) in {elapsed:.1f}s ({expected / elapsed:.0f} trips/s), "
+          f"{first['archived']} before the interruption")
+    print(f"{'':>16} {'avg doc B':>10} {'collection MB':>14} {'full scan ms':>13}")
+    print(f"{'before':>16} {before_bytes / count:>10.0f} {before_bytes / 1e6:>14.2f} {before_s * 1000:>13.1f}")
+    print(f"{'after':>16} {after_bytes / count:>10.0f} {after_bytes / 1e6:>14.2f} {after_s * 1000:>13.1f}")
+
+    archived = dbOps.findItemsByQuery({ARCHIVE_FIELD: {"$exists": True}}, DB, COLLECTION,
+                                      projection={ARCHIVE_FIELD: 1})
+    sample = random.Random(args.seed).sample(archived, min(args.reads, len(archived)))
+    timings = []
+    for doc in sample:
+        start = time.perf_counter()
+        archive.read(str(doc["_id"]), doc[ARCHIVE_FIELD])
+        timings.append(time.perf_counter() - start)
+    print(f"rehydrate: {statistics.median(timings) * 1e6:.0f} us median single-record read "
+          f"({len(sample)} random records)")
+
+    start = time.perf_counter()
+    texts = dbOps.findItemsByQuery({"tripDate": {"$lt": cutoff}}, DB, COLLECTION, decompress=True)
+    fetch_s = time.perf_counter() - start
+    assert len(texts) == expected and all(doc["emailText"] == originals[doc["eid"]] for doc in texts)
+    print(f"rehydrate: {len(texts)} archived trips read back with decompress=True in {fetch_s * 1000:.0f} ms, "
+          f"all identical to the originals")
+
+    driver = texts[0]["driver"]
+    restored = dbOps.restoreEmailText({"driver": driver}, DB, COLLECTION)
+    back = dbOps.findItemsByQuery({"driver": driver, "tripDate": {"$lt": cutoff}}, DB, COLLECTION, decompress=True)
+    assert all(ARCHIVE_FIELD not in doc and doc["emailText"] == originals[doc["eid"]] for doc in back)
+    print(f"restore: {restored['restored']} trips of driver {driver} back in the collection")
+    archive.close()
+    client[DB][COLLECTION].drop()
+
+
+if __name__ == "__main__":
+    main()
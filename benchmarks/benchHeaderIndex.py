@@ -0,0 +1,125 @@
+import sys
+import os
+import time
+import random
+import imaplib
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.email_agent import Email
+from utils.headerIndex import HeaderIndex
+from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox
+from benchmarks.syntheticMail import build_mailbox, make_message, receipt_text
+
+
+# Batched date range search against the fake IMAP server (simulated RTT) with and
+# without a HeaderIndex:
+#
+#   no index    every run fetches and decodes the header of every SUBJECT candidate
+#   cold        first run with the index: same fetches, and the headers are indexed
+#   warm        same search again: no header is fetched, verdicts come from SQLite
+#   new mail    --new-mail messages arrived: only their headers are fetched
+#   narrowed    narrow_from=True: the search adds FROM <receipt sender>, so the
+#               noise the broad SUBJECT keywords match never leaves the server
+#   revalidated a receipt from a new sender address arrived and the FROM constraint
+#               expired: the search runs without it, finds the receipt, and the
+#               constraint chosen afterwards includes the new sender
+#
+# Every run must return the same hits as the no-index run over the same mailbox.
+#
+#   python benchmarks/benchHeaderIndex.py --size 4000 --latency 0.002
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2030-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+
+
+def run_once(server, index=None, narrow_from=False):
+    client = Email("bench@example.com", "secret", "127.0.0.1", header_index=index, narrow_from=narrow_from)
+    client.mail = imaplib.IMAP4("127.0.0.1", server.port)
+    client.mail.login(client.email, client.app_password)
+    client.mail.select("inbox")
+    server.reset_stats()
+    misses = index.misses if index else 0
+    candidates = []
+    search_ids = client._search_ids
+
+    def counted(*args, **kwargs):
+        ids = search_ids(*args, **kwargs)
+        candidates.extend(ids)
+        return ids
+    client._search_ids = counted
+    start = time.perf_counter()
+    hits = client.search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX, batched=True)
+    elapsed = time.perf_counter() - start
+    stats = {"candidates": len(candidates),
+             "headers": index.misses - misses if index else len(candidates),
+             "round_trips": server.round_trips, "bytes": server.bytes_sent, "seconds": elapsed}
+    client.mail.logout()
+    return [(hit["subject"], hit["date"], hit["text"]) for hit in hits], stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=4000)
+    parser.add_argument("--new-mail", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated seconds per IMAP command")
+    args = parser.parse_args()
+
+    messages = build_mailbox(args.size + args.new_mail)
+    mailbox = Mailbox(messages[:args.size])
+    server = FakeIMAPServer({"INBOX": mailbox}, latency=args.latency).start()
+    workdir = tempfile.mkdtemp(prefix="benchHeaderIndex")
+    index = HeaderIndex(os.path.join(workdir, "headerIndex.sqlite"))
+    rows = []
+    try:
+        baseline, stats = run_once(server)
+        rows.append(("no index", stats))
+        for label in ("cold", "warm"):
+            hits, stats = run_once(server, index)
+            assert hits == baseline, f"{label} run returned different hits"
+            rows.append((label, stats))
+
+        for raw in messages[args.size:]:
+            mailbox.append(raw)
+        grown, _ = run_once(server)
+        hits, stats = run_once(server, index)
+        assert hits == grown, "new mail run returned different hits"
+        rows.append(("new mail", stats))
+        hits, stats = run_once(server, index, narrow_from=True)
+        assert hits == grown, "narrowed run returned different hits"
+        rows.append(("narrowed", stats))
+
+        mailbox.append(make_message("FW: Your Monday morning trip with Uber", receipt_text(random.Random(0), 0),
+                                    datetime(2026, 6, 1, 8, 0, tzinfo=timezone.utc),
+                                    sender="Uber <receipts@uber.ca>"))
+        regrown, _ = run_once(server)
+        hits, _ = run_once(server, index, narrow_from=True)
+        assert len(hits) == len(regrown) - 1, "the FROM constraint should still skip the new sender"
+        index.sender_filter_max_age = 0
+        hits, stats = run_once(server, index, narrow_from=True)
+        index.sender_filter_max_age = 7 * 24 * 3600
+        assert hits == regrown, "the run after the constraint expired missed the new sender"
+        rows.append(("revalidated", stats))
+        senders = index.sender_filter("bench@example.com/inbox")
+        assert "receipts@uber.ca" in senders, senders
+    finally:
+        server.stop()
+        index.close()
+
+    print(f"{args.size} messages (+{args.new_mail} new), {len(baseline)} receipts, {args.latency * 1000:.0f} ms per command")
+    print(f"{'run':>11} {'candidates':>11} {'headers':>8} {'round trips':>12} {'fetch KB':>9} {'wall s':>7}")
+    for label, stats in rows:
+        print(f"{label:>11} {stats['candidates']:>11} {stats['headers']:>8} {stats['round_trips']:>12} "
+              f"{stats['bytes'] / 1024:>9.0f} {stats['seconds']:>7.2f}")
+    print(f"FROM constraint chosen from the index: {senders}")
+
+
+if __name__ == "__main__":
+    main()
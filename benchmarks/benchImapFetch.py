@@ -0,0 +1,74 @@
+import sys
+import os
+import io
+import time
+import imaplib
+import argparse
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.email_agent import Email
+from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox
+from benchmarks.syntheticMail import build_mailbox
+
+
+# Compares the per-id fetch path of Email.search_by_date_range_keywords_regex with
+# the batched mode against a local fake IMAP server with a simulated network RTT.
+#
+#   python benchmarks/benchImapFetch.py --sizes 250 1000 4000 --latency 0.002
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2030-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+
+
+def connect(server):
+    client = Email("bench@example.com", "secret", "127.0.0.1")
+    client.mail = imaplib.IMAP4("127.0.0.1", server.port)
+    client.mail.login(client.email, client.app_password)
+    client.mail.select("inbox")
+    return client
+
+
+def run_once(server, **kwargs):
+    client = connect(server)
+    server.reset_stats()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        hits = client.search_by_date_range_keywords_regex(
+            from_date=FROM_DATE, to_date=TO_DATE, keywords=KEYWORDS,
+            subject_regex=SUBJECT_REGEX, require_all_keywords=False, **kwargs)
+    elapsed = time.perf_counter() - start
+    round_trips = server.round_trips
+    client.mail.logout()
+    return hits, elapsed, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 4000])
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated seconds per IMAP command")
+    parser.add_argument("--header-batch", type=int, default=500)
+    parser.add_argument("--body-batch", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'mailbox':>8} {'mode':>8} {'hits':>6} {'round trips':>12} {'wall s':>8}")
+    for size in args.sizes:
+        server = FakeIMAPServer({"INBOX": Mailbox(build_mailbox(size))}, latency=args.latency).start()
+        try:
+            baseline, base_s, base_rt = run_once(server)
+            batched, batch_s, batch_rt = run_once(server, batched=True, header_batch_size=args.header_batch,
+                                                  body_batch_size=args.body_batch)
+        finally:
+            server.stop()
+        assert baseline == batched, "batched mode returned different results"
+        print(f"{size:>8} {'per-id':>8} {len(baseline):>6} {base_rt:>12} {base_s:>8.3f}")
+        print(f"{size:>8} {'batched':>8} {len(batched):>6} {batch_rt:>12} {batch_s:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
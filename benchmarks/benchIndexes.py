@@ -0,0 +1,164 @@
+import sys
+import os
+import time
+import statistics
+import argparse
+from datetime import timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# Latency of the IndexManager's representative queries (date range, driver/city by
+# date, amount threshold, eid/fingerprint lookups) on 10k, 100k and 1M synthetic
+# trips, first with only the _id index and then after IndexManager.ensure(), with
+# the winning plan of each and the advisor's findings once the indexes exist.
+#
+# Needs a real mongod: mongomock neither uses indexes nor implements explain. Without
+# --mongo-uri only the ensure() bookkeeping is checked (idempotent, conflicts
+# reported, nothing dropped).
+#
+#   python benchmarks/benchIndexes.py --mongo-uri mongodb://localhost:27017
+#   python benchmarks/benchIndexes.py --mongo-uri mongodb://localhost:27017 --sizes 10000,100000
+#
+# Parsing a million receipts would dominate the run, so --pool trips are parsed once
+# and cloned: each copy gets its own eid and fingerprint and has its typed dates
+# moved on by the span of the pool, so date windows stay equally selective at
+# every size.
+
+DB = "benchIndexes"
+COLLECTION = "trips"
+TYPED_DATES = ("tripDate", "tripStart", "tripEnd")
+
+
+def cloned_trips(pool, size):
+    dates = [trip["tripDate"] for trip in pool if "tripDate" in trip]
+    days = (max(dates) - min(dates)).days + 1 if dates else 1
+    for i in range(size):
+        copy, template = divmod(i, len(pool))
+        trip = {k: v for k, v in pool[template].items() if k != "_id"}
+        if copy:
+            trip["eid"] = f"{trip['eid']}-{copy}"
+            if "fingerprint" in trip:
+                trip["fingerprint"] = f"{trip['fingerprint']}-{copy}"
+            for field in TYPED_DATES:
+                if field in trip:
+                    trip[field] = trip[field] + timedelta(days=days * copy)
+        yield trip
+
+
+def load(coll, pool, size, chunk=10000):
+    batch = []
+    for trip in cloned_trips(pool, size):
+        batch.append(trip)
+        if len(batch) == chunk:
+            coll.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        coll.insert_many(batch, ordered=False)
+
+
+def query_latency(coll, query, sort, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor = coll.find(query, projection={"emailText": 0})
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        rows = len(list(cursor))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), rows
+
+
+def run_queries(manager, sample, repeat):
+    from database.indexManager import summarize_explain
+    results = {}
+    for name, builder in manager.queries.items():
+        query, sort, limit = builder(sample)
+        seconds, rows = query_latency(manager.coll, query, sort, limit, repeat)
+        summary = summarize_explain(manager.explain(query, sort, limit))
+        results[name] = (seconds, rows, summary)
+    return results
+
+
+def check_ensure(client):
+    # What mongomock can show: ensure() only builds what is missing and never drops
+    from database.indexManager import IndexManager, REPORT_INDEXES, index_spec
+    specs = [index_spec({"keys": "eid", "unique": True})] + [index_spec(spec) for spec in REPORT_INDEXES]
+    client[DB][COLLECTION].drop()
+    client[DB][COLLECTION].create_index("tripDate", name="byHand")
+    client[DB][COLLECTION].create_index("driver")
+    manager = IndexManager(client, DB, COLLECTION, specs)
+    first = manager.ensure()
+    second = manager.ensure()
+    assert "byHand" in first["existing"] and "tripDate_1" not in first["created"], "built a twin of byHand"
+    assert first["undeclared"] == ["driver_1"]
+    assert second["created"] == [] and len(second["existing"]) == len(specs)
+    client[DB][COLLECTION].drop()
+    client[DB][COLLECTION].create_index("fingerprint")  # declared unique + sparse
+    third = IndexManager(client, DB, COLLECTION, specs).ensure()
+    assert third["conflicts"] == ["fingerprint_1"] and "fingerprint_1" in client[DB][COLLECTION].index_information()
+    print(f"ensure: created {len(first['created'])} indexes, a second run created none, "
+          f"a conflicting fingerprint index was reported and kept")
+    findings = manager.advise(sample={})
+    if all("error" in finding for finding in findings):
+        print("advise: explain is not available here, latency needs --mongo-uri")
+    client[DB][COLLECTION].drop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--pool", type=int, default=5000, help="synthetic trips parsed, then cloned up to each size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo-uri", default=None, help="mongod to benchmark against (required for latency)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.mongo_uri:
+        import mongomock
+        check_ensure(mongomock.MongoClient())
+        return
+
+    from pymongo import MongoClient
+    from database.indexManager import IndexManager, REPORT_INDEXES, index_spec
+
+    client = MongoClient(args.mongo_uri)
+    check_ensure(client)
+    pool = build_trip_records(args.pool, seed=args.seed)
+    specs = [index_spec({"keys": "eid", "unique": True})] + [index_spec(spec) for spec in REPORT_INDEXES]
+    for size in (int(size) for size in args.sizes.split(",")):
+        coll = client[DB][COLLECTION]
+        coll.drop()
+        start = time.perf_counter()
+        load(coll, pool, size)
+        print(f"\n{size} trips (loaded in {time.perf_counter() - start:.1f}s)")
+        manager = IndexManager(client, DB, COLLECTION, specs)
+        # A trip from the middle of the collection: its windows are neither empty nor the whole range
+        sample = coll.find_one({}, skip=size // 2, projection={"emailText": 0})
+
+        bare = run_queries(manager, sample, args.repeat)
+        start = time.perf_counter()
+        created = manager.ensure()["created"]
+        print(f"built {len(created)} indexes in {time.perf_counter() - start:.1f}s")
+        indexed = run_queries(manager, sample, args.repeat)
+
+        print(f"{'query':>20} {'rows':>6} {'no index ms':>12} {'examined':>9} {'indexed ms':>11} {'examined':>9} "
+              f"{'speedup':>8}  plan")
+        for name, (bare_s, rows, bare_plan) in bare.items():
+            indexed_s, _, plan = indexed[name]
+            print(f"{name:>20} {rows:>6} {bare_s * 1000:>12.2f} {bare_plan['docsExamined']:>9} "
+                  f"{indexed_s * 1000:>11.2f} {plan['docsExamined']:>9} {bare_s / indexed_s:>7.1f}x  {plan['plan']}")
+        for finding in manager.advise(sample):
+            if finding.get("flags"):
+                print(f"advisor: {finding['query']}: {', '.join(finding['flags'])}")
+    client[DB][COLLECTION].drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import sys
+import os
+import io
+import json
+import gzip
+import imaplib
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_mailbox, write_parser_config
+
+
+# Peak RSS of the fully materialized flow (list of hits -> list of trips -> insert)
+# versus the streaming IngestPipeline as the mailbox grows. Every measurement runs
+# in a fresh interpreter; the fake IMAP server lives in its own process so its
+# mailbox does not count against the client.
+#
+#   python benchmarks/benchIngestPipeline.py --sizes 1000 4000 16000
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2035-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+
+
+class NullDBOperations():
+    """Stands in for DBOperations; counts and drops inserted trips"""
+    def __init__(self):
+        self.inserted = 0
+
+    def insert(self, record, db, collection, limit=None):
+        self.inserted += len(record) if isinstance(record, list) else 1
+
+
+def serve(size, portQueue):
+    from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox
+    server = FakeIMAPServer({"INBOX": Mailbox(build_mailbox(size, hit_ratio=0.8))})
+    portQueue.put(server.port)
+    server.serve_forever()
+
+
+def child(mode, port):
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+    from utils.email_agent import Email
+    from utils.parsePool import parse_trips
+    from utils.ingestPipeline import IngestPipeline
+
+    client = Email("bench@example.com", "secret", "127.0.0.1")
+    client.mail = imaplib.IMAP4("127.0.0.1", port)
+    client.mail.login(client.email, client.app_password)
+    client.mail.select("inbox")
+    dbOps = NullDBOperations()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "materialized":
+            hits = client.search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX,
+                                                              batched=True)
+            trips, _ = parse_trips(hits, workers=1, compressionAlgo=gzip)
+            dbOps.insert(trips, "db", "trips")
+        else:
+            batches = client.iter_search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX,
+                                                                      body_batch_size=50)
+            IngestPipeline(dbOps, "db", "trips", insert_batch_size=200, queue_size=2).run(batches)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "trips": dbOps.inserted, "peak_rss_mb": peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    print(f"{'mailbox':>8} {'mode':>13} {'trips':>7} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        portQueue = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(size, portQueue), daemon=True)
+        server.start()
+        port = portQueue.get()
+        try:
+            for mode in ("materialized", "streaming"):
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, str(port)],
+                                     capture_output=True, text=True, check=True).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                print(f"{size:>8} {mode:>13} {result['trips']:>7} {result['peak_rss_mb']:>12.1f}")
+        finally:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import sys
+import os
+import io
+import time
+import email
+import mailbox
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_mailbox, write_parser_config
+
+
+# Offline replay from a local archive: the synthetic mailbox written as an mbox, a
+# Maildir and a directory of .eml files, indexed cold and with a saved index, then
+# searched and parsed with parse_trips. Every format must return the same hits with
+# the same text an IMAP fetch of the message would give.
+#
+#   python benchmarks/benchLocalMailbox.py --size 20000
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2030-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+
+
+def write_archives(messages, workdir):
+    mbox_path = os.path.join(workdir, "receipts.mbox")
+    mbox = mailbox.mbox(mbox_path)
+    maildir = mailbox.Maildir(os.path.join(workdir, "Maildir"))
+    eml_dir = os.path.join(workdir, "eml")
+    os.makedirs(eml_dir)
+    for number, raw in enumerate(messages):
+        mbox.add(raw)
+        maildir.add(raw)
+        with open(os.path.join(eml_dir, f"{number:07d}.eml"), "wb") as f:
+            f.write(raw)
+    mbox.close()
+    return {"mbox": mbox_path, "Maildir": maildir._path, "eml dir": eml_dir}
+
+
+def search(client):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+    from utils.email_agent import Email
+    from utils.localMailbox import LocalMailbox
+    from utils.parsePool import parse_trips
+
+    messages = build_mailbox(args.size)
+    archives = write_archives(messages, workdir)
+    # What Email would extract from each message fetched over IMAP
+    reference = Email("", "", "")
+    expected = sorted(
+        (msg["Subject"], reference._message_text(msg)) for msg in map(email.message_from_bytes, messages)
+        if reference._subject_matches(msg["Subject"], KEYWORDS, None, False) and "morning trip" in msg["Subject"])
+
+    print(f"{'archive':>10} {'index s':>8} {'saved idx s':>12} {'search s':>9} {'hits':>6} {'parse s':>8} "
+          f"{'emails/s':>9}")
+    for label, path in archives.items():
+        index_dir = os.path.join(workdir, "index")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            LocalMailbox(path, index_dir=index_dir).login()
+        index_s = time.perf_counter() - start
+
+        client = LocalMailbox(path, index_dir=index_dir)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.login()
+        saved_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits = search(client)
+        search_s = time.perf_counter() - start
+        assert sorted((h["subject"], h["text"]) for h in hits) == expected, f"{label}: hits differ from IMAP"
+        # Ids become trip eids: unique and namespaced away from IMAP UIDs
+        ids = {h["id"] for h in hits}
+        assert len(ids) == len(hits) and all(i.startswith("archive:") for i in ids), f"{label}: bad ids"
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            trips, failures = parse_trips(hits, workers=1)
+            client.logout()
+        parse_s = time.perf_counter() - start
+        assert not failures and len(trips) == len(hits)
+        total = saved_s + search_s + parse_s
+        print(f"{label:>10} {index_s:>8.2f} {saved_s:>12.2f} {search_s:>9.2f} {len(hits):>6} {parse_s:>8.2f} "
+              f"{len(hits) / total:>9.0f}")
+        if label == "eml dir":
+            # A message filed ahead of all the others must not shift their ids
+            with open(os.path.join(path, "0.eml"), "wb") as f:
+                f.write(messages[0])
+            client = LocalMailbox(path, index_dir=index_dir)
+            assert ids <= {h["id"] for h in search(client)}, "ids shifted when the archive grew"
+
+
+if __name__ == "__main__":
+    main()
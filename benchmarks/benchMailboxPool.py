@@ -0,0 +1,188 @@
+import sys
+import os
+import io
+import time
+import imaplib
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.email_agent import Email
+from utils.syncState import SyncState
+from utils.mailboxPool import ImapConnectionPool, MailboxIngestCoordinator
+from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox
+from benchmarks.syntheticMail import build_mailbox
+
+
+# Sequential per-mailbox incremental sync (one Email client after another) versus
+# MailboxIngestCoordinator fetching every mailbox concurrently over a connection
+# pool, against a fake IMAP server with a simulated per-command latency.
+#
+#   python benchmarks/benchMailboxPool.py --mailboxes 4 --size 1000 --latency 0.01 --connections 4 8
+
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+ACCOUNT = {"EMAIL": "bench@example.com", "APP_PASSWORD": "secret", "IMAP_SERVER": "127.0.0.1"}
+
+
+def sequential(server, mailboxes, stateFile):
+    state = SyncState(stateFile)
+    client = Email(ACCOUNT["EMAIL"], ACCOUNT["APP_PASSWORD"], ACCOUNT["IMAP_SERVER"])
+    client.mail = imaplib.IMAP4("127.0.0.1", server.port)
+    client.mail.login(client.email, client.app_password)
+    hits = set()
+    start = time.perf_counter()
+    for mailbox in mailboxes:
+        for batch in client.iter_new_messages(KEYWORDS, SUBJECT_REGEX, state, mailbox=mailbox, body_batch_size=50):
+            hits.update(f"{ACCOUNT['EMAIL']}/{mailbox}/{hit['id']}" for hit in batch)
+        client.commit_sync(state)
+    elapsed = time.perf_counter() - start
+    client.mail.logout()
+    return hits, elapsed, state.marks
+
+
+class FlakyEmail(Email):
+    """Email whose first RFC822 body fetch fails, like a dropped IMAP command"""
+    failures = 1
+
+    def _fetch_set(self, message_set, parts, uid=False):
+        if parts == "(RFC822)" and self.failures:
+            self.failures -= 1
+            raise imaplib.IMAP4.abort("connection reset")
+        return super()._fetch_set(message_set, parts, uid=uid)
+
+
+def flaky_sync(server, mailbox, stateFile):
+    """Incremental sync of `mailbox` whose first body fetch fails, then a clean rerun"""
+    state = SyncState(stateFile)
+    client = FlakyEmail(ACCOUNT["EMAIL"], ACCOUNT["APP_PASSWORD"], ACCOUNT["IMAP_SERVER"])
+    client.mail = _login(server)
+    hits = set()
+    for _ in range(2):
+        for batch in client.iter_new_messages(KEYWORDS, SUBJECT_REGEX, state, mailbox=mailbox, body_batch_size=50):
+            hits.update(f"{ACCOUNT['EMAIL']}/{mailbox}/{hit['id']}" for hit in batch)
+        client.commit_sync(state)
+    client.mail.logout()
+    return hits
+
+
+class FlakyIMAP4(imaplib.IMAP4):
+    """Connection whose first UID FETCH of whole messages fails"""
+    failures = 1
+
+    def uid(self, command, *args):
+        if command == "FETCH" and "(RFC822)" in args and FlakyIMAP4.failures:
+            FlakyIMAP4.failures -= 1
+            raise imaplib.IMAP4.abort("connection reset")
+        return super().uid(command, *args)
+
+
+def flaky_pooled(server, mailbox, stateFile):
+    """Pooled incremental sync of `mailbox` whose first body fetch fails, then a clean rerun"""
+    def connect(account):
+        conn = FlakyIMAP4("127.0.0.1", server.port)
+        conn.login(ACCOUNT["EMAIL"], ACCOUNT["APP_PASSWORD"])
+        return conn
+
+    state = SyncState(stateFile)
+    pool = ImapConnectionPool([ACCOUNT], max_connections=2, per_account=2, connect=connect)
+    hits = set()
+    for attempt in range(2):
+        coordinator = MailboxIngestCoordinator(pool, [(ACCOUNT["EMAIL"], mailbox)], KEYWORDS, SUBJECT_REGEX,
+                                               state=state, splits=2, body_batch_size=50, namespace=True)
+        hits.update(hit["id"] for batch in coordinator.iter_batches() for hit in batch)
+        coordinator.commit_sync(state)
+        assert bool(coordinator.errors) == (attempt == 0), coordinator.errors
+    pool.close()
+    return hits
+
+
+def pooled(server, mailboxes, stateFile, connections, splits, rate):
+    state = SyncState(stateFile)
+    connect = lambda account: _login(server)
+    pool = ImapConnectionPool([ACCOUNT], max_connections=connections, per_account=connections, rate=rate,
+                              connect=connect)
+    coordinator = MailboxIngestCoordinator(pool, [(ACCOUNT["EMAIL"], m) for m in mailboxes], KEYWORDS,
+                                           SUBJECT_REGEX, state=state, splits=splits, body_batch_size=50)
+    hits = set()
+    start = time.perf_counter()
+    for batch in coordinator.iter_batches():
+        hits.update(hit["id"] for hit in batch)
+    coordinator.commit_sync(state)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    assert not coordinator.errors, coordinator.errors
+    return hits, elapsed, state.marks
+
+
+def backfill(server, mailbox, connections):
+    """Date range ingest of one mailbox: UIDs as bare ids, split over `connections` connections"""
+    pool = ImapConnectionPool([ACCOUNT], max_connections=connections, per_account=connections,
+                              connect=lambda account: _login(server))
+    coordinator = MailboxIngestCoordinator(pool, [(ACCOUNT["EMAIL"], mailbox)], KEYWORDS, SUBJECT_REGEX,
+                                           from_date="2000-01-01", to_date="2100-01-01", splits=connections,
+                                           body_batch_size=50)
+    hits = {hit["id"] for batch in coordinator.iter_batches() for hit in batch}
+    pool.close()
+    assert not coordinator.errors, coordinator.errors
+    return hits
+
+
+def _login(server):
+    conn = imaplib.IMAP4("127.0.0.1", server.port)
+    conn.login(ACCOUNT["EMAIL"], ACCOUNT["APP_PASSWORD"])
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mailboxes", type=int, default=4)
+    parser.add_argument("--size", type=int, default=1000, help="messages per mailbox")
+    parser.add_argument("--latency", type=float, default=0.01, help="simulated seconds per IMAP command")
+    parser.add_argument("--connections", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--rate", type=float, default=None, help="commands per second per connection")
+    args = parser.parse_args()
+
+    names = [f"Box{i}" for i in range(args.mailboxes)]
+    server = FakeIMAPServer({name: Mailbox(build_mailbox(args.size, hit_ratio=0.5, seed=i))
+                             for i, name in enumerate(names)}, latency=args.latency).start()
+    workdir = tempfile.mkdtemp()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            base_hits, base_s, base_marks = sequential(server, names, os.path.join(workdir, "seq.json"))
+        print(f"{'mode':>22} {'hits':>6} {'wall s':>8} {'speedup':>8}")
+        print(f"{'sequential':>22} {len(base_hits):>6} {base_s:>8.3f} {1.0:>8.2f}")
+        for connections in args.connections:
+            splits = max(1, connections // args.mailboxes)
+            stateFile = os.path.join(workdir, f"pool{connections}.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                hits, elapsed, marks = pooled(server, names, stateFile, connections, splits, args.rate)
+            assert hits == base_hits, "pooled ingest returned different hits"
+            assert marks == base_marks, "pooled ingest stored different sync marks"
+            label = f"pool {connections} conn x{splits}"
+            print(f"{label:>22} {len(hits):>6} {elapsed:>8.3f} {base_s / elapsed:>8.2f}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            hits = backfill(server, names[0], max(args.connections))
+        # Same UIDs the incremental sync of that mailbox stored, without the namespace
+        prefix = f"{ACCOUNT['EMAIL']}/{names[0]}/"
+        assert hits == {hit[len(prefix):] for hit in base_hits if hit.startswith(prefix)}, "backfill returned other UIDs"
+        print(f"backfill of {names[0]}: {len(hits)} hits by UID")
+        with contextlib.redirect_stdout(io.StringIO()):
+            hits = flaky_sync(server, names[0], os.path.join(workdir, "flaky.json"))
+        # The failed body fetch held the mark back, so the rerun picked those messages up
+        assert hits == {hit for hit in base_hits if hit.startswith(prefix)}, "a failed fetch lost messages"
+        print(f"sync of {names[0]} with a failed body fetch: {len(hits)} hits after a rerun")
+        with contextlib.redirect_stdout(io.StringIO()):
+            hits = flaky_pooled(server, names[0], os.path.join(workdir, "flakyPool.json"))
+        assert hits == {hit for hit in base_hits if hit.startswith(prefix)}, "a failed pooled fetch lost messages"
+        print(f"pooled sync of {names[0]} with a failed body fetch: {len(hits)} hits after a rerun")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import sys
+import os
+import io
+import time
+import email
+import imaplib
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.email_agent import Email
+from utils.mimeParts import text_part, part_text, _parse_sexp
+from benchmarks.fakeImapServer import FakeIMAPServer, Mailbox, _bodystructure, _section
+from benchmarks.syntheticMail import build_mailbox, write_parser_config
+
+
+# Full RFC822 body fetches versus the two-stage BODYSTRUCTURE + BODY.PEEK[n] fetch
+# (Email(mime_parts=True)) for plain, rich (HTML alternative + inline map image)
+# and HTML-only receipts: bytes downloaded per email, round trips, wall time and
+# client-side decode time. Texts must match between the modes; HTML-only receipts
+# must extract the same trip fields as their plain-text version.
+#
+#   python benchmarks/benchMimeParts.py --size 1000 --latency 0.002
+
+FROM_DATE = "2025-07-01"
+TO_DATE = "2035-12-31"
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+
+
+def fetch(server, mime_parts):
+    client = Email("bench@example.com", "secret", "127.0.0.1", mime_parts=mime_parts)
+    client.mail = imaplib.IMAP4("127.0.0.1", server.port)
+    client.mail.login(client.email, client.app_password)
+    client.mail.select("inbox")
+    server.reset_stats()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        hits = client.search_by_date_range_keywords_regex(FROM_DATE, TO_DATE, KEYWORDS, SUBJECT_REGEX,
+                                                          batched=True)
+    elapsed = time.perf_counter() - start
+    stats = {"bytes": server.bytes_sent, "round_trips": server.round_trips, "elapsed": elapsed}
+    client.mail.logout()
+    return hits, stats
+
+
+def decode_times(raw_messages):
+    """Client CPU to get the receipt text: full parse of the RFC822 vs decoding just the text part"""
+    client = Email("bench@example.com", "secret", "127.0.0.1")
+    parsed = [email.message_from_bytes(raw) for raw in raw_messages]
+    sections = []
+    for msg in parsed:
+        part = text_part(_parse_sexp(_bodystructure(msg)[1:].encode()))
+        sections.append((_section(msg, part[0]), part))
+
+    start = time.perf_counter()
+    for raw in raw_messages:
+        client._message_text(email.message_from_bytes(raw))
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for payload, part in sections:
+        part_text(payload, part)
+    return full, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated seconds per IMAP command")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+    from utils.extractionEngine import ExtractionEngine
+    from benchmarks.syntheticMail import SYNTHETIC_PARSER_CONFIG
+    engine = ExtractionEngine(SYNTHETIC_PARSER_CONFIG)
+
+    print(f"{'layout':>7} {'mode':>10} {'hits':>5} {'KB/email':>9} {'round trips':>12} {'wall s':>7} "
+          f"{'decode ms/email':>16}")
+    plain_fields = None
+    for layout in ("plain", "rich", "html"):
+        raw_messages = build_mailbox(args.size, layout=layout)
+        server = FakeIMAPServer({"INBOX": Mailbox(raw_messages)}, latency=args.latency).start()
+        try:
+            full_hits, full_stats = fetch(server, mime_parts=False)
+            part_hits, part_stats = fetch(server, mime_parts=True)
+        finally:
+            server.stop()
+
+        receipts = [raw for raw in raw_messages if b"morning trip with Uber" in raw]
+        full_decode, part_decode = decode_times(receipts)
+        fields = [engine.extract(hit["text"]) for hit in part_hits]
+        if layout == "plain":
+            plain_fields = fields
+        if layout != "html":
+            assert [h["text"] for h in full_hits] == [h["text"] for h in part_hits], f"{layout}: texts differ"
+        assert fields == plain_fields, f"{layout}: extracted trip fields differ from the plain receipts"
+
+        for mode, hits, stats, decode in (("rfc822", full_hits, full_stats, full_decode),
+                                          ("bodystruct", part_hits, part_stats, part_decode)):
+            print(f"{layout:>7} {mode:>10} {len(hits):>5} {stats['bytes'] / 1024 / max(1, len(hits)):>9.1f} "
+                  f"{stats['round_trips']:>12} {stats['elapsed']:>7.3f} {decode * 1000 / len(receipts):>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
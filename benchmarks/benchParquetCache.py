@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# TripCache (month-partitioned Parquet) against loading the trips from Mongo:
+#
+#   collection  DFRecords.fromCollection over every trip, what a notebook does without the cache
+#   first sync  the one pass that builds every partition
+#   incremental --new trips inserted, plus --updated trips repaired in place (total and,
+#               for one, the date) and re-typed with migrateTypedFields, then sync()
+#   read        three months of date/total/driver from the cache
+#
+# After the incremental sync the cache must hold exactly what a fresh collection load
+# returns: every trip once, with its updated total and in its new month. It must
+# still do so once every trip of the first month has moved out (that partition is
+# removed) and one trip has a date that does not parse (it lands in month=unknown).
+#
+#   python benchmarks/benchParquetCache.py --size 5000
+#   python benchmarks/benchParquetCache.py --size 50000 --mongo-uri mongodb://localhost:27017
+
+DB = "benchParquetCache"
+COLLECTION = "trips"
+COLUMNS = ["_id", "date", "total", "driver"]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def snapshot(df):
+    return sorted(zip(df["_id"].astype(str), df["date"].astype(str), df["total"].round(2)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--new", type=int, default=500)
+    parser.add_argument("--updated", type=int, default=200)
+    parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from bson import ObjectId
+    from analytics.dfRecords import DFRecords
+    from analytics.parquetCache import TripCache
+    from database.dbOperations import DBOperations
+    from database.indexManager import IndexManager
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client[DB][COLLECTION].drop()
+    IndexManager(client, DB, COLLECTION).ensure()
+    records = build_trip_records(args.size + args.new, seed=args.seed)
+    client[DB][COLLECTION].insert_many(records[:args.size])
+    dbOps = DBOperations(client)
+    cache = TripCache(tempfile.mkdtemp(prefix="benchParquetCache"), dbOps, DB, COLLECTION)
+
+    loaded, collection_s = timed(lambda: DFRecords.fromCollection(dbOps, DB, COLLECTION).getRecordDF())
+    months, first_s = timed(cache.sync)
+
+    client[DB][COLLECTION].insert_many(records[args.size:])
+    ids = [doc["_id"] for doc in client[DB][COLLECTION].find({}, {"_id": 1}).limit(args.size)]
+    repaired = random.Random(args.seed).sample(ids, args.updated)
+    # Repairs outside DBOperations, then the typed fields are recomputed (and stamped) in place
+    client[DB][COLLECTION].update_many({"_id": {"$in": repaired}},
+                                       {"$set": {"total": "CA$99.99", "typedVersion": 0}})
+    moved = client[DB][COLLECTION].find_one({"_id": repaired[0]}, {"date": 1})["date"]
+    client[DB][COLLECTION].update_one({"_id": repaired[0]}, {"$set": {"date": "Mon, 01 Jan 2024"}})
+    migrated = dbOps.migrateTypedFields(DB, COLLECTION)
+    assert migrated["migrated"] == args.updated
+    touched, incremental_s = timed(cache.sync)
+
+    fresh = DFRecords.fromCollection(dbOps, DB, COLLECTION).getRecordDF()
+    cached = cache.read(columns=COLUMNS)
+    assert snapshot(cached) == snapshot(fresh), "cache differs from the collection"
+    assert "2024-01" in touched, "the moved trip did not reach its new month"
+    print(f"{args.size} trips in {len(months)} months, then {args.new} new and {args.updated} updated "
+          f"(one moved out of {moved[8:]}); {len(touched)} partitions rewritten")
+
+    # Empty the first month by moving its trips out, and give one trip a date that does not parse
+    emptied = months[0]
+    first = [ObjectId(i) for i in cache.read(columns=["_id"], start=emptied, end=emptied)["_id"]]
+    client[DB][COLLECTION].update_many({"_id": {"$in": first}},
+                                       {"$set": {"date": "Tue, 02 Jan 2024", "typedVersion": 0}})
+    client[DB][COLLECTION].update_one({"_id": ids[-1]}, {"$set": {"date": "unknown", "typedVersion": 0}})
+    dbOps.migrateTypedFields(DB, COLLECTION)
+    touched = cache.sync()
+    assert emptied in touched and emptied not in cache.months(), "the emptied month was kept"
+    assert "unknown" in cache.months(), "the undated trip was not cached"
+    fresh = DFRecords.fromCollection(dbOps, DB, COLLECTION).getRecordDF()
+    assert snapshot(cache.read(columns=COLUMNS)) == snapshot(fresh), "cache differs after emptying a month"
+    print(f"moved all {len(first)} trips out of {emptied}, one trip left undated: {len(touched)} partitions rewritten")
+    months = [month for month in months if month != emptied]
+
+    middle = len(months) // 2
+    start, end = months[max(middle - 1, 0)], months[min(middle + 1, len(months) - 1)]
+    window, read_s = timed(lambda: cache.read(columns=COLUMNS[1:], start=start, end=end))
+    print(f"{'':>24} {'seconds':>8}")
+    print(f"{'collection load':>24} {collection_s:>8.2f}")
+    print(f"{'first sync':>24} {first_s:>8.2f}")
+    print(f"{'incremental sync':>24} {incremental_s:>8.2f}")
+    print(f"{f'read {start}..{end}':>24} {read_s:>8.3f}  ({len(window)} trips)")
+    client[DB][COLLECTION].drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import sys
+import os
+import io
+import gzip
+import time
+import argparse
+import tempfile
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_hits, write_parser_config, SYNTHETIC_PARSER_CONFIG
+
+
+# parse_trips without a cache, with a cold ParseCache (first run of a window), a
+# warm one (re-run of the same window), an overlapping window and after a parser
+# config change. Parsed trips must be identical in every mode.
+#
+#   python benchmarks/benchParseCache.py --size 5000
+
+def timed(hits, cache, compressionAlgo, batch_size=50):
+    # Batches of the size IngestPipeline hands to parse_trips
+    from utils.parsePool import parse_trips
+    trips = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, len(hits), batch_size):
+            parsed, _ = parse_trips(hits[offset:offset + batch_size], workers=1, compressionAlgo=compressionAlgo,
+                                    cache=cache)
+            trips.extend(parsed)
+    return trips, time.perf_counter() - start
+
+
+def strip(trips):
+    # gzip output embeds a timestamp, so compare the decompressed text
+    return [{**t, 'emailText': gzip.decompress(t['emailText'])} for t in trips]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+    import utils.tripParser as tripParser
+    from utils.parseCache import ParseCache
+    from utils.extractionEngine import ExtractionEngine
+
+    hits = build_hits(args.size)
+    overlap = hits[args.size // 2:] + build_hits(args.size // 2, seed=1)
+    cache = ParseCache(os.path.join(workdir, "parseCache.sqlite"))
+
+    baseline, base_s = timed(hits, None, gzip)
+    print(f"{'run':>24} {'ms/email':>9} {'hit rate':>9}")
+    print(f"{'no cache':>24} {base_s * 1000 / len(hits):>9.3f} {'-':>9}")
+    for label, batch in (("cold cache", hits), ("warm cache (re-run)", hits), ("overlapping window", overlap)):
+        before = cache.stats()
+        trips, elapsed = timed(batch, cache, gzip)
+        after = cache.stats()
+        lookups = after['hits'] + after['misses'] - before['hits'] - before['misses']
+        rate = (after['hits'] - before['hits']) / lookups
+        print(f"{label:>24} {elapsed * 1000 / len(batch):>9.3f} {rate:>9.1%}")
+        if batch is hits:
+            assert strip(trips) == strip(baseline), f"{label}: trips differ from the uncached parse"
+
+    # Editing a label invalidates every cached extraction; an unrelated key does not
+    changed = {"UberBillAttr": {**SYNTHETIC_PARSER_CONFIG["UberBillAttr"], "Extra": "ignored"}}
+    assert ExtractionEngine(changed).fingerprint == tripParser.get_extraction_engine().fingerprint
+    changed["UberBillAttr"]["HST"] = "Harmonized Sales Tax"
+    tripParser.set_extraction_engine(ExtractionEngine(changed))
+    before = cache.stats()
+    _, elapsed = timed(hits, cache, gzip)
+    after = cache.stats()
+    print(f"{'after config change':>24} {elapsed * 1000 / len(hits):>9.3f} "
+          f"{(after['hits'] - before['hits']) / len(hits):>9.1%}")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import sys
+import os
+import io
+import time
+import argparse
+import tempfile
+import gzip
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_hits, write_parser_config
+
+
+# Scaling of parse_trips from 1 to N worker processes on synthetic receipts.
+#
+#   python benchmarks/benchParsePool.py --emails 20000 --workers 1 2 4 8
+
+
+def comparable(trips):
+    # gzip stamps the compression time into its header, so compare the payloads
+    return [dict(trip, emailText=gzip.decompress(trip["emailText"])) for trip in trips]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--chunksize", type=int, default=None)
+    args = parser.parse_args()
+
+    # utils.tripParser loads ./uberMailParser.yaml on import
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+    os.chdir(workdir)
+    from utils.parsePool import parse_trips
+
+    cpus = os.cpu_count() or 1
+    workerCounts = args.workers or sorted({1, 2, 4, cpus} - {w for w in (2, 4) if w > cpus})
+    hits = build_hits(args.emails)
+    hits[len(hits) // 2]["date"] = "not a date"  # one bad email must not sink the batch
+
+    reference = None
+    print(f"{'workers':>8} {'emails/sec':>12} {'speedup':>8} {'failures':>9}")
+    for workers in workerCounts:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            trips, failures = parse_trips(hits, workers=workers, chunksize=args.chunksize)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = (comparable(trips), elapsed)
+        assert comparable(trips) == reference[0], "results differ between worker counts"
+        print(f"{workers:>8} {len(hits) / elapsed:>12.0f} {reference[1] / elapsed:>8.2f} {len(failures):>9}")
+
+
+if __name__ == "__main__":
+    main()
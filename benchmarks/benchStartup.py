@@ -0,0 +1,102 @@
+import sys
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import write_parser_config
+
+
+# Cold start of the entry point, measured with `python -X importtime` in a fresh
+# interpreter per run:
+#
+#   legacy   everything the old module-level main.py imported (star imports, pandas,
+#            the parser config loaded by utils.tripParser at import)
+#   cli      `import main`, i.e. parsing the command line
+#   ingest   what `main.py ingest` imports before it connects, plus the parser config
+#   report   what `main.py report --dataframe` imports
+#
+# Import lists mirror the local imports in main.py; keep them in step.
+#
+#   python benchmarks/benchStartup.py --repeat 5
+
+SCENARIOS = {
+    "legacy": ["utils.email_agent", "utils.utils", "utils.tripParser", "utils.syncState", "utils.ingestPipeline",
+               "utils.mailboxPool", "utils.parseCache", "utils.localMailbox", "utils.metrics", "utils.textCodecs",
+               "database.dbConnect", "database.dbOperations", "database.dbUtils", "database.rollups",
+               "analytics.dfRecords", "yaml"],
+    "cli": ["main"],
+    "ingest": ["main", "yaml", "utils.metrics", "database.dbConnect", "database.dbOperations", "database.dbUtils",
+               "database.rollups", "utils.textCodecs", "utils.ingestPipeline", "utils.parseCache",
+               "utils.mailboxPool", "utils.syncState"],
+    "report": ["main", "yaml", "utils.metrics", "database.dbConnect", "database.dbOperations", "database.dbUtils",
+               "database.rollups", "analytics.dfRecords"],
+}
+# Scenarios that build the ExtractionEngine from uberMailParser.yaml
+LOADS_PARSER = ("legacy", "ingest")
+
+
+def script(scenario):
+    lines = [f"import sys; sys.path.insert(0, {project_root!r})"]
+    lines += [f"import {module}" for module in SCENARIOS[scenario]]
+    if scenario in LOADS_PARSER:
+        lines.append("import utils.tripParser; utils.tripParser.get_extraction_engine()")
+    return "\n".join(lines)
+
+
+def top_level(stderr):
+    """(module, cumulative us) of the imports made directly by the script"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        name = name[1:]
+        if not cumulative.strip().isdigit() or name.startswith(" "):
+            continue
+        modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def run_once(scenario, workdir):
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", script(scenario)], cwd=workdir,
+                          capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    return wall, top_level(done.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="interpreters per scenario; the fastest is kept")
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports listed per scenario")
+    args = parser.parse_args()
+
+    # utils.tripParser reads ./uberMailParser.yaml when the engine is first used
+    workdir = tempfile.mkdtemp()
+    write_parser_config(workdir)
+
+    best = {}
+    for _ in range(args.repeat):
+        for scenario in SCENARIOS:
+            wall, modules = run_once(scenario, workdir)
+            if scenario not in best or wall < best[scenario][0]:
+                best[scenario] = (wall, modules)
+
+    legacy = best["legacy"][0]
+    print(f"{'scenario':>8} {'wall ms':>8} {'imports ms':>11} {'vs legacy':>10}")
+    for scenario, (wall, modules) in best.items():
+        imports = sum(us for _, us in modules) / 1000
+        print(f"{scenario:>8} {wall * 1000:>8.0f} {imports:>11.0f} {wall / legacy - 1:>+10.0%}")
+    for scenario, (_, modules) in best.items():
+        heaviest = sorted(modules, key=lambda module: -module[1])[:args.top]
+        print(f"\n{scenario}: " + ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in heaviest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import sys
+import os
+import io
+import json
+import time
+import email
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import (build_mailbox, build_hits, build_trip_records, write_parser_config,
+                                      SYNTHETIC_PARSER_CONFIG)
+
+
+# Stage-level ingest benchmarks on seeded synthetic receipts, written as JSON so runs
+# can be compared across commits:
+#
+#   header_filter  Email._match_headers over raw header blocks (decode + keyword/regex)
+#   mime_decode    email.message_from_bytes + Email._message_text on receipt messages
+#   parse          ExtractionEngine.extract + formatDate, i.e. TripParser minus compression
+#   compress       textCodecs codec on the receipt text (--codec)
+#   dataframe      typed DFRecords frame from trip records
+#   insert         DBOperations.bulk_upsert into mongomock (sizes up to MONGOMOCK_MAX_INSERT),
+#                  or a real mongod with --mongo-uri
+#
+# Inputs are generated in chunks outside the timed sections, so sizes up to 1M only
+# hold one chunk of messages at a time (dataframe and insert keep their records).
+#
+#   python benchmarks/benchSuite.py --sizes 1000 10000 100000 --output bench-$(git rev-parse --short HEAD).json
+#   python benchmarks/benchSuite.py --sizes 1000 10000 --compare bench-abc123.json --threshold 0.1
+
+STAGES = ("header_filter", "mime_decode", "parse", "compress", "dataframe", "insert")
+CHUNK = 10000
+KEYWORDS = ["uber", "your", "morning", "trip"]
+SUBJECT_REGEX = r"FW:\s+Your\s+[A-Za-z]+\s+morning trip with Uber"
+KEY_FIELDS = [("eid", 1)]
+# mongomock scans the collection for every upsert filter, so bigger inserts need --mongo-uri
+MONGOMOCK_MAX_INSERT = 5000
+
+
+def chunks(size):
+    """(offset, count) covering `size` items in CHUNK-sized pieces"""
+    for offset in range(0, size, CHUNK):
+        yield offset, min(CHUNK, size - offset)
+
+
+def header_block(raw):
+    end = raw.find(b"\n\n")
+    return raw[:end + 2] if end >= 0 else raw
+
+
+def bench_header_filter(size, args, ctx):
+    import re
+    from utils.email_agent import Email
+    client = Email("", "", "")
+    pattern = re.compile(SUBJECT_REGEX, re.IGNORECASE)
+    elapsed = matched = 0
+    for offset, count in chunks(size):
+        messages = build_mailbox(count, seed=args.seed + offset)
+        ids = [str(offset + i + 1) for i in range(count)]
+        headers = dict(zip(ids, map(header_block, messages)))
+        start = time.perf_counter()
+        matched += len(client._match_headers(ids, headers, KEYWORDS, pattern, False))
+        elapsed += time.perf_counter() - start
+    return elapsed, {"matched": matched}
+
+
+def bench_mime_decode(size, args, ctx):
+    from utils.email_agent import Email
+    client = Email("", "", "")
+    elapsed = chars = 0
+    for offset, count in chunks(size):
+        # Receipts only: the filter has already dropped the noise by this stage
+        messages = build_mailbox(count, hit_ratio=1.0, seed=args.seed + offset, layout=args.layout)
+        start = time.perf_counter()
+        for raw in messages:
+            chars += len(client._message_text(email.message_from_bytes(raw)))
+        elapsed += time.perf_counter() - start
+    return elapsed, {"layout": args.layout, "text_chars": chars}
+
+
+def bench_parse(size, args, ctx):
+    from utils.tripParser import get_extraction_engine
+    from utils.utils import formatDate
+    extractionEngine = get_extraction_engine()
+    elapsed = fields = 0
+    for offset, count in chunks(size):
+        hits = build_hits(count, seed=args.seed + offset, parserConfig=ctx["parser_config"])
+        start = time.perf_counter()
+        for hit in hits:
+            formatDate(hit["date"])
+            fields += sum(value is not None for value in extractionEngine.extract(hit["text"]).values())
+        elapsed += time.perf_counter() - start
+    return elapsed, {"fields_found": fields}
+
+
+def bench_compress(size, args, ctx):
+    from utils.textCodecs import get_codec
+    codec = get_codec(args.codec)
+    elapsed = raw = packed = 0
+    for offset, count in chunks(size):
+        texts = [hit["text"].encode("utf-8")
+                 for hit in build_hits(count, seed=args.seed + offset, parserConfig=ctx["parser_config"])]
+        start = time.perf_counter()
+        blobs = [codec.compress(text) for text in texts]
+        elapsed += time.perf_counter() - start
+        raw += sum(map(len, texts))
+        packed += sum(map(len, blobs))
+    return elapsed, {"codec": codec.name, "ratio": raw / packed, "mb_per_sec": raw / elapsed / 1e6}
+
+
+def trip_records(size, args, ctx):
+    # eids stay unique across chunks, like a real mailbox
+    records = []
+    for offset, count in chunks(size):
+        for record in build_trip_records(count, seed=args.seed + offset, parserConfig=ctx["parser_config"]):
+            record["eid"] = str(offset + int(record["eid"]))
+            records.append(record)
+    return records
+
+
+def bench_dataframe(size, args, ctx):
+    from analytics.dfRecords import DFRecords
+    records = trip_records(size, args, ctx)
+    start = time.perf_counter()
+    df = DFRecords(records).getRecordDF()
+    elapsed = time.perf_counter() - start
+    return elapsed, {"memory_mb": df.memory_usage(deep=True).sum() / 1024 / 1024}
+
+
+def bench_insert(size, args, ctx):
+    from database.dbOperations import DBOperations
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    db, collection = "benchSuite", f"trips_{size}"
+    client[db][collection].drop()
+    client[db][collection].create_index(KEY_FIELDS, unique=True)
+    records = trip_records(size, args, ctx)
+    dbOps = DBOperations(client)
+    start = time.perf_counter()
+    result = dbOps.bulk_upsert(records, db, collection, KEY_FIELDS, batch_size=1000)
+    elapsed = time.perf_counter() - start
+    client[db][collection].drop()
+    return elapsed, {"backend": "mongod" if args.mongo_uri else "mongomock", "inserted": result["inserted_count"]}
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=project_root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=project_root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def compare(results, baseline_path, threshold):
+    """Print per-stage throughput change against a saved run; returns the regressed (stage, size) pairs"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["stage"], r["size"]): r for r in baseline["results"]}
+    print(f"\ncompared with {baseline['meta'].get('commit') or baseline_path}")
+    print(f"{'stage':>14} {'size':>8} {'before/s':>11} {'after/s':>11} {'change':>8}")
+    regressions = []
+    for result in results:
+        old = before.get((result["stage"], result["size"]))
+        if old is None:
+            continue
+        change = result["per_sec"] / old["per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append((result["stage"], result["size"]))
+        print(f"{result['stage']:>14} {result['size']:>8} {old['per_sec']:>11.0f} {result['per_sec']:>11.0f} "
+              f"{change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage and size; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layout", choices=("plain", "rich", "html"), default="plain",
+                        help="receipt MIME layout for mime_decode")
+    parser.add_argument("--codec", default="gzip", help="textCodecs codec for the compress stage")
+    parser.add_argument("--parser-config", default=None, help="uberMailParser.yaml; defaults to the synthetic labels")
+    parser.add_argument("--mongo-uri", default=None, help="insert into this mongod instead of mongomock")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="throughput drop (fraction) reported as a regression by --compare")
+    args = parser.parse_args()
+
+    # utils.tripParser loads ./uberMailParser.yaml on import
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp()
+    if args.parser_config:
+        from utils.utils import load_config
+        shutil.copy(args.parser_config, os.path.join(workdir, "uberMailParser.yaml"))
+        parser_config = load_config(args.parser_config)
+    else:
+        write_parser_config(workdir)
+        parser_config = SYNTHETIC_PARSER_CONFIG
+    os.chdir(workdir)
+    ctx = {"parser_config": parser_config}
+
+    commit, dirty = git_revision()
+    meta = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "mongo_uri")},
+    }
+
+    benches = {name: globals()[f"bench_{name}"] for name in STAGES}
+    results = []
+    print(f"{'stage':>14} {'size':>8} {'seconds':>9} {'items/s':>11} {'us/item':>9}")
+    for stage in args.stages:
+        for size in args.sizes:
+            if stage == "insert" and not args.mongo_uri and size > MONGOMOCK_MAX_INSERT:
+                print(f"{stage:>14} {size:>8}   skipped: mongomock is quadratic here, pass --mongo-uri")
+                continue
+            best = None
+            for _ in range(args.repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed, extra = benches[stage](size, args, ctx)
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, extra)
+            elapsed, extra = best
+            result = {"stage": stage, "size": size, "seconds": elapsed, "per_sec": size / elapsed,
+                      "us_per_item": elapsed / size * 1e6, **extra}
+            results.append(result)
+            print(f"{stage:>14} {size:>8} {elapsed:>9.3f} {result['per_sec']:>11.0f} {result['us_per_item']:>9.1f}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"\nwrote {output}")
+    if baseline and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import sys
+import os
+import io
+import time
+import random
+import argparse
+import contextlib
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.utils import load_config, find_text, find_distance_duration, pickUpDropOffInfo
+from utils.extractionEngine import ExtractionEngine
+from benchmarks.syntheticMail import SYNTHETIC_PARSER_CONFIG, receipt_text
+
+
+# Emails/sec of the per-field line scans (find_text x8, find_distance_duration,
+# pickUpDropOffInfo) versus the single-pass ExtractionEngine on synthetic receipts.
+#
+#   python benchmarks/benchTripParser.py --emails 5000 [--config uberMailParser.yaml]
+
+
+def legacy_extract(mailParser, emailText):
+    attrs = mailParser['UberBillAttr']
+    regex = attrs['Regex']
+    trip = {
+        'total': find_text(attrs['Total'], emailText, regex['PriceRegex']),
+        'tripFare': find_text(attrs['Trip_Fare'], emailText, regex['PriceRegex']),
+        'subtotal': find_text(attrs['Subtotal'], emailText, regex['PriceRegex']),
+        'insurance': find_text(attrs['Insurance'], emailText, regex['PriceRegex']),
+        'HST': find_text(attrs['HST'], emailText, regex['PriceRegex']),
+        'TNC': find_text(attrs['tnc_recovery_fees'], emailText, regex['PriceRegex']),
+        'driver': find_text(attrs['driver'], emailText, regex['DriverRegex']),
+        'driverRating': find_text(attrs['driverRating'], emailText, regex['RatingRegex']),
+    }
+    trip['distance'], trip['duration'] = find_distance_duration(attrs['distance'], emailText)
+    (trip['pickupLocation'], trip['dropOffLocation'],
+     trip['pickUpTime'], trip['dropTime']) = pickUpDropOffInfo(emailText)
+    return trip
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default=None, help="uberMailParser.yaml; defaults to the synthetic config")
+    args = parser.parse_args()
+
+    mailParser = load_config(args.config) if args.config else SYNTHETIC_PARSER_CONFIG
+    rng = random.Random(args.seed)
+    corpus = [receipt_text(rng, i, mailParser) for i in range(args.emails)]
+
+    # The legacy helpers print every matched line; that console I/O is part of today's cost
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        before = [legacy_extract(mailParser, text) for text in corpus]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine = ExtractionEngine(mailParser)
+    after = [engine.extract(text) for text in corpus]
+    engine_s = time.perf_counter() - start
+
+    assert before == after, "engine output differs from the legacy parser"
+    print(f"emails: {len(corpus)}")
+    print(f"legacy per-field scans : {len(corpus) / legacy_s:>10.0f} emails/sec")
+    print(f"single-pass engine     : {len(corpus) / engine_s:>10.0f} emails/sec")
+    print(f"speedup                : {legacy_s / engine_s:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
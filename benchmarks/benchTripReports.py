@@ -0,0 +1,119 @@
+import sys
+import os
+import time
+import math
+import argparse
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# TripReports computed by server-side aggregation versus the pandas fallback
+# (DFRecords over every trip) on the same collection: every report must return the
+# same rows both ways. Prints latency and how many documents reached Python.
+# Finally one trip without typed fields is stored to check that reports fall back
+# to pandas until it is migrated.
+#
+#   python benchmarks/benchTripReports.py --size 5000
+#   python benchmarks/benchTripReports.py --size 100000 --mongo-uri mongodb://localhost:27017
+
+DB = "benchTripReports"
+COLLECTION = "trips"
+REPORTS = [
+    ("spend by month", "spend", {"by": "month"}),
+    ("spend by driver", "spend", {"by": "driver"}),
+    ("spend by city", "spend", {"by": "city"}),
+    ("HST/TNC totals", "taxTotals", {}),
+    ("fare per km", "farePerKm", {}),
+    ("fare per km/drv", "farePerKm", {"by": "driver"}),
+    ("total histogram", "totalHistogram", {"boundaries": [0, 10, 20, 30, 40, 60]}),
+    ("July by city", "spend", {"by": "city", "start": "2025-07-01", "end": "2025-08-01"}),
+]
+
+
+def same_rows(left, right):
+    if len(left) != len(right):
+        return False
+    for a, b in zip(left, right):
+        if a.keys() != b.keys():
+            return False
+        for key in a:
+            if isinstance(a[key], float) and isinstance(b[key], float):
+                if not math.isclose(a[key], b[key], rel_tol=1e-9):
+                    return False
+            elif a[key] != b[key]:
+                return False
+    return True
+
+
+def timed(reports, method, kwargs, repeat):
+    from utils.metrics import metrics
+    best = None
+    for _ in range(repeat):
+        metrics.reset()
+        start = time.perf_counter()
+        rows = getattr(reports, method)(**kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            snapshot = metrics.snapshot()
+            pulled = sum(snapshot.get(stage, {}).get("items", 0) for stage in ("mongo_find", "mongo_aggregate"))
+            best = (elapsed, rows, pulled)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from database.dbOperations import DBOperations
+    from database.indexManager import IndexManager
+    from analytics.tripReports import TripReports
+    from utils.tripFields import TYPED_FIELDS
+    from utils.metrics import metrics
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client[DB][COLLECTION].drop()
+    IndexManager(client, DB, COLLECTION).ensure()
+    records = build_trip_records(args.size, seed=args.seed)
+    client[DB][COLLECTION].insert_many(records)
+    dbOps = DBOperations(client)
+    pushed = TripReports(dbOps, DB, COLLECTION)
+    pandas = TripReports(dbOps, DB, COLLECTION, pushdown=False)
+
+    metrics.enabled = True
+    print(f"{len(records)} trips in {'mongod' if args.mongo_uri else 'mongomock'}")
+    print(f"{'report':>16} {'rows':>5} {'pushdown ms':>12} {'docs':>6} {'pandas ms':>10} {'docs':>6} {'speedup':>8}")
+    for label, method, kwargs in REPORTS:
+        push_s, push_rows, push_docs = timed(pushed, method, kwargs, args.repeat)
+        assert pushed.lastMethod == "pushdown", f"{label} was not pushed down"
+        pandas_s, pandas_rows, pandas_docs = timed(pandas, method, kwargs, args.repeat)
+        assert same_rows(push_rows, pandas_rows), f"{label}: pushdown and pandas disagree"
+        print(f"{label:>16} {len(push_rows):>5} {push_s * 1000:>12.1f} {push_docs:>6} {pandas_s * 1000:>10.1f} "
+              f"{pandas_docs:>6} {pandas_s / push_s:>7.1f}x")
+
+    # A trip stored before typed fields (and fingerprints) existed: pushdown would miss it
+    stale = {k: v for k, v in records[0].items() if k not in TYPED_FIELDS and k not in ("_id", "fingerprint")}
+    stale["eid"] = "stale"
+    client[DB][COLLECTION].insert_one(stale)
+    rows = pushed.spend("month")
+    assert pushed.lastMethod == "pandas" and sum(row["trips"] for row in rows) == len(records) + 1
+    dbOps.migrateTypedFields(DB, COLLECTION)
+    assert same_rows(pushed.spend("month"), rows) and pushed.lastMethod == "pushdown"
+    print("\nunmigrated trip: fell back to pandas, pushed down again after migrateTypedFields")
+    client[DB][COLLECTION].drop()
+
+
+if __name__ == "__main__":
+    main()
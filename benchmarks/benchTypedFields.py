@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import argparse
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.syntheticMail import build_trip_records
+
+
+# Typed trip fields (tripStart datetimes, integer cents, km, minutes):
+#
+#   convert   typed_fields() cost per trip at ingest
+#   migrate   DBOperations.migrateTypedFields over trips stored with display strings
+#             only, interrupted after --interrupt-pages pages and then resumed
+#   query     "trips in a date window costing at least --min-total", once the old way
+#             (pull date/time/total strings of every trip, parse and filter in
+#             Python) and once as a tripStart/totalCents range query
+#
+# mongomock scans for both queries; with --mongo-uri the range query's explain()
+# shows whether the tripStart/totalCents indexes were used.
+#
+#   python benchmarks/benchTypedFields.py --size 5000 --mongo-uri mongodb://localhost:27017
+
+DB = "benchTypedFields"
+COLLECTION = "trips"
+
+
+def client_for(args):
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        return MongoClient(args.mongo_uri)
+    import mongomock
+    return mongomock.MongoClient()
+
+
+def legacy_filter(dbOps, start, end, min_cents):
+    from utils.utils import parseTripDate, parseMoneyCents
+    from utils.tripFields import parseClock
+    matched = pulled = 0
+    for doc in dbOps.iterItemsByQuery({}, DB, COLLECTION, projection={"date": 1, "pickUpTime": 1, "total": 1}):
+        pulled += 1
+        tripDate = parseTripDate(doc.get("date"))
+        clock = parseClock(doc.get("pickUpTime"))
+        cents = parseMoneyCents(doc.get("total"))
+        if tripDate is None or clock is None or cents is None:
+            continue
+        if start <= tripDate + clock < end and cents >= min_cents:
+            matched += 1
+    return matched, pulled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=3000)
+    parser.add_argument("--batch", type=int, default=500, help="trips per migration page")
+    parser.add_argument("--interrupt-pages", type=int, default=2)
+    parser.add_argument("--min-total", type=float, default=30.0, help="amount threshold in dollars")
+    parser.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from database.dbOperations import DBOperations
+    from database.indexManager import IndexManager
+    from utils.tripFields import typed_fields, TYPED_FIELDS, TYPED_VERSION
+
+    records = build_trip_records(args.size, seed=args.seed)
+    start = time.perf_counter()
+    for record in records:
+        typed_fields(record)
+    print(f"convert: {(time.perf_counter() - start) / len(records) * 1e6:.1f} us/trip")
+
+    client = client_for(args)
+    client[DB][COLLECTION].drop()
+    IndexManager(client, DB, COLLECTION).ensure()
+    # Stored the old way: display strings only
+    client[DB][COLLECTION].insert_many([{k: v for k, v in record.items() if k not in TYPED_FIELDS}
+                                        for record in records])
+    dbOps = DBOperations(client)
+
+    start = time.perf_counter()
+    first = dbOps.migrateTypedFields(DB, COLLECTION, batch_size=args.batch, max_pages=args.interrupt_pages)
+    second = dbOps.migrateTypedFields(DB, COLLECTION, batch_size=args.batch)
+    elapsed = time.perf_counter() - start
+    assert not first["done"] and second["done"]
+    assert first["migrated"] + second["migrated"] == len(records)
+    assert client[DB][COLLECTION].count_documents({"typedVersion": {"$ne": TYPED_VERSION}}) == 0
+    again = dbOps.migrateTypedFields(DB, COLLECTION, batch_size=args.batch)
+    assert again["migrated"] == 0 and again["pages"] == 0
+    print(f"migrate: {first['migrated']} trips before the interruption, {second['migrated']} after resuming, "
+          f"{len(records) / elapsed:.0f} trips/s, a third run found nothing to do")
+
+    # A two-week window two weeks in, so it holds a slice of the trips
+    dates = sorted(record["tripStart"] for record in records)
+    window_start = datetime.combine(dates[0].date() + timedelta(days=14), datetime.min.time())
+    window_end = window_start + timedelta(days=14)
+    min_cents = round(args.min_total * 100)
+    query = {"tripStart": {"$gte": window_start, "$lt": window_end}, "totalCents": {"$gte": min_cents}}
+
+    start = time.perf_counter()
+    legacy, pulled = legacy_filter(dbOps, window_start, window_end, min_cents)
+    legacy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    typed = dbOps.findItemsByQuery(query, DB, COLLECTION, projection={"_id": 1})
+    typed_s = time.perf_counter() - start
+    assert legacy == len(typed), "typed query disagrees with parsing the strings"
+
+    print(f"\nquery: {window_start:%Y-%m-%d} to {window_end:%Y-%m-%d}, total >= ${args.min_total:.2f}: "
+          f"{legacy} of {len(records)} trips")
+    print(f"{'method':>18} {'docs pulled':>12} {'ms':>8}")
+    print(f"{'parse client-side':>18} {pulled:>12} {legacy_s * 1000:>8.1f}")
+    print(f"{'typed range query':>18} {len(typed):>12} {typed_s * 1000:>8.1f}")
+    if args.mongo_uri:
+        plan = client[DB][COLLECTION].find(query).explain()["queryPlanner"]["winningPlan"]
+        print(f"winning plan: {plan}")
+    client[DB][COLLECTION].drop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import re
+import socketserver
+import threading
+import time
+import email
+from email.utils import parsedate_to_datetime
+from datetime import datetime
+
+
+# Minimal IMAP4rev1 server used by the benchmarks. It speaks just enough of the
+# protocol for imaplib (LOGIN, SELECT, STATUS, SEARCH, FETCH incl. BODYSTRUCTURE and
+# BODY[section], UID, LOGOUT) and adds a
+# fixed per-command latency so round-trip counts show up in wall time.
+
+TOKEN_REGEX = re.compile(r'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+')
+NEWLINE = b'\n'
+SECTION_REGEX = re.compile(r'BODY(?:\.PEEK)?\[([\d.]+)\]')
+
+
+def _tokenize(line):
+    tokens = []
+    for tok in TOKEN_REGEX.findall(line):
+        if tok.startswith('"'):
+            tok = tok[1:-1].replace('\\"', '"')
+        tokens.append(tok)
+    return tokens
+
+
+def _parse_set(message_set, maximum):
+    """Expand an IMAP message set such as 1:3,7,9:* into a set of integers"""
+    numbers = set()
+    for part in message_set.split(','):
+        if ':' in part:
+            lo, hi = part.split(':')
+            lo = maximum if lo == '*' else int(lo)
+            hi = maximum if hi == '*' else int(hi)
+            lo, hi = min(lo, hi), max(lo, hi)
+            numbers.update(range(lo, hi + 1))
+        else:
+            numbers.add(maximum if part == '*' else int(part))
+    return numbers
+
+
+def _quote(value):
+    if value is None:
+        return 'NIL'
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _bodystructure(msg):
+    """RFC 3501 BODYSTRUCTURE of an email.message.Message (no extension data, NIL envelopes)"""
+    if msg.is_multipart() and msg.get_content_maintype() == 'multipart':
+        return '(' + ''.join(_bodystructure(part) for part in msg.get_payload()) + \
+            f' {_quote(msg.get_content_subtype().upper())})'
+    params = ' '.join(f'{_quote(k.upper())} {_quote(v)}' for k, v in msg.get_params()[1:]) if msg.get_params() else ''
+    params = f'({params})' if params else 'NIL'
+    encoding = msg.get('Content-Transfer-Encoding', '7BIT').upper()
+    head = (f'{_quote(msg.get_content_maintype().upper())} {_quote(msg.get_content_subtype().upper())} '
+            f'{params} {_quote(msg.get("Content-ID"))} NIL {_quote(encoding)}')
+    if msg.get_content_type() == 'message/rfc822':
+        inner = msg.get_payload()[0]
+        raw = inner.as_bytes()
+        return f'({head} {len(raw)} NIL {_bodystructure(inner)} {raw.count(NEWLINE)})'
+    raw = _section_bytes(msg)
+    if msg.get_content_maintype() == 'text':
+        return f'({head} {len(raw)} {raw.count(NEWLINE)})'
+    return f'({head} {len(raw)})'
+
+
+def _section_bytes(msg):
+    payload = msg.get_payload()
+    return payload.encode('utf-8', errors='surrogateescape') if isinstance(payload, str) else payload
+
+
+def _section(msg, section):
+    """Raw (still transfer-encoded) body of a numbered leaf part, e.g. '2.1'"""
+    part = msg
+    for number in map(int, section.split('.')):
+        if part.get_content_type() == 'message/rfc822':
+            part = part.get_payload()[0]
+        if part.is_multipart():
+            part = part.get_payload()[number - 1]
+        elif number != 1:
+            return b''
+    return _section_bytes(part)
+
+
+class Mailbox():
+    def __init__(self, messages, uidvalidity=1):
+        # messages: list of raw RFC822 bytes, in arrival order
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self.lock = threading.Lock()
+        for raw in messages:
+            self.append(raw)
+
+    def append(self, raw):
+        with self.lock:
+            msg = email.message_from_bytes(raw)
+            try:
+                internal = parsedate_to_datetime(msg.get('Date')).date()
+            except Exception:
+                internal = datetime.now().date()
+            uid = self.messages[-1]['uid'] + 1 if self.messages else 1
+            self.messages.append({
+                'uid': uid,
+                'raw': raw,
+                'msg': msg,
+                'date': internal,
+                'subject': str(msg.get('Subject', '')),
+                'from': str(msg.get('From', '')),
+            })
+
+    @property
+    def uidnext(self):
+        return self.messages[-1]['uid'] + 1 if self.messages else 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Buffer writes and flush once per command so a response is one segment,
+    # not one per line (which triggers Nagle/delayed-ACK stalls on loopback)
+    wbufsize = 1 << 16
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data)
+
+    def handle(self):
+        server = self.server
+        self.send(b'* OK fake IMAP4rev1 ready\r\n')
+        self.wfile.flush()
+        mailbox = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.decode(errors='ignore').rstrip('\r\n')
+            if not line:
+                continue
+            tag, _, rest = line.partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            uid_mode = False
+            if command == 'UID':
+                uid_mode = True
+                command, _, args = args.partition(' ')
+                command = command.upper()
+
+            server.record_command(command)
+            if server.latency:
+                time.sleep(server.latency)
+
+            try:
+                if command == 'CAPABILITY':
+                    self.send(b'* CAPABILITY IMAP4rev1\r\n')
+                elif command == 'LOGIN' or command == 'NOOP':
+                    pass
+                elif command in ('SELECT', 'EXAMINE'):
+                    mailbox = server.get_mailbox(_tokenize(args)[0])
+                    self.send(f'* {len(mailbox.messages)} EXISTS\r\n'
+                              f'* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n'
+                              f'* OK [UIDNEXT {mailbox.uidnext}] Predicted next UID\r\n')
+                elif command == 'STATUS':
+                    tokens = _tokenize(args)
+                    box = server.get_mailbox(tokens[0])
+                    self.send(f'* STATUS {tokens[0]} (MESSAGES {len(box.messages)} '
+                              f'UIDVALIDITY {box.uidvalidity} UIDNEXT {box.uidnext})\r\n')
+                elif command == 'SEARCH':
+                    found = self.search(mailbox, _tokenize(args), uid_mode)
+                    self.send('* SEARCH ' + ' '.join(map(str, found)) + '\r\n')
+                elif command == 'FETCH':
+                    message_set, _, items = args.partition(' ')
+                    self.fetch(mailbox, message_set, items.upper(), uid_mode)
+                elif command == 'LOGOUT':
+                    self.send(b'* BYE logging out\r\n')
+                    self.send(f'{tag} OK LOGOUT completed\r\n')
+                    self.wfile.flush()
+                    break
+                else:
+                    self.send(f'{tag} BAD unknown command {command}\r\n')
+                    self.wfile.flush()
+                    continue
+            except Exception as e:
+                self.send(f'{tag} NO {e}\r\n')
+                self.wfile.flush()
+                continue
+            self.send(f'{tag} OK {command} completed\r\n')
+            self.wfile.flush()
+
+    def search(self, mailbox, tokens, uid_mode):
+        def parse_date(value):
+            return datetime.strptime(value, '%d-%b-%Y').date()
+
+        def criterion(pos):
+            key = tokens[pos].upper()
+            if key == '(':
+                preds, pos = [], pos + 1
+                while tokens[pos] != ')':
+                    pred, pos = criterion(pos)
+                    preds.append(pred)
+                return (lambda m, ps=preds: all(p(m) for p in ps)), pos + 1
+            if key == 'ALL':
+                return (lambda m: True), pos + 1
+            if key == 'OR':
+                left, pos = criterion(pos + 1)
+                right, pos = criterion(pos)
+                return (lambda m, l=left, r=right: l(m) or r(m)), pos
+            if key == 'NOT':
+                inner, pos = criterion(pos + 1)
+                return (lambda m, i=inner: not i(m)), pos
+            value = tokens[pos + 1] if pos + 1 < len(tokens) else ''
+            if key == 'SINCE':
+                d = parse_date(value)
+                return (lambda m: m['date'] >= d), pos + 2
+            if key == 'BEFORE':
+                d = parse_date(value)
+                return (lambda m: m['date'] < d), pos + 2
+            if key == 'SUBJECT':
+                v = value.lower()
+                return (lambda m: v in m['subject'].lower()), pos + 2
+            if key == 'FROM':
+                v = value.lower()
+                return (lambda m: v in m['from'].lower()), pos + 2
+            if key == 'UID':
+                uids = _parse_set(value, mailbox.uidnext - 1)
+                return (lambda m: m['uid'] in uids), pos + 2
+            # Bare message set
+            seqs = _parse_set(tokens[pos], len(mailbox.messages))
+            return (lambda m: m['seq'] in seqs), pos + 1
+
+        predicates, pos = [], 0
+        while pos < len(tokens):
+            if tokens[pos].upper() == 'CHARSET':
+                pos += 2
+                continue
+            pred, pos = criterion(pos)
+            predicates.append(pred)
+
+        found = []
+        for seq, m in enumerate(list(mailbox.messages), start=1):
+            m['seq'] = seq
+            if all(p(m) for p in predicates):
+                found.append(m['uid'] if uid_mode else seq)
+        return found
+
+    def fetch(self, mailbox, message_set, items, uid_mode):
+        messages = list(mailbox.messages)
+        if uid_mode:
+            wanted = _parse_set(message_set, messages[-1]['uid'] if messages else 0)
+        else:
+            wanted = _parse_set(message_set, len(messages))
+        for seq, m in enumerate(messages, start=1):
+            if (m['uid'] if uid_mode else seq) not in wanted:
+                continue
+            parts = []
+            if uid_mode or 'UID' in items:
+                parts.append(f'UID {m["uid"]}'.encode())
+            if 'HEADER.FIELDS' in items:
+                names = re.search(r'HEADER\.FIELDS \(([^)]*)\)', items).group(1).split()
+                header = b''.join(
+                    f'{n.title()}: {m["msg"].get(n)}\r\n'.encode()
+                    for n in names if m['msg'].get(n) is not None
+                ) + b'\r\n'
+                label = f'BODY[HEADER.FIELDS ({" ".join(names)})]'.encode()
+                parts.append(label + b' {%d}\r\n' % len(header) + header)
+            if 'BODYSTRUCTURE' in items:
+                parts.append(b'BODYSTRUCTURE ' + _bodystructure(m['msg']).encode())
+            for section in SECTION_REGEX.findall(items):
+                body = _section(m['msg'], section)
+                parts.append(b'BODY[%s] {%d}\r\n' % (section.encode(), len(body)) + body)
+            if 'RFC822' in items:
+                parts.append(b'RFC822 {%d}\r\n' % len(m['raw']) + m['raw'])
+            self.server.record_bytes(sum(len(p) for p in parts))
+            self.send(b'* %d FETCH (' % seq + b' '.join(parts) + b')\r\n')
+
+
+class FakeIMAPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Threaded local IMAP server for benchmarks and offline experiments.
+
+    Usage:
+        server = FakeIMAPServer({'INBOX': Mailbox(raw_messages)}, latency=0.002)
+        server.start()
+        conn = imaplib.IMAP4('127.0.0.1', server.port)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailboxes, latency=0.0, host='127.0.0.1'):
+        super().__init__((host, 0), _Handler)
+        self.mailboxes = {name.upper(): box for name, box in mailboxes.items()}
+        self.latency = latency
+        self.commands = {}
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def get_mailbox(self, name):
+        return self.mailboxes[name.upper()]
+
+    def record_command(self, command):
+        with self._stats_lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+
+    def record_bytes(self, count):
+        with self._stats_lock:
+            self.bytes_sent += count
+
+    @property
+    def round_trips(self):
+        return sum(self.commands.values())
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.commands = {}
+            self.bytes_sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
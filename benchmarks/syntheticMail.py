@@ -0,0 +1,248 @@
+import os
+import html
+import random
+import yaml
+from datetime import datetime, timedelta, timezone
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime
+
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# Same shape as uberMailParser.yaml; used to generate and parse synthetic receipts
+# when the real parser config is not available
+SYNTHETIC_PARSER_CONFIG = {
+    "UberBillAttr": {
+        "Total": "Total",
+        "Trip_Fare": "Trip fare",
+        "Subtotal": "Subtotal",
+        "Insurance": "Insurance",
+        "HST": "HST",
+        "tnc_recovery_fees": "TNC Recovery Fee",
+        "driver": "You rode with",
+        "driverRating": "Driver rating",
+        "distance": "kilometres",
+        "Regex": {
+            "PriceRegex": r"\$\d+\.\d{2}",
+            "DriverRegex": r"^[A-Z][a-z]+$(?<!^You)",
+            "RatingRegex": r"^\d\.\d{1,2}$",
+        },
+    }
+}
+
+DRIVERS = ["Ahmed", "Priya", "Jean", "Mohammed", "Olivia", "Gurpreet", "Wei", "Santiago", "Fatima", "Liam"]
+STREETS = ["Queen St W", "King St E", "Yonge St", "Bloor St W", "Dundas St W", "Bay St", "Spadina Ave",
+           "Eglinton Ave E", "College St", "Front St W"]
+CITIES = [("Toronto", "ON", "M"), ("Mississauga", "ON", "L"), ("Ottawa", "ON", "K"),
+          ("Montreal", "QC", "H"), ("Vancouver", "BC", "V"), ("Calgary", "AB", "T")]
+POSTAL_LETTERS = "ABCEGHJKLMNPRSTVWXYZ"
+
+NOISE_SUBJECTS = [
+    "Your weekly team update",
+    "Invoice for your order",
+    "Re: lunch on Friday?",
+    "Your trip itinerary",
+    "Newsletter: what's new this month",
+]
+
+
+def make_message(subject, body, date, sender="Uber Receipts <noreply@uber.com>", html=None, images=(),
+                 plain=True):
+    """
+    Build raw RFC822 bytes for one message. html adds a text/html alternative part
+    (or is the only body with plain=False); images are (cid, bytes) pairs attached
+    as inline parts of a multipart/related, the way Uber receipts embed their map.
+    """
+    if html is None:
+        msg = MIMEText(body, "plain", "utf-8")
+    elif not plain:
+        msg = MIMEText(html, "html", "utf-8")
+    else:
+        msg = MIMEMultipart("alternative")
+        msg.attach(MIMEText(body, "plain", "utf-8"))
+        msg.attach(MIMEText(html, "html", "utf-8"))
+    if images:
+        related = MIMEMultipart("related")
+        related.attach(msg)
+        for cid, data in images:
+            image = MIMEImage(data, "png")
+            image["Content-ID"] = f"<{cid}>"
+            image["Content-Disposition"] = f'inline; filename="{cid}.png"'
+            related.attach(image)
+        msg = related
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = "rider@example.com"
+    msg["Date"] = format_datetime(date)
+    return msg.as_bytes()
+
+
+RECEIPT_CSS = "".join(f".c{i} {{ font-family: UberMove, Helvetica, Arial, sans-serif; color: #{i:06x}; "
+                      f"padding: {i % 9}px; line-height: 1.{i % 7}; }}\n" for i in range(150))
+
+
+def receipt_html(text):
+    """HTML rendering of a plain-text receipt: one styled table row per line, with a map image"""
+    rows = "".join(f'<tr><td class="c{i % 150}" style="padding:4px 12px;font-size:14px">{html.escape(line)}</td>'
+                   f'<td width="20">&nbsp;</td></tr>\n'
+                   for i, line in enumerate(text.split("\r\n")) if line)
+    return ("<!DOCTYPE html><html><head><title>Your trip</title><style>" + RECEIPT_CSS + "</style></head><body>"
+            '<table role="presentation" width="100%" cellpadding="0" cellspacing="0">'
+            '<tr><td><img src="cid:map" width="600" alt="Trip map"></td></tr>\n' + rows +
+            "</table></body></html>")
+
+
+def receipt_images(index, size=40000):
+    """Incompressible stand-in for the inline trip map; own seed so every layout gets the same receipts"""
+    return [("map", random.Random(index).randbytes(size))]
+
+
+def _address(rng):
+    city, province, first = rng.choice(CITIES)
+    postal = (f"{first}{rng.randint(0, 9)}{rng.choice(POSTAL_LETTERS)} "
+              f"{rng.randint(0, 9)}{rng.choice(POSTAL_LETTERS)}{rng.randint(0, 9)}")
+    return f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {province} {postal}, CA"
+
+
+def receipt_text(rng, index, parserConfig=SYNTHETIC_PARSER_CONFIG):
+    """
+    Plain-text Uber receipt (CRLF line endings, like the decoded email parts) whose
+    labels come from parserConfig, with pickup/drop-off lines that match the
+    Canadian address regex used by pickUpDropOffInfo.
+    """
+    attrs = parserConfig["UberBillAttr"]
+    fare = rng.uniform(6, 45)
+    insurance = rng.uniform(0.2, 0.6)
+    tnc = 0.30
+    subtotal = fare + insurance + tnc
+    hst = subtotal * 0.13
+    total = subtotal + hst
+    hour = rng.randint(6, 10)
+    minute = rng.randint(0, 59)
+    duration = rng.randint(6, 55)
+    drop_minute = minute + duration
+
+    lines = [
+        "Uber",
+        f"Thanks for riding, rider {index}",
+        "We hope you enjoyed your ride this morning.",
+        f"{attrs['Total']} CA${total:.2f}",
+        f"{attrs['Trip_Fare']} CA${fare:.2f}",
+        f"{attrs['Subtotal']} CA${subtotal:.2f}",
+    ]
+    fees = [
+        f"{attrs['Insurance']} CA${insurance:.2f}",
+        f"{attrs['tnc_recovery_fees']} CA${tnc:.2f}",
+        f"{attrs['HST']} CA${hst:.2f}",
+    ]
+    rng.shuffle(fees)
+    if rng.random() < 0.1:
+        fees.pop()  # some receipts omit a fee line
+    lines += fees
+    lines += [
+        "Payments",
+        f"Visa ****{rng.randint(1000, 9999)} CA${total:.2f}",
+        "A temporary hold of CA$0.00 was placed on your payment method.",
+        f"{attrs['driver']} {rng.choice(DRIVERS)}",
+        f"{attrs['driverRating']} {rng.uniform(4.5, 5.0):.2f}",
+        f"{rng.uniform(1.5, 40):.2f} {attrs['distance']} | {duration} min",
+        f"{hour}:{minute:02d} AM",
+        _address(rng),
+        f"{hour + drop_minute // 60}:{drop_minute % 60:02d} AM",
+        _address(rng),
+        "Report lost item",
+        "Contact support",
+        "My trips",
+    ]
+    lines += ["Uber Canada Inc. " + "Fine print. " * rng.randint(5, 30) for _ in range(rng.randint(3, 12))]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def default_body(rng, index):
+    return receipt_text(rng, index)
+
+
+def build_mailbox(size, hit_ratio=0.3, seed=0, start=datetime(2025, 7, 1, 8, 0, tzinfo=timezone.utc),
+                  body_factory=default_body, layout="plain"):
+    """
+    Deterministic mailbox of `size` raw messages; roughly hit_ratio of them are
+    forwarded Uber trip receipts, the rest are noise that still matches the
+    broad SUBJECT pre-filter ("your", "trip").
+
+    layout shapes the receipts: "plain" is a single text/plain part, "rich" adds
+    an HTML alternative and an inline map image, "html" is HTML + image only.
+    """
+    rng = random.Random(seed)
+    messages = []
+    date = start
+    for index in range(size):
+        date += timedelta(minutes=rng.randint(30, 180))
+        if rng.random() < hit_ratio:
+            subject = f"FW: Your {WEEKDAYS[date.weekday()]} morning trip with Uber"
+            body = body_factory(rng, index)
+            if layout == "plain":
+                messages.append(make_message(subject, body, date))
+            else:
+                messages.append(make_message(subject, body, date, html=receipt_html(body),
+                                             images=receipt_images(index), plain=layout == "rich"))
+        else:
+            subject = rng.choice(NOISE_SUBJECTS)
+            messages.append(make_message(subject, "Nothing to see here.\r\n" * rng.randint(5, 50), date,
+                                         sender="someone@example.com"))
+    return messages
+
+
+def build_hits(size, seed=0, parserConfig=SYNTHETIC_PARSER_CONFIG,
+               start=datetime(2025, 7, 1, 8, 0, tzinfo=timezone.utc)):
+    """Search-hit dicts, as returned by Email.search_by_date_range_keywords_regex, for `size` receipts"""
+    rng = random.Random(seed)
+    hits = []
+    date = start
+    for index in range(size):
+        date += timedelta(minutes=rng.randint(30, 180))
+        hits.append({
+            "id": str(index + 1),
+            "subject": f"FW: Your {WEEKDAYS[date.weekday()]} morning trip with Uber",
+            "from": "Uber Receipts <noreply@uber.com>",
+            "date": format_datetime(date),
+            "text": receipt_text(rng, index, parserConfig),
+        })
+    return hits
+
+
+def write_parser_config(directory, parserConfig=SYNTHETIC_PARSER_CONFIG):
+    """Write parserConfig as uberMailParser.yaml so utils.tripParser can load it from `directory`"""
+    path = os.path.join(directory, "uberMailParser.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(parserConfig, f)
+    return path
+
+
+def build_trip_records(size, seed=0, parserConfig=SYNTHETIC_PARSER_CONFIG, compressionAlgo=None):
+    """
+    Trip dicts shaped like TripParser(...).trip for `size` synthetic receipts.
+    emailText holds the compressed receipt when compressionAlgo is given, else b"".
+    """
+    from utils.utils import formatDate
+    from utils.extractionEngine import ExtractionEngine
+    from utils.tripDedup import trip_fingerprint
+    from utils.tripFields import typed_fields
+
+    engine = ExtractionEngine(parserConfig)
+    records = []
+    for hit in build_hits(size, seed, parserConfig):
+        text = hit["text"]
+        trip = {
+            "eid": hit["id"],
+            "date": formatDate(hit["date"]),
+            "emailText": compressionAlgo.compress(text.encode("utf-8")) if compressionAlgo else b"",
+            "compressorName": compressionAlgo.__name__ if compressionAlgo else "gzip",
+        }
+        trip.update(engine.extract(text))
+        fingerprint = trip_fingerprint(trip)
+        if fingerprint is not None:
+            trip["fingerprint"] = fingerprint
+        trip.update(typed_fields(trip))
+        records.append(trip)
+    return records
@@ -0,0 +1,253 @@
+import sys
+import os
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append( project_root)
+
+
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+from typing import List, Dict, Any, Optional, Union, AsyncIterator
+import asyncio
+import time
+from errors.invalidRecordNumError import *
+from database.dbUtils import index_key_fields
+from database.dbOperations import _upsert_requests, _bulk_outcome
+from utils.metrics import get_logger, metrics
+
+
+log = get_logger('asyncDbOperations')
+
+
+class AsyncDBOperations():
+    """
+    asyncio counterpart of DBOperations for an async Mongo client, e.g.
+    pymongo.AsyncMongoClient (pymongo >= 4.9) or motor's AsyncIOMotorClient.
+    Methods take the same arguments and return the same dicts as DBOperations, so
+    Mongo round trips can overlap with IMAP fetches on one event loop.
+
+    Usage:
+        from pymongo import AsyncMongoClient
+        dbOps = AsyncDBOperations(AsyncMongoClient(uri))
+        result = await dbOps.bulk_upsert(trips, dbName, collectionName, index)
+    """
+    def __init__(self, client, rollups=None):
+        self.client = client
+        # Optional TripRollups; it uses a sync client, so it is updated off the event loop
+        self.rollups = rollups
+
+    async def findItemsByQuery(self, query: Dict[str, Any], db: str, collection: str,
+                               limit: Optional[int] = None, projection: Optional[Dict[str, Any]] = None,
+                               sort: Optional[List] = None, batch_size: Optional[int] = None
+                               ) -> List[Dict[str, Any]]:
+        """
+        Finds items in a MongoDB collection based on a query
+
+        Args:
+            query (Dict[str, Any]): MongoDB query dictionary
+            db (str): Database name
+            collection (str): Collection name
+            limit (Optional[int]): Maximum number of records to return
+            projection (Optional[Dict[str, Any]]): Server-side projection, e.g. NO_EMAIL_TEXT
+            sort (Optional[List]): Sort spec, e.g. [('date', 1)]
+            batch_size (Optional[int]): Documents per cursor batch (getMore round trip)
+
+        Returns:
+            List[Dict[str, Any]]: List of matching documents
+
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        try:
+            with metrics.stage('mongo_find') as stage:
+                results = [doc async for doc in self._cursor(query, db, collection, limit, projection, sort,
+                                                             batch_size)]
+                stage.add(items=len(results))
+            log.info("Found %s documents in %s.%s", len(results), db, collection)
+            return results
+        except PyMongoError as e:
+            log.error("MongoDB error in findItemsByQuery: %s", e)
+            raise
+
+    async def iterItemsByQuery(self, query: Dict[str, Any], db: str, collection: str,
+                               projection: Optional[Dict[str, Any]] = None, sort: Optional[List] = None,
+                               batch_size: int = 1000, limit: Optional[int] = None,
+                               batches: bool = False) -> AsyncIterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Lazily yields matching documents (or lists of up to batch_size documents when
+        batches=True) straight off the cursor; see DBOperations.iterItemsByQuery.
+
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        try:
+            batch = []
+            async for doc in self._cursor(query, db, collection, limit, projection, sort, batch_size):
+                if not batches:
+                    yield doc
+                    continue
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        except PyMongoError as e:
+            log.error("MongoDB error in iterItemsByQuery: %s", e)
+            raise
+
+    def _cursor(self, query, db, collection, limit=None, projection=None, sort=None, batch_size=None):
+        coll = self.client[db][collection]
+        cursor = coll.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if limit and limit > 0:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    async def _update_rollups(self, records, db, collection):
+        # Only trips that were actually written count towards the rollups
+        if self.rollups is None or not records:
+            return
+        if db == self.rollups.db and collection == self.rollups.tripsCollection:
+            await asyncio.to_thread(self.rollups.add, records)
+
+    async def insert(self, record: Union[Dict[str, Any], list[Dict[str, Any]]], db: str, collection: str,
+                     limit: Optional[int] = None) -> Dict[str, Union[bool, List[str], int]]:
+        """
+        Inserts one record (dict) or many (list, unordered insert_many); records that
+        already exist are reported instead of raised. Same result dict as
+        DBOperations.insert.
+
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        if not isinstance(record, list) and limit != None and limit > 1:
+            raise invalidRecordInputError('We request you to provide a list of records for multiple insertions. Multiple insertions of the same record are not permitted')
+
+        try:
+            coll = self.client[db][collection]
+            if isinstance(record, dict):
+                try:
+                    with metrics.stage('mongo_insert', items=1):
+                        result = await coll.insert_one(record)
+                    inserted_ids = [str(result.inserted_id)]
+                    inserted_records = [record]
+                except DuplicateKeyError as e:
+                    error_message = f"Record already exists :  {e}"
+                    log.error(error_message)
+                    inserted_ids = []
+                    inserted_records = []
+                attempted = 1
+            else:
+                records = record if limit == None else record[:limit]
+                attempted = len(records)
+                inserted_records = records
+                inserted_ids = []
+                if records:
+                    try:
+                        with metrics.stage('mongo_insert', items=len(records)):
+                            result = await coll.insert_many(records, ordered=False)
+                        inserted_ids = [str(_id) for _id in result.inserted_ids]
+                    except BulkWriteError as e:
+                        # With ordered=False every record except the failed indexes was written
+                        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+                        inserted_records = [r for i, r in enumerate(records) if i not in failed]
+                        inserted_ids = [str(r.get('_id')) for r in inserted_records]
+                        error_message = f"{len(failed)} record(s) already exist or failed :  {e}"
+                        log.error(error_message)
+
+            await self._update_rollups(inserted_records, db, collection)
+            message = f"Inserted {len(inserted_ids)} of {attempted} record(s) into {db}.{collection}"
+            log.info(message)
+            return {
+                'success': len(inserted_ids) == attempted,
+                'inserted_ids': inserted_ids,
+                'inserted_count': len(inserted_ids),
+                'inserted_records': inserted_records,
+                'message': message
+            }
+
+        except PyMongoError as e:
+            error_message = f"MongoDB error during insertion: {e}"
+            log.error(error_message)
+            raise
+
+    async def bulk_upsert(self, records: List[Dict[str, Any]], db: str, collection: str,
+                          keyFields: Union[str, List], batch_size: int = 1000,
+                          concurrency: int = 2) -> Dict[str, Any]:
+        """
+        Async DBOperations.bulk_upsert: one unordered bulk_write of $setOnInsert
+        upserts per chunk, with up to `concurrency` chunks in flight at once. A key
+        repeated across two concurrent chunks is matched by one and reported as a
+        duplicate (E11000) by the other.
+
+        Args:
+            records (List[Dict[str, Any]]): Records to upsert
+            db (str): Database name
+            collection (str): Collection name
+            keyFields (str | List): Fields of the unique index, or its create_index spec
+            batch_size (int): Number of records sent per bulk_write round trip
+            concurrency (int): Maximum number of bulk_write calls awaiting the server
+
+        Returns:
+            Same dict as DBOperations.bulk_upsert. 'elapsed' is wall time, so it
+            can be lower than the sum of the per-batch 'elapsed' values.
+
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        keyFields = index_key_fields(keyFields)
+        coll = self.client[db][collection]
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        async def write_batch(number, chunk):
+            batchStats = {'batch': number, 'size': len(chunk), 'inserted': 0, 'matched': 0,
+                          'duplicate': 0, 'failed': 0, 'errors': []}
+            requests, requestRecords = _upsert_requests(chunk, keyFields, batchStats)
+            upserted = []
+            async with slots:
+                batchStart = time.perf_counter()
+                if requests:
+                    try:
+                        with metrics.stage('mongo_insert', items=len(requests)):
+                            result = await coll.bulk_write(requests, ordered=False)
+                        upserted = _bulk_outcome(batchStats, result=result)
+                    except BulkWriteError as e:
+                        upserted = _bulk_outcome(batchStats, error=e)
+                    await self._update_rollups([requestRecords[i] for i in upserted], db, collection)
+                batchStats['elapsed'] = time.perf_counter() - batchStart
+            log.info("bulk_upsert batch %s into %s.%s: %s inserted, %s matched, %s duplicate, %s failed in %.3fs",
+                     batchStats['batch'], db, collection, batchStats['inserted'], batchStats['matched'],
+                     batchStats['duplicate'], batchStats['failed'], batchStats['elapsed'])
+            return batchStats, [requestRecords[i] for i in upserted]
+
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(
+                write_batch(number, records[offset:offset + batch_size])
+                for number, offset in enumerate(range(0, len(records), batch_size))))
+        except PyMongoError as e:
+            error_message = f"MongoDB error during bulk upsert: {e}"
+            log.error(error_message)
+            raise
+        elapsed = time.perf_counter() - start
+        batches = [batchStats for batchStats, _ in results]
+
+        totals = {f'{name}_count': sum(b[name] for b in batches)
+                  for name in ('inserted', 'matched', 'duplicate', 'failed')}
+        message = (f"Upserted {len(records)} record(s) into {db}.{collection} in {len(batches)} batch(es): "
+                   f"{totals['inserted_count']} inserted, {totals['matched_count']} matched, "
+                   f"{totals['duplicate_count']} duplicate, {totals['failed_count']} failed")
+        log.info(message)
+        return {
+            'success': totals['failed_count'] == 0,
+            **totals,
+            'upserted_records': [record for _, upserted in results for record in upserted],
+            'batches': batches,
+            'elapsed': elapsed,
+            'records_per_sec': len(records) / elapsed if elapsed > 0 else 0.0,
+            'message': message
+        }
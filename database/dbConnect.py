@@ -10,6 +10,10 @@ from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from urllib.parse import quote_plus
 from utils.utils import *
+from utils.metrics import get_logger
+
+
+log = get_logger('dbConnect')
 
 
 def connectDB(uri):
@@ -19,8 +23,8 @@ def connectDB(uri):
     # Send a ping to confirm a successful connection
     try:
         client.admin.command('ping')
-        print("Pinged your deployment. You successfully connected to MongoDB!")
+        log.info("Pinged your deployment. You successfully connected to MongoDB!")
     except Exception as e:
-        print(e)
+        log.error("MongoDB ping failed: %s", e)
     return client
     
\ No newline at end of file
@@ -8,21 +8,115 @@ if project_root not in sys.path:
     sys.path.append( project_root)
 
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from bson import Binary
 from pymongo.errors import PyMongoError, DuplicateKeyError, WriteError, BulkWriteError
-from typing import List, Dict, Any, Optional, Union
-import logging
+from typing import List, Dict, Any, Optional, Union, Iterator
 import copy
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
 from errors.invalidRecordNumError import *
+from database.dbUtils import index_key_fields
+from utils.textCodecs import registry
+from utils.tripDedup import trip_fingerprint, FINGERPRINT_FIELD
+from utils.tripFields import typed_fields, TYPED_VERSION, SOURCE_FIELDS
+from utils.metrics import get_logger, metrics
+from database.rollups import ROLLUP_SOURCE_FIELDS
+
+
+log = get_logger('dbOperations')
+
+
+# Reference to a trip's emailText once it was moved to the EmailArchive
+ARCHIVE_FIELD = 'emailArchive'
+# Set by every in-place update of a stored trip, so TripCache.sync() can pick the change up
+UPDATED_FIELD = 'updatedAt'
+# Projection for analytics reads: everything except the compressed raw email
+NO_EMAIL_TEXT = {'emailText': 0, ARCHIVE_FIELD: 0}
+# Trained emailText compression dictionaries, one document per dictionary id
+DICT_COLLECTION = 'compressionDicts'
+# Trip fields trip_fingerprint() reads
+FINGERPRINT_SOURCE = {'date': 1, 'pickUpTime': 1, 'dropTime': 1, 'pickupLocation': 1, 'dropOffLocation': 1,
+                      'total': 1}
+
+
+def _get_path(record, path):
+    # Resolve a dotted index path such as 'pickupLocation.postal'
+    value = record
+    for part in path.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def utc_now():
+    """Current UTC time as the naive, millisecond precision datetime Mongo stores and returns"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _stamped(fields, at=None):
+    """$set `fields` plus the updatedAt stamp (now, or `at`)"""
+    return {**fields, UPDATED_FIELD: at or utc_now()}
+
+
+def _upsert_requests(chunk, keyFields, batchStats):
+    """
+    One $setOnInsert upsert per distinct key in `chunk`, plus the record behind each
+    request. Repeated keys are collapsed client side (the server would only match
+    them anyway) and counted as duplicates in batchStats. A record missing a key
+    field is not sent, since a {field: None} filter would match any stored record
+    without it; it is counted as failed.
+    """
+    seen = set()
+    requests = []
+    requestRecords = []
+    for rec in chunk:
+        key = tuple(_get_path(rec, field) for field in keyFields)
+        missing = [field for field, value in zip(keyFields, key) if value is None]
+        if missing:
+            batchStats['failed'] += 1
+            batchStats['errors'].append(f"Record without a value for key field(s) {', '.join(missing)} not upserted")
+            continue
+        if key in seen:
+            batchStats['duplicate'] += 1
+            continue
+        seen.add(key)
+        requests.append(UpdateOne(dict(zip(keyFields, key)), {'$setOnInsert': rec}, upsert=True))
+        requestRecords.append(rec)
+    return requests, requestRecords
+
+
+def _bulk_outcome(batchStats, result=None, error=None):
+    """Fold a bulk_write result (or BulkWriteError) into batchStats; returns the upserted request indexes"""
+    if error is None:
+        batchStats['inserted'] = result.upserted_count
+        batchStats['matched'] = result.matched_count
+        return list(result.upserted_ids or {})
+    details = error.details
+    batchStats['inserted'] = details.get('nUpserted', 0)
+    batchStats['matched'] = details.get('nMatched', 0)
+    for err in details.get('writeErrors', []):
+        if err.get('code') == 11000:
+            batchStats['duplicate'] += 1
+        else:
+            batchStats['failed'] += 1
+            batchStats['errors'].append(err.get('errmsg'))
+    return [u['index'] for u in details.get('upserted', [])]
+
 
 class DBOperations(): 
-    def __init__(self, client):
+    def __init__(self, client, rollups=None, archive=None):
         self.client = client   
+        # Optional TripRollups kept up to date with every trip this instance inserts
+        self.rollups = rollups
+        # Optional EmailArchive holding the emailText of trips moved out by archiveEmailText
+        self.archive = archive
                                                                                                                                                                                                                                                                                                  
 
     def findItemsByQuery(self, query: Dict[str, Any], db: str, collection: str,  
-                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+                    limit: Optional[int] = None, projection: Optional[Dict[str, Any]] = None,
+                    sort: Optional[List] = None, batch_size: Optional[int] = None,
+                    decompress: bool = False) -> List[Dict[str, Any]]:
         """
         Finds items in a MongoDB collection based on a query
         
@@ -30,8 +124,11 @@ class DBOperations():
             query (Dict[str, Any]): MongoDB query dictionary
             db (str): Database name
             collection (str): Collection name
-            client (MongoClient): Valid MongoDB client instance
             limit (Optional[int]): Maximum number of records to return
+            projection (Optional[Dict[str, Any]]): Server-side projection, e.g. NO_EMAIL_TEXT
+            sort (Optional[List]): Sort spec, e.g. [('date', 1)]
+            batch_size (Optional[int]): Documents per cursor batch (getMore round trip)
+            decompress (bool): Return emailText as decoded text instead of the compressed bytes
             
         Returns:
             List[Dict[str, Any]]: List of matching documents
@@ -41,33 +138,260 @@ class DBOperations():
             Exception: For other general errors
     """
         try:
-            # Get the database and collection
-            print(db)
-            print(self.client)
-            database = self.client[db]
-            print(database)
-            coll = database[collection]
+            with metrics.stage('mongo_find') as stage:
+                cursor = self._cursor(query, db, collection, limit, projection, sort, batch_size)
+
+                # Convert cursor to list and return
+                results = [self._decompressed(doc, db) for doc in cursor] if decompress else list(cursor)
+                stage.add(items=len(results))
             
-            # Execute the find operation
-            cursor = coll.find(query)
+            log.info("Found %s documents in %s.%s", len(results), db, collection)
+            return results
             
-            # Apply limit if specified
-            if limit and limit > 0:
-                cursor = cursor.limit(limit)
+        except PyMongoError as e:
+            log.error("MongoDB error in findItemsByQuery: %s", e)
+            raise
+        except Exception as e:
+            log.error("General error in findItemsByQuery: %s", e)
+            raise
+
+    def iterItemsByQuery(self, query: Dict[str, Any], db: str, collection: str,
+                         projection: Optional[Dict[str, Any]] = None, sort: Optional[List] = None,
+                         batch_size: int = 1000, limit: Optional[int] = None,
+                         batches: bool = False, decompress: bool = False
+                         ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Lazily yields matching documents (or lists of up to batch_size documents when
+        batches=True) straight off the cursor, so memory stays constant in the size of
+        the result set.
+        
+        Args:
+            query (Dict[str, Any]): MongoDB query dictionary
+            db (str): Database name
+            collection (str): Collection name
+            projection (Optional[Dict[str, Any]]): Server-side projection, e.g. NO_EMAIL_TEXT
+            sort (Optional[List]): Sort spec, e.g. [('date', 1)]
+            batch_size (int): Documents per cursor batch, and per yielded list when batches=True
+            limit (Optional[int]): Maximum number of records to return
+            batches (bool): Yield lists of documents instead of single documents
+            decompress (bool): Yield emailText as decoded text instead of the compressed bytes
             
-            # Convert cursor to list and return
-            results = list(cursor)
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        try:
+            # Only the time spent waiting on the cursor counts, not the caller's work between documents
+            cursor = metrics.timed_iter('mongo_find', self._cursor(query, db, collection, limit, projection, sort,
+                                                                   batch_size))
+            if decompress:
+                cursor = (self._decompressed(doc, db) for doc in cursor)
+            if not batches:
+                yield from cursor
+                return
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        except PyMongoError as e:
+            log.error("MongoDB error in iterItemsByQuery: %s", e)
+            raise
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], db: str, collection: str,
+                  allowDiskUse: bool = False) -> List[Dict[str, Any]]:
+        """
+        Runs an aggregation pipeline on the server and returns its (small) result
+        
+        Args:
+            pipeline (List[Dict[str, Any]]): Aggregation stages, e.g. [{'$match': ...}, {'$group': ...}]
+            db (str): Database name
+            collection (str): Collection name
+            allowDiskUse (bool): Let large $group/$sort stages spill to disk
             
-            logging.info(f"Found {len(results)} documents in {db}.{collection}")
-            return results
+        Returns:
+            List[Dict[str, Any]]: The pipeline's output documents
             
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        try:
+            with metrics.stage('mongo_aggregate') as stage:
+                options = {'allowDiskUse': True} if allowDiskUse else {}
+                results = list(self.client[db][collection].aggregate(pipeline, **options))
+                stage.add(items=len(results))
+            log.info("Aggregated %s documents from %s.%s", len(results), db, collection)
+            return results
         except PyMongoError as e:
-            logging.error(f"MongoDB error in findItemsByQuery: {e}")
+            log.error("MongoDB error in aggregate: %s", e)
             raise
-        except Exception as e:
-            logging.error(f"General error in findItemsByQuery: {e}")
+
+    def iterPagesByKey(self, query: Dict[str, Any], db: str, collection: str, key: str = '_id',
+                       page_size: int = 1000, projection: Optional[Dict[str, Any]] = None,
+                       start_after: Any = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Range-based (keyset) pagination on an indexed, unique key. Every page is its own
+        find({key: {'$gt': last key}}) sorted on the key, so each page is an index range
+        scan no matter how deep it is, and an interrupted scan can resume by passing the
+        key of the last processed document as start_after.
+        
+        Args:
+            query (Dict[str, Any]): MongoDB query dictionary
+            db (str): Database name
+            collection (str): Collection name
+            key (str): Unique indexed field to page on (default: '_id')
+            page_size (int): Documents per page
+            projection (Optional[Dict[str, Any]]): Server-side projection; `key` is always returned
+            start_after (Any): Only return documents whose key is greater than this value
+            
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        if projection and any(projection.values()):
+            projection = {**projection, key: 1}
+        elif projection and key in projection:
+            projection = {k: v for k, v in projection.items() if k != key}
+        last = start_after
+        try:
+            while True:
+                pageQuery = query if last is None else {'$and': [query, {key: {'$gt': last}}]}
+                with metrics.stage('mongo_find') as stage:
+                    page = list(self._cursor(pageQuery, db, collection, page_size, projection, [(key, 1)], page_size))
+                    stage.add(items=len(page))
+                if not page:
+                    return
+                yield page
+                if len(page) < page_size:
+                    return
+                last = _get_path(page[-1], key)
+        except PyMongoError as e:
+            log.error("MongoDB error in iterPagesByKey: %s", e)
             raise
 
+    def saveDictionary(self, codec, db: str, collection: str = DICT_COLLECTION) -> None:
+        """
+        Stores a trained textCodecs dictionary codec so records compressed with it
+        can be decompressed later, by this or any other process.
+        
+        Args:
+            codec (DictCodec): Codec returned by textCodecs.registry.train()
+            db (str): Database name
+            collection (str): Collection holding the dictionaries
+            
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        self.client[db][collection].update_one(
+            {'_id': codec.dict_id},
+            {'$setOnInsert': {'codec': codec.name, 'dictionary': Binary(codec.dictionary), 'level': codec.level,
+                              'createdAt': datetime.now()}},
+            upsert=True)
+        log.info("Saved %s dictionary %s to %s.%s", codec.name, codec.dict_id, db, collection)
+
+    def loadDictionary(self, db: str, dictId: Optional[str] = None, codecName: Optional[str] = None,
+                       collection: str = DICT_COLLECTION):
+        """
+        Registers a stored dictionary codec with textCodecs.registry: the one with
+        id dictId, or the newest one for codecName.
+        
+        Args:
+            db (str): Database name
+            dictId (Optional[str]): Dictionary id, as stored in a record's compressorDict
+            codecName (Optional[str]): Codec name, used when dictId is not given
+            collection (str): Collection holding the dictionaries
+            
+        Returns:
+            The registered codec, or None when no such dictionary is stored
+            
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        coll = self.client[db][collection]
+        if dictId is not None:
+            doc = coll.find_one({'_id': dictId})
+        else:
+            doc = coll.find_one({'codec': codecName}, sort=[('createdAt', -1)])
+        if doc is None:
+            return None
+        if registry.has(doc['codec'], doc['_id']):
+            return registry.get(doc['codec'], doc['_id'])
+        return registry.add_dictionary(doc['codec'], bytes(doc['dictionary']), doc.get('level'))
+
+    def rehydrate(self, docs: List[Dict[str, Any]], db: str, decompress: bool = False) -> List[Dict[str, Any]]:
+        """
+        Puts the archived emailText back into trips read from the hot collection, in
+        place. Trips that still hold their emailText are left as they are.
+        
+        Args:
+            docs (List[Dict[str, Any]]): Trips read with their emailArchive reference
+            db (str): Database name, for compression dictionaries when decompressing
+            decompress (bool): Also decode emailText to text, as findItemsByQuery(decompress=True)
+            
+        Returns:
+            List[Dict[str, Any]]: The same documents
+            
+        Raises:
+            ValueError: If a trip is archived but no EmailArchive is configured, or its record is corrupt
+            KeyError: If the archive does not hold the trip
+        """
+        archived = {str(doc['_id']): doc[ARCHIVE_FIELD] for doc in docs
+                    if 'emailText' not in doc and doc.get(ARCHIVE_FIELD)}
+        if archived:
+            if self.archive is None:
+                raise ValueError(f"{len(archived)} trips have archived emailText but no EmailArchive is configured")
+            blobs = self.archive.read_many(archived)
+            for doc in docs:
+                key = str(doc['_id'])
+                if key in blobs:
+                    doc['emailText'] = blobs[key]
+        if decompress:
+            docs = [self._decompressed(doc, db) for doc in docs]
+        return docs
+
+    def _decompressed(self, doc, db):
+        # Decode emailText in place with the codec (and dictionary) it was written with,
+        # reading it from the EmailArchive first if it was moved there
+        if 'emailText' not in doc and doc.get(ARCHIVE_FIELD):
+            self.rehydrate([doc], db)
+        blob = doc.get('emailText')
+        name = doc.get('compressorName')
+        if not isinstance(blob, (bytes, bytearray)) or not name:
+            return doc
+        dictId = doc.get('compressorDict')
+        if dictId and not registry.has(name, dictId) and self.loadDictionary(db, dictId) is None:
+            raise ValueError(f"Compression dictionary {dictId} is missing from {db}.{DICT_COLLECTION}")
+        doc['emailText'] = registry.decompress(bytes(blob), name, dictId).decode('utf-8', errors='replace')
+        return doc
+
+    def _tracks_rollups(self, db, collection):
+        return self.rollups is not None and db == self.rollups.db and collection == self.rollups.tripsCollection
+
+    def _update_rollups(self, records, db, collection, removed=False):
+        # Only trips that were actually written (or deleted) count towards the rollups
+        if not records or not self._tracks_rollups(db, collection):
+            return
+        if removed:
+            self.rollups.remove(records)
+        else:
+            self.rollups.add(records)
+
+    def _cursor(self, query, db, collection, limit=None, projection=None, sort=None, batch_size=None):
+        coll = self.client[db][collection]
+        if projection and projection.get('emailText'):
+            # Archived trips carry a reference instead
+            projection = {**projection, ARCHIVE_FIELD: 1}
+        cursor = coll.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        # Apply limit if specified
+        if limit and limit > 0:
+            cursor = cursor.limit(limit)
+        return cursor
+
     
         
     def insert(self, record: Union[Dict[str, Any], list[Dict[str, Any]]], db: str, collection: str, 
@@ -87,6 +411,7 @@ class DBOperations():
                 - 'success': bool - whether operation was successful
                 - 'inserted_ids': List[str] - list of inserted document IDs
                 - 'inserted_count': int - number of documents inserted
+                - 'inserted_records': List[Dict] - the records that were written
                 - 'message': str - descriptive message about the operation
                 
         Raises:
@@ -97,39 +422,409 @@ class DBOperations():
             raise invalidRecordInputError('We request you to provide a list of records for multiple insertions. Multiple insertions of the same record are not permitted')
             
         try:
-            logging.info(f"Starting insert operation for {limit} record(s) in {db}.{collection}")
+            log.info("Starting insert operation for %s record(s) in %s.%s", limit, db, collection)
             database = self.client[db]
             
             collection = database[collection]
             if isinstance(record, dict):
                 try:
-                    collection.insert_one(record)
+                    with metrics.stage('mongo_insert', items=1):
+                        result = collection.insert_one(record)
+                    inserted_ids = [str(result.inserted_id)]
+                    inserted_records = [record]
                 except DuplicateKeyError as e:
                     error_message = f"Record already exists :  {e}"
-                    print(error_message)
-                    logging.error(error_message)
+                    log.error(error_message)
+                    inserted_ids = []
+                    inserted_records = []
+                attempted = 1
             else:
-                try:
-                    if limit == None:
-                         collection.insert_many(record, ordered = False)
-                    else:
-                        collection.insert_many(record[:limit], ordered = False)
-                except BulkWriteError as e:
-                    error_message = f"OnrRecord already exists :  {e}"
-                    print(error_message)
-                    logging.error(error_message)
+                records = record if limit == None else record[:limit]
+                attempted = len(records)
+                inserted_records = records
+                if not records:
+                    inserted_ids = []
+                else:
+                    try:
+                        with metrics.stage('mongo_insert', items=len(records)):
+                            result = collection.insert_many(records, ordered = False)
+                        inserted_ids = [str(_id) for _id in result.inserted_ids]
+                    except BulkWriteError as e:
+                        # With ordered=False every record except the failed indexes was written
+                        failed = {err['index'] for err in e.details.get('writeErrors', [])}
+                        inserted_records = [r for i, r in enumerate(records) if i not in failed]
+                        inserted_ids = [str(r.get('_id')) for r in inserted_records]
+                        error_message = f"{len(failed)} record(s) already exist or failed :  {e}"
+                        log.error(error_message)
+
+            self._update_rollups(inserted_records, db, collection.name)
+            message = f"Inserted {len(inserted_ids)} of {attempted} record(s) into {db}.{collection.name}"
+            log.info(message)
+            return {
+                'success': len(inserted_ids) == attempted,
+                'inserted_ids': inserted_ids,
+                'inserted_count': len(inserted_ids),
+                'inserted_records': inserted_records,
+                'message': message
+            }
             
         except PyMongoError as e:
             error_message = f"MongoDB error during insertion: {e}"
-            print(error_message)
-            logging.error(error_message)
+            log.error(error_message)
             raise
             
         except Exception as e:
             error_message = f"Unexpected error during insertion: {e}"
-            print(error_message)
-            logging.error(error_message)
+            log.error(error_message)
+            raise
+
+    def bulk_upsert(self, records: List[Dict[str, Any]], db: str, collection: str, keyFields: Union[str, List],
+                    batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Upserts records in chunks with one bulk_write per chunk. Each record becomes an
+        UpdateOne(filter on keyFields, {'$setOnInsert': record}, upsert=True), so records
+        that already exist are matched and left untouched instead of raising one
+        DuplicateKeyError per record.
+        
+        Args:
+            records (List[Dict[str, Any]]): Records to upsert
+            db (str): Database name
+            collection (str): Collection name
+            keyFields (str | List): Fields of the unique index, either field names or
+                the index spec passed to create_index (e.g. [('eid', 1)])
+            batch_size (int): Number of records sent per bulk_write round trip
+            
+        Returns:
+            Dict containing:
+                - 'success': bool - True when no record failed
+                - 'inserted_count': int - records that did not exist yet
+                - 'matched_count': int - records already present in the collection
+                - 'duplicate_count': int - records repeated within a batch or lost to a concurrent insert
+                - 'failed_count': int - records rejected with any other write error
+                - 'upserted_records': List[Dict] - the records that were inserted
+                - 'batches': List[Dict] - the same counts plus 'size', 'elapsed' and 'errors' per batch
+                - 'elapsed': float - seconds spent in bulk_write calls
+                - 'records_per_sec': float - overall throughput
+                - 'message': str - descriptive message about the operation
+                
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        keyFields = index_key_fields(keyFields)
+        coll = self.client[db][collection]
+        batches = []
+        totals = {'inserted_count': 0, 'matched_count': 0, 'duplicate_count': 0, 'failed_count': 0}
+        upsertedRecords = []
+
+        try:
+            for start in range(0, len(records), batch_size):
+                chunk = records[start:start + batch_size]
+                batchStats = {'batch': len(batches), 'size': len(chunk), 'inserted': 0, 'matched': 0,
+                              'duplicate': 0, 'failed': 0, 'errors': []}
+
+                requests, requestRecords = _upsert_requests(chunk, keyFields, batchStats)
+
+                batchStart = time.perf_counter()
+                if requests:
+                    try:
+                        with metrics.stage('mongo_insert', items=len(requests)):
+                            result = coll.bulk_write(requests, ordered=False)
+                        upserted = _bulk_outcome(batchStats, result=result)
+                    except BulkWriteError as e:
+                        upserted = _bulk_outcome(batchStats, error=e)
+                    upsertedRecords.extend(requestRecords[i] for i in upserted)
+                    self._update_rollups([requestRecords[i] for i in upserted], db, collection)
+                batchStats['elapsed'] = time.perf_counter() - batchStart
+
+                for name in ('inserted', 'matched', 'duplicate', 'failed'):
+                    totals[f'{name}_count'] += batchStats[name]
+                batches.append(batchStats)
+                log.info("bulk_upsert batch %s into %s.%s: %s inserted, %s matched, %s duplicate, %s failed in %.3fs",
+                         batchStats['batch'], db, collection, batchStats['inserted'], batchStats['matched'],
+                         batchStats['duplicate'], batchStats['failed'], batchStats['elapsed'])
+
+        except PyMongoError as e:
+            error_message = f"MongoDB error during bulk upsert: {e}"
+            log.error(error_message)
             raise
+
+        elapsed = sum(b['elapsed'] for b in batches)
+        message = (f"Upserted {len(records)} record(s) into {db}.{collection} in {len(batches)} batch(es): "
+                   f"{totals['inserted_count']} inserted, {totals['matched_count']} matched, "
+                   f"{totals['duplicate_count']} duplicate, {totals['failed_count']} failed")
+        log.info(message)
+        return {
+            'success': totals['failed_count'] == 0,
+            **totals,
+            'upserted_records': upsertedRecords,
+            'batches': batches,
+            'elapsed': elapsed,
+            'records_per_sec': len(records) / elapsed if elapsed > 0 else 0.0,
+            'message': message
+        }
+
+    def backfillFingerprints(self, db: str, collection: str, batch_size: int = 1000,
+                             start_after: Any = None) -> Dict[str, Any]:
+        """
+        Sets the content fingerprint on trips stored before TripParser computed one, a
+        page of trips per bulk_write. A trip whose fingerprint already belongs to another
+        trip is rejected by the unique fingerprint index and reported instead, so stored
+        duplicates can be reviewed or deleted.
+        
+        Args:
+            db (str): Database name
+            collection (str): Collection name
+            batch_size (int): Trips read and updated per round trip
+            start_after (Any): Resume after this _id (the 'last_id' of an interrupted run)
+            
+        Returns:
+            Dict containing:
+                - 'updated': int - trips that got a fingerprint
+                - 'skipped': int - trips without enough content for a fingerprint
+                - 'duplicate_ids': List - _ids of trips whose fingerprint belongs to another trip
+                - 'failed': int - updates rejected with any other write error
+                - 'last_id': Any - _id of the last trip processed
+                
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        coll = self.client[db][collection]
+        stats = {'updated': 0, 'skipped': 0, 'duplicate_ids': [], 'failed': 0, 'last_id': start_after}
+        query = {FINGERPRINT_FIELD: {'$exists': False}}
+        try:
+            for page in self.iterPagesByKey(query, db, collection, page_size=batch_size,
+                                            projection=FINGERPRINT_SOURCE, start_after=start_after):
+                requests = []
+                ids = []
+                for doc in page:
+                    fingerprint = trip_fingerprint(doc)
+                    if fingerprint is None:
+                        stats['skipped'] += 1
+                        continue
+                    requests.append(UpdateOne({'_id': doc['_id']},
+                                              {'$set': _stamped({FINGERPRINT_FIELD: fingerprint})}))
+                    ids.append(doc['_id'])
+                if requests:
+                    try:
+                        result = coll.bulk_write(requests, ordered=False)
+                        stats['updated'] += result.modified_count
+                    except BulkWriteError as e:
+                        stats['updated'] += e.details.get('nModified', 0)
+                        for err in e.details.get('writeErrors', []):
+                            if err.get('code') == 11000:
+                                stats['duplicate_ids'].append(ids[err['index']])
+                            else:
+                                stats['failed'] += 1
+                                log.error("Fingerprint update failed: %s", err.get('errmsg'))
+                stats['last_id'] = page[-1]['_id']
+                log.info("backfillFingerprints %s.%s: %s updated, %s duplicate, %s skipped",
+                         db, collection, stats['updated'], len(stats['duplicate_ids']), stats['skipped'])
+        except PyMongoError as e:
+            log.error("MongoDB error during fingerprint backfill: %s", e)
+            raise
+        return stats
+
+    def migrateTypedFields(self, db: str, collection: str, batch_size: int = 1000, start_after: Any = None,
+                           max_pages: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Adds the typed fields of typed_fields() (tripStart/tripEnd datetimes, integer
+        cents, distanceKm, durationMin) to trips stored with display strings only, one
+        bulk_write of $set updates per page. Only trips whose typedVersion is not the
+        current one are read, so an interrupted migration simply picks up where it
+        stopped when run again; start_after skips straight past the 'last_id' it
+        reported.
+        
+        Args:
+            db (str): Database name
+            collection (str): Collection name
+            batch_size (int): Trips read and updated per round trip
+            start_after (Any): Resume after this _id
+            max_pages (Optional[int]): Stop after this many pages, e.g. to spread the
+                migration over several runs
+            
+        Returns:
+            Dict containing:
+                - 'migrated': int - trips updated
+                - 'failed': int - updates rejected by the server
+                - 'pages': int - pages processed
+                - 'last_id': Any - _id of the last trip processed
+                - 'done': bool - True when the scan reached the end of the collection
+                
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        coll = self.client[db][collection]
+        stats = {'migrated': 0, 'failed': 0, 'pages': 0, 'last_id': start_after, 'done': False}
+        query = {'typedVersion': {'$ne': TYPED_VERSION}}
+        projection = {field: 1 for field in SOURCE_FIELDS}
+        try:
+            pages = self.iterPagesByKey(query, db, collection, page_size=batch_size, projection=projection,
+                                        start_after=start_after)
+            for page in pages:
+                requests = [UpdateOne({'_id': doc['_id']}, {'$set': _stamped(typed_fields(doc))}) for doc in page]
+                try:
+                    with metrics.stage('mongo_insert', items=len(requests)):
+                        result = coll.bulk_write(requests, ordered=False)
+                    stats['migrated'] += result.modified_count
+                except BulkWriteError as e:
+                    stats['migrated'] += e.details.get('nModified', 0)
+                    stats['failed'] += len(e.details.get('writeErrors', []))
+                    log.error("migrateTypedFields: %s update(s) failed: %s", len(e.details.get('writeErrors', [])), e)
+                stats['pages'] += 1
+                stats['last_id'] = page[-1]['_id']
+                log.info("migrateTypedFields %s.%s: %s migrated, last _id %s",
+                         db, collection, stats['migrated'], stats['last_id'])
+                if max_pages is not None and stats['pages'] >= max_pages:
+                    pages.close()
+                    break
+            else:
+                stats['done'] = True
+            # A new TYPED_VERSION means the parsers changed, and the rollups were
+            # $inc-ed with the old ones: recompute them with the current parsers
+            if stats['migrated'] and self._tracks_rollups(db, collection):
+                self.rollups.rebuild()
+        except PyMongoError as e:
+            log.error("MongoDB error during typed field migration: %s", e)
+            raise
+        return stats
+
+    def archiveEmailText(self, db: str, collection: str, older_than: Union[timedelta, datetime],
+                         field: str = 'tripDate', batch_size: int = 1000, start_after: Any = None,
+                         max_pages: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Moves the compressed emailText of trips older than `older_than` out of the
+        collection into self.archive, one page per archive append and bulk_write. Each
+        trip keeps compressorName/compressorDict and gets an emailArchive reference
+        in place of emailText, which findItemsByQuery(decompress=True) and rehydrate()
+        follow back. Only trips that still hold emailText are read, so an interrupted
+        run picks up where it stopped; blobs archived just before an interruption are
+        found in the archive's index and not appended twice.
+        
+        Args:
+            db (str): Database name
+            collection (str): Collection name
+            older_than (timedelta | datetime): Age (from now) or cutoff; trips whose
+                `field` is before it are archived
+            field (str): Datetime field the age is measured on (trips without it stay hot)
+            batch_size (int): Trips read and updated per round trip
+            start_after (Any): Resume after this _id
+            max_pages (Optional[int]): Stop after this many pages
+            
+        Returns:
+            Dict containing:
+                - 'archived': int - trips whose emailText was moved
+                - 'bytes': int - emailText bytes moved out of the collection by this run
+                - 'skipped': int - trips whose emailText is not a stored blob
+                - 'failed': int - updates rejected by the server
+                - 'pages': int - pages processed
+                - 'last_id': Any - _id of the last trip processed
+                - 'done': bool - True when the scan reached the end of the collection
+                
+        Raises:
+            ValueError: If no EmailArchive is configured
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        if self.archive is None:
+            raise ValueError("archiveEmailText needs DBOperations(..., archive=EmailArchive(...))")
+        cutoff = datetime.now() - older_than if isinstance(older_than, timedelta) else older_than
+        coll = self.client[db][collection]
+        stats = {'archived': 0, 'bytes': 0, 'skipped': 0, 'failed': 0, 'pages': 0, 'last_id': start_after,
+                 'done': False}
+        query = {field: {'$lt': cutoff}, 'emailText': {'$exists': True}}
+        try:
+            pages = self.iterPagesByKey(query, db, collection, page_size=batch_size, projection={'emailText': 1},
+                                        start_after=start_after)
+            for page in pages:
+                blobs = [doc for doc in page if isinstance(doc['emailText'], (bytes, bytearray))]
+                stats['skipped'] += len(page) - len(blobs)
+                refs = self.archive.append_many((str(doc['_id']), doc['emailText']) for doc in blobs)
+                # Only trips that still hold emailText, in case another run got there first.
+                # One stamp per page tells this page's updates apart from another run's
+                stamp = utc_now()
+                requests = [UpdateOne({'_id': doc['_id'], 'emailText': {'$exists': True}},
+                                      {'$set': _stamped({ARCHIVE_FIELD: refs[str(doc['_id'])]}, stamp),
+                                       '$unset': {'emailText': ''}})
+                            for doc in blobs]
+                if requests:
+                    try:
+                        with metrics.stage('mongo_insert', items=len(requests)):
+                            result = coll.bulk_write(requests, ordered=False)
+                        modified = result.modified_count
+                    except BulkWriteError as e:
+                        modified = e.details.get('nModified', 0)
+                        stats['failed'] += len(e.details.get('writeErrors', []))
+                        log.error("archiveEmailText: %s update(s) failed: %s", len(e.details.get('writeErrors', [])), e)
+                    stats['archived'] += modified
+                    if modified < len(blobs):
+                        # Count the bytes of the trips this page actually moved out
+                        moved = {doc['_id'] for doc in coll.find(
+                            {'_id': {'$in': [doc['_id'] for doc in blobs]}, UPDATED_FIELD: stamp,
+                             'emailText': {'$exists': False}}, {'_id': 1})}
+                        blobs = [doc for doc in blobs if doc['_id'] in moved]
+                    stats['bytes'] += sum(len(doc['emailText']) for doc in blobs)
+                stats['pages'] += 1
+                stats['last_id'] = page[-1]['_id']
+                log.info("archiveEmailText %s.%s: %s archived, last _id %s",
+                         db, collection, stats['archived'], stats['last_id'])
+                if max_pages is not None and stats['pages'] >= max_pages:
+                    pages.close()
+                    break
+            else:
+                stats['done'] = True
+        except PyMongoError as e:
+            log.error("MongoDB error while archiving emailText: %s", e)
+            raise
+        return stats
+
+    def restoreEmailText(self, query: Dict[str, Any], db: str, collection: str, batch_size: int = 1000,
+                         start_after: Any = None) -> Dict[str, Any]:
+        """
+        Moves archived emailText of the trips matching `query` back into the
+        collection and drops their emailArchive reference. The archive keeps its
+        copy (segments are append-only), so a trip archived again later reuses it.
+        
+        Args:
+            query (Dict[str, Any]): Trips to restore, e.g. {'driver': 'Sam'}
+            db (str): Database name
+            collection (str): Collection name
+            batch_size (int): Trips read and updated per round trip
+            start_after (Any): Resume after this _id
+            
+        Returns:
+            Dict containing:
+                - 'restored': int - trips that got their emailText back
+                - 'failed': int - updates rejected by the server
+                - 'last_id': Any - _id of the last trip processed
+                
+        Raises:
+            ValueError: If no EmailArchive is configured
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        if self.archive is None:
+            raise ValueError("restoreEmailText needs DBOperations(..., archive=EmailArchive(...))")
+        coll = self.client[db][collection]
+        stats = {'restored': 0, 'failed': 0, 'last_id': start_after}
+        archivedQuery = {'$and': [query, {ARCHIVE_FIELD: {'$exists': True}, 'emailText': {'$exists': False}}]}
+        try:
+            for page in self.iterPagesByKey(archivedQuery, db, collection, page_size=batch_size,
+                                            projection={ARCHIVE_FIELD: 1}, start_after=start_after):
+                blobs = self.archive.read_many({str(doc['_id']): doc[ARCHIVE_FIELD] for doc in page})
+                requests = [UpdateOne({'_id': doc['_id'], ARCHIVE_FIELD: {'$exists': True}},
+                                      {'$set': _stamped({'emailText': Binary(blobs[str(doc['_id'])])}),
+                                       '$unset': {ARCHIVE_FIELD: ''}}) for doc in page]
+                try:
+                    result = coll.bulk_write(requests, ordered=False)
+                    stats['restored'] += result.modified_count
+                except BulkWriteError as e:
+                    stats['restored'] += e.details.get('nModified', 0)
+                    stats['failed'] += len(e.details.get('writeErrors', []))
+                    log.error("restoreEmailText: %s update(s) failed: %s", len(e.details.get('writeErrors', [])), e)
+                stats['last_id'] = page[-1]['_id']
+        except PyMongoError as e:
+            log.error("MongoDB error while restoring emailText: %s", e)
+            raise
+        return stats
+
     def delete(self, query: Dict[str, Any], db: str, collection: str, 
           delete_all: bool = False) -> Dict[str, Union[bool, int, List[str], str]]:
             """
@@ -154,27 +849,30 @@ class DBOperations():
                 Exception: For other general errors
             """
             try:
-                logging.info(f"Starting delete operation in {db}.{collection}")
-                logging.debug(f"Delete query: {query}")
+                log.info("Starting delete operation in %s.%s", db, collection)
+                log.debug("Delete query: %s", query)
                 
                 # Step 1: Validate that records exist using findItemsByQuery
-                logging.info("Checking if records exist before deletion")
+                log.info("Checking if records exist before deletion")
                 
                 # Find records that match the query
+                # Deleted trips are taken back out of the rollups, which need their source fields
+                projection = {'_id': 1}
+                if self._tracks_rollups(db, collection):
+                    projection.update({field: 1 for field in ROLLUP_SOURCE_FIELDS})
                 if delete_all:
                     # Find all matching records
-                    existing_records = self.findItemsByQuery(query, db, collection)
+                    existing_records = self.findItemsByQuery(query, db, collection, projection=projection)
                     operation_type = "delete all matching"
                 else:
                     # Find only the first matching record
-                    existing_records = self.findItemsByQuery(query, db, collection, limit=1)
+                    existing_records = self.findItemsByQuery(query, db, collection, limit=1, projection=projection)
                     operation_type = "delete first matching"
                 
                 # Step 2: If no records found, print message and return
                 if not existing_records:
                     message = f"No records found matching the query in {db}.{collection}. Nothing to delete."
-                    print(message)
-                    logging.info(message)
+                    log.info(message)
                     
                     return {
                         'success': False,
@@ -189,34 +887,35 @@ class DBOperations():
                 deleted_ids = [str(record.get('_id', 'unknown')) for record in existing_records]
                 
                 message = f"Found {found_count} record(s) to delete in {db}.{collection}"
-                print(message)
-                logging.info(message)
+                log.info(message)
                 
                 # Log the records that will be deleted (for audit trail)
                 for i, record in enumerate(existing_records):
-                    logging.debug(f"Record {i+1} to delete: ID={record.get('_id')}")
+                    log.debug("Record %s to delete: ID=%s", i+1, record.get('_id'))
                 
                 # Step 4: Perform the deletion
                 database = self.client[db]
                 coll = database[collection]
                 
-                if delete_all:
-                    # Delete all matching records
-                    delete_result = coll.delete_many(query)
-                    deleted_count = delete_result.deleted_count
-                else:
-                    # Delete only the first matching record
-                    delete_result = coll.delete_one(query)
-                    deleted_count = delete_result.deleted_count
+                # Delete exactly the records found above, so the audit trail and the
+                # rollups match what was removed
+                found_ids = [record['_id'] for record in existing_records]
+                delete_result = coll.delete_many({'$and': [query, {'_id': {'$in': found_ids}}]})
+                deleted_count = delete_result.deleted_count
+                if deleted_count < found_count:
+                    # Some were removed or changed concurrently; keep only the ones this call deleted
+                    remaining = {doc['_id'] for doc in coll.find({'_id': {'$in': found_ids}}, {'_id': 1})}
+                    existing_records = [record for record in existing_records if record['_id'] not in remaining]
+                    deleted_ids = [str(record['_id']) for record in existing_records]
+                self._update_rollups(existing_records[:deleted_count], db, collection, removed=True)
                 
                 # Step 5: Verify deletion and return result
                 if deleted_count > 0:
                     success_message = f"Successfully deleted {deleted_count} record(s) from {db}.{collection}"
-                    print(success_message)
-                    logging.info(success_message)
+                    log.info(success_message)
                     
                     # Log deleted IDs for audit trail
-                    logging.info(f"Deleted record IDs: {deleted_ids[:deleted_count]}")
+                    log.info("Deleted record IDs: %s", deleted_ids[:deleted_count])
                     
                     return {
                         'success': True,
@@ -228,8 +927,7 @@ class DBOperations():
                 else:
                     # This shouldn't happen if we found records, but handle it
                     error_message = f"Delete operation failed - no records were actually deleted from {db}.{collection}"
-                    print(error_message)
-                    logging.warning(error_message)
+                    log.warning(error_message)
                     
                     return {
                         'success': False,
@@ -241,19 +939,16 @@ class DBOperations():
                 
             except WriteError as e:
                 error_message = f"Write error during deletion: {e}"
-                print(error_message)
-                logging.error(error_message)
+                log.error(error_message)
                 raise
                 
             except PyMongoError as e:
                 error_message = f"MongoDB error during deletion: {e}"
-                print(error_message)
-                logging.error(error_message)
+                log.error(error_message)
                 raise
                 
             except Exception as e:
                 error_message = f"Unexpected error during deletion: {e}"
-                print(error_message)
-                logging.error(error_message)
+                log.error(error_message)
                 raise
         
@@ -1,5 +1,12 @@
 
 
-def create_index(client, db, collection, indexQuery):
-    collection = client[db][collection]
-    collection.create_index(indexQuery, unique = True)
+def index_key_fields(indexQuery):
+    """
+    Field names of an index spec as used by create_index: 'eid', ['date', 'eid'],
+    [('eid', 1), ('date', -1)] or {'eid': 1} all resolve to a list of field names.
+    """
+    if isinstance(indexQuery, str):
+        return [indexQuery]
+    if isinstance(indexQuery, dict):
+        return list(indexQuery.keys())
+    return [field[0] if isinstance(field, (list, tuple)) else field for field in indexQuery]
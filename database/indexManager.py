@@ -0,0 +1,293 @@
+import sys
+import os
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append( project_root)
+
+
+import time
+from datetime import timedelta
+from typing import List, Dict, Any, Optional, Callable
+from pymongo.errors import PyMongoError, OperationFailure
+from utils.tripFields import TYPED_VERSION
+from utils.metrics import get_logger
+
+
+log = get_logger('indexManager')
+
+
+# Indexes the ingest path and the report queries rely on, besides the unique
+# indexQuery from dbCreds.yaml. Compound keys follow equality -> sort -> range:
+# the equality field (driver, city) first, then the date the reports range and sort on.
+# Ingest dedup (TripDeduplicator) relies on the unique fingerprint index, so it is
+# declared whatever Database.indexes lists
+REQUIRED_INDEXES = [
+    {'keys': [('fingerprint', 1)], 'unique': True, 'sparse': True},
+]
+REPORT_INDEXES = [
+    *REQUIRED_INDEXES,
+    {'keys': [('tripStart', 1)]},
+    {'keys': [('tripDate', 1)]},
+    {'keys': [('totalCents', 1)]},
+    {'keys': [('typedVersion', 1)]},
+    {'keys': [('driver', 1), ('tripDate', 1)]},
+    {'keys': [('pickupLocation.city', 1), ('tripDate', 1)]},
+    # TripCache.sync() looks up in-place updates since its last run
+    {'keys': [('updatedAt', 1)], 'sparse': True},
+]
+# explain() findings: documents examined per document returned above this is flagged
+MAX_EXAMINED_RATIO = 10.0
+REPORT_WINDOW = timedelta(days=30)
+
+
+def _normalize_keys(keys) -> List[tuple]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [tuple(key) if isinstance(key, (list, tuple)) else (key, 1) for key in keys]
+
+
+def index_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalize one declared index: keys as [(field, direction)], default name
+    'field_1_field_-1' like the server's, and only the options that were set.
+    """
+    keys = _normalize_keys(spec['keys'])
+    options = {option: spec[option] for option in ('unique', 'sparse', 'partialFilterExpression',
+                                                      'expireAfterSeconds') if spec.get(option)}
+    name = spec.get('name') or '_'.join(f'{field}_{direction}' for field, direction in keys)
+    return {'keys': keys, 'name': name, 'options': options}
+
+
+def declared_indexes(dbConfig: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Indexes declared for the trips collection: the unique Database.indexQuery plus
+    Database.indexes from dbCreds.yaml, or REPORT_INDEXES when that is absent, e.g.
+
+        Database:
+          indexQuery: eid
+          indexes:
+            - keys: [[driver, 1], [tripDate, 1]]
+            - keys: [[tripStart, 1]]
+
+    REQUIRED_INDEXES are always declared; a configured index on the same keys is
+    replaced by the required one.
+    """
+    database = dbConfig['Database']
+    specs = [index_spec({'keys': database['indexQuery'], 'unique': True})]
+    required = {tuple(spec['keys']): spec for spec in map(index_spec, REQUIRED_INDEXES)}
+    for spec in map(index_spec, database.get('indexes') or REPORT_INDEXES):
+        specs.append(required.pop(tuple(spec['keys']), spec))
+    return specs + list(required.values())
+
+
+def _sample_range(sample):
+    start = sample.get('tripDate')
+    return {'$gte': start, '$lt': start + REPORT_WINDOW} if start else {'$exists': True}
+
+
+# Representative queries: name -> builder(sample trip) -> (filter, sort, limit). The
+# sample is a stored trip, so the filters hit values that exist in the collection.
+REPRESENTATIVE_QUERIES = {
+    'eid lookup': lambda s: ({'eid': s.get('eid')}, None, 1),
+    'fingerprint lookup': lambda s: ({'fingerprint': s.get('fingerprint')}, None, 1),
+    'date range': lambda s: ({'tripDate': _sample_range(s)}, [('tripDate', 1)], 0),
+    'trip start window': lambda s: ({'tripStart': _sample_range({'tripDate': s.get('tripStart')})},
+                                    [('tripStart', 1)], 0),
+    'driver by date': lambda s: ({'driver': s.get('driver'), 'tripDate': _sample_range(s)}, [('tripDate', 1)], 0),
+    'city by date': lambda s: ({'pickupLocation.city': (s.get('pickupLocation') or {}).get('city'),
+                                'tripDate': _sample_range(s)}, [('tripDate', 1)], 0),
+    'amount threshold': lambda s: ({'totalCents': {'$gte': (s.get('totalCents') or 0) * 2}},
+                                   [('totalCents', -1)], 50),
+    'unmigrated check': lambda s: ({'typedVersion': {'$ne': TYPED_VERSION}}, None, 1),
+}
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Depth-first walk of a winningPlan: FETCH -> IXSCAN, SORT -> COLLSCAN, OR -> [...]
+    stages = [plan]
+    for child in ([plan['inputStage']] if 'inputStage' in plan else []) + plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def summarize_explain(explain: Dict[str, Any], maxRatio: float = MAX_EXAMINED_RATIO) -> Dict[str, Any]:
+    """
+    The parts of an executionStats explain() that matter for indexing: the winning
+    plan's stages, the index it used, documents and keys examined per document
+    returned, and the flags raised (COLLSCAN, in-memory SORT, examined ratio).
+    """
+    planner = explain.get('queryPlanner', {})
+    plan = planner.get('winningPlan', {})
+    # Servers with the slot based engine nest the classic plan one level down
+    plan = plan.get('queryPlan', plan)
+    stages = _plan_stages(plan) if plan else []
+    names = [stage.get('stage') for stage in stages]
+    execution = explain.get('executionStats', {})
+    returned = execution.get('nReturned', 0)
+    examined = execution.get('totalDocsExamined', 0)
+    ratio = examined / max(returned, 1)
+    flags = []
+    if 'COLLSCAN' in names:
+        flags.append('COLLSCAN')
+    if 'SORT' in names:
+        flags.append('in-memory SORT')
+    if ratio > maxRatio:
+        flags.append(f'examined/returned {ratio:.1f} > {maxRatio:g}')
+    return {
+        'plan': ' <- '.join(filter(None, names)),
+        'index': next((stage.get('indexName') for stage in stages if stage.get('indexName')), None),
+        'returned': returned,
+        'docsExamined': examined,
+        'keysExamined': execution.get('totalKeysExamined', 0),
+        'ratio': ratio,
+        'millis': execution.get('executionTimeMillis'),
+        'flags': flags,
+    }
+
+
+def suggest_index(query: Dict[str, Any], sort: Optional[List] = None) -> List[tuple]:
+    """Compound key for a find: equality fields, then sort fields, then range fields"""
+    equality = [field for field, value in query.items()
+                if not field.startswith('$') and not (isinstance(value, dict) and any(k.startswith('$') for k in value))]
+    ranges = [field for field in query if field not in equality and not field.startswith('$')]
+    keys = [(field, 1) for field in equality]
+    for field, direction in sort or []:
+        if field not in equality:
+            keys.append((field, direction))
+    keys += [(field, 1) for field in ranges if field not in dict(keys)]
+    return keys
+
+
+class IndexManager():
+    """
+    Declared indexes of the trips collection, created idempotently, plus an
+    explain() based advisor for the queries the ingest and reports run.
+
+    ensure() compares the declared indexes with index_information(): missing ones
+    are created, identical ones left alone, and an index with a declared name but
+    different keys or options is reported as a conflict (and only rebuilt with
+    rebuild=True, since dropping a unique index on a live collection is not a
+    decision to take silently). Indexes on the collection that are not declared
+    are reported as undeclared.
+
+    advise() runs every representative query with executionStats and flags the
+    ones that scan the collection, sort in memory or examine far more documents
+    than they return, with a suggested compound index for each.
+
+    Usage:
+        manager = IndexManager(client, dbName, collectionName, declared_indexes(dbConfig))
+        manager.ensure()
+        for finding in manager.advise():
+            print(finding['query'], finding['plan'], finding['flags'])
+    """
+    def __init__(self, client, db: str, collection: str, specs: Optional[List[Dict[str, Any]]] = None):
+        self.client = client
+        self.db = db
+        self.collection = collection
+        self.specs = specs if specs is not None else [index_spec(spec) for spec in REPORT_INDEXES]
+        self.queries = dict(REPRESENTATIVE_QUERIES)
+
+    @property
+    def coll(self):
+        return self.client[self.db][self.collection]
+
+    def register(self, name: str, builder: Callable[[Dict[str, Any]], tuple]) -> None:
+        """Add a representative query: builder(sample trip) -> (filter, sort or None, limit)"""
+        self.queries[name] = builder
+
+    def ensure(self, rebuild: bool = False) -> Dict[str, List[str]]:
+        """
+        Create the declared indexes that do not exist yet.
+
+        Args:
+            rebuild (bool): Drop and recreate declared indexes whose keys or options differ
+
+        Returns:
+            Dict containing lists of index names:
+                - 'created': indexes built by this call
+                - 'existing': declared indexes that were already in place
+                - 'conflicts': declared names that exist with other keys or options
+                - 'undeclared': indexes on the collection that nothing declares
+
+        Raises:
+            PyMongoError: If there's an error with the MongoDB operation
+        """
+        result = {'created': [], 'existing': [], 'conflicts': [], 'undeclared': []}
+        try:
+            existing = self.coll.index_information()
+            byKeys = {tuple(tuple(key) for key in info['key']): name for name, info in existing.items()}
+            for spec in self.specs:
+                keys = tuple(spec['keys'])
+                current = existing.get(spec['name'])
+                sameKeysName = byKeys.get(keys)
+                if current is None and sameKeysName is not None:
+                    # Same keys under another name, e.g. created by hand: do not build a twin
+                    current, spec = existing[sameKeysName], {**spec, 'name': sameKeysName}
+                if current is not None:
+                    matches = (tuple(tuple(key) for key in current['key']) == keys and
+                               all(current.get(option) == value for option, value in spec['options'].items()) and
+                               not any(current.get(option) for option in ('unique', 'sparse')
+                                       if option not in spec['options']))
+                    if matches:
+                        result['existing'].append(spec['name'])
+                        continue
+                    if not rebuild:
+                        log.warning("Index %s on %s.%s differs from its declaration: %s vs %s",
+                                    spec['name'], self.db, self.collection, current, spec)
+                        result['conflicts'].append(spec['name'])
+                        continue
+                    self.coll.drop_index(spec['name'])
+                start = time.perf_counter()
+                self.coll.create_index(spec['keys'], name=spec['name'], **spec['options'])
+                log.info("Created index %s on %s.%s in %.2fs",
+                         spec['name'], self.db, self.collection, time.perf_counter() - start)
+                result['created'].append(spec['name'])
+            declared = set(result['created'] + result['existing'] + result['conflicts'])
+            result['undeclared'] = [name for name in existing if name != '_id_' and name not in declared]
+        except PyMongoError as e:
+            log.error("MongoDB error while ensuring indexes: %s", e)
+            raise
+        return result
+
+    def explain(self, query: Dict[str, Any], sort: Optional[List] = None, limit: int = 0) -> Dict[str, Any]:
+        """executionStats explain of a find, as the raw server document"""
+        command = {'find': self.collection, 'filter': query}
+        if sort:
+            command['sort'] = dict(sort)
+        if limit:
+            command['limit'] = limit
+        return self.client[self.db].command({'explain': command, 'verbosity': 'executionStats'})
+
+    def advise(self, sample: Optional[Dict[str, Any]] = None,
+               maxRatio: float = MAX_EXAMINED_RATIO) -> List[Dict[str, Any]]:
+        """
+        Explain every representative query against `sample` (default: the newest trip).
+
+        Returns:
+            One dict per query: 'query', 'filter', 'plan', 'index', 'returned',
+            'docsExamined', 'keysExamined', 'ratio', 'millis', 'flags' and, for
+            flagged queries, 'suggestion' (a compound key). Queries that could not
+            be explained carry 'error' instead.
+        """
+        if sample is None:
+            sample = self.coll.find_one({}, sort=[('_id', -1)], projection={'emailText': 0}) or {}
+        findings = []
+        for name, builder in self.queries.items():
+            query, sort, limit = builder(sample)
+            finding = {'query': name, 'filter': query}
+            try:
+                finding.update(summarize_explain(self.explain(query, sort, limit), maxRatio))
+            except (OperationFailure, NotImplementedError, AttributeError) as e:
+                # mongomock has no explain
+                finding['error'] = str(e)
+                findings.append(finding)
+                continue
+            if finding['flags']:
+                finding['suggestion'] = suggest_index(query, sort)
+                log.warning("Query '%s' %s; plan %s; consider index %s",
+                            name, ', '.join(finding['flags']), finding['plan'], finding['suggestion'])
+            findings.append(finding)
+        return findings
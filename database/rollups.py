@@ -0,0 +1,205 @@
+import sys
+import os
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append( project_root)
+
+
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import PyMongoError
+from typing import List, Dict, Any, Optional, Iterable
+from utils.utils import parseTripDate, parseMoneyCents, parseDistance, parseDuration
+from utils.tripFields import MONEY_FIELDS
+from utils.metrics import get_logger
+
+
+log = get_logger('rollups')
+
+
+PERIODS = ('day', 'week', 'month', 'driver')
+# Trip fields the rollups are computed from
+ROLLUP_SOURCE_FIELDS = ('date', 'driver', 'distance', 'duration', *MONEY_FIELDS)
+
+
+def period_keys(trip: Dict[str, Any]) -> Dict[str, str]:
+    """Bucket keys of a trip for every rollup dimension, e.g. {'month': '2025-07', 'driver': 'Ahmed'}"""
+    keys = {}
+    tripDate = parseTripDate(trip.get('date'))
+    if tripDate is not None:
+        isoYear, isoWeek, _ = tripDate.isocalendar()
+        keys['day'] = tripDate.strftime('%Y-%m-%d')
+        keys['week'] = f'{isoYear}-W{isoWeek:02d}'
+        keys['month'] = tripDate.strftime('%Y-%m')
+    if trip.get('driver'):
+        keys['driver'] = trip['driver']
+    return keys
+
+
+def trip_counters(trip: Dict[str, Any]) -> Dict[str, Any]:
+    """Numeric contributions of one trip to every bucket it falls in"""
+    counters = {'trips': 1, 'distanceKm': 0.0, 'durationMin': 0.0, 'tripsWithDistance': 0}
+    for field, counter in MONEY_FIELDS.items():
+        counters[counter] = parseMoneyCents(trip.get(field)) or 0
+    distance = parseDistance(trip.get('distance'))
+    if distance is not None:
+        counters['distanceKm'] = distance
+        counters['tripsWithDistance'] = 1
+        # cost per km only makes sense over trips that report a distance
+        counters['totalCentsWithDistance'] = counters['totalCents']
+    else:
+        counters['totalCentsWithDistance'] = 0
+    duration = parseDuration(trip.get('duration'))
+    if duration is not None:
+        counters['durationMin'] = duration
+    return counters
+
+
+def aggregate(trips: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """In-memory rollup of trips keyed by '<period>:<bucket>'"""
+    buckets = {}
+    for trip in trips:
+        counters = trip_counters(trip)
+        for period, bucket in period_keys(trip).items():
+            doc = buckets.setdefault(f'{period}:{bucket}', {'period': period, 'bucket': bucket})
+            for name, value in counters.items():
+                doc[name] = doc.get(name, 0) + value
+    return buckets
+
+
+class TripRollups():
+    """
+    Pre-aggregated spending per day, ISO week, month and driver, kept in a Mongo
+    summary collection next to the trips:
+
+        {'_id': 'month:2025-07', 'period': 'month', 'bucket': '2025-07', 'trips': 41,
+         'totalCents': 91234, 'tripFareCents': ..., 'HSTCents': ..., 'TNCCents': ...,
+         'insuranceCents': ..., 'subtotalCents': ..., 'distanceKm': 312.4, 'durationMin': 905.0, ...}
+
+    add() is called by DBOperations with the trips it has actually inserted and
+    applies one $inc upsert per touched bucket, so reports read O(periods)
+    documents instead of O(trips); remove() takes deleted trips back out the same
+    way. rebuild() recomputes everything from the trips collection (DBOperations
+    runs it after migrateTypedFields, as a re-typing means the parsers changed) and
+    verify() diffs the stored rollups against a full recomputation.
+    """
+    def __init__(self, client, db: str, tripsCollection: str, rollupCollection: str = 'tripRollups'):
+        self.client = client
+        self.db = db
+        self.tripsCollection = tripsCollection
+        self.rollupCollection = rollupCollection
+
+    @property
+    def coll(self):
+        return self.client[self.db][self.rollupCollection]
+
+    def create_index(self, coll=None):
+        (coll if coll is not None else self.coll).create_index([('period', ASCENDING), ('bucket', ASCENDING)])
+
+    def add(self, trips: List[Dict[str, Any]]) -> int:
+        """Fold newly inserted trips into the rollups. Returns the number of buckets touched."""
+        return self._apply(trips, 1)
+
+    def remove(self, trips: List[Dict[str, Any]]) -> int:
+        """
+        Take deleted trips back out of the rollups; buckets left without trips are
+        dropped. Returns the number of buckets touched.
+        """
+        touched = self._apply(trips, -1)
+        if touched:
+            self.coll.delete_many({'_id': {'$in': list(aggregate(trips))}, 'trips': {'$lte': 0}})
+        return touched
+
+    def _apply(self, trips: List[Dict[str, Any]], sign: int) -> int:
+        buckets = aggregate(trips)
+        if not buckets:
+            return 0
+        requests = [
+            UpdateOne({'_id': key},
+                      {'$setOnInsert': {'period': doc['period'], 'bucket': doc['bucket']},
+                       '$inc': {name: sign * value for name, value in doc.items() if name not in ('period', 'bucket')}},
+                      upsert=True)
+            for key, doc in buckets.items()
+        ]
+        try:
+            self.coll.bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            # The trips are already written; rebuild() brings the rollups back in line
+            log.error("Rollup update failed for %s trip(s), run rebuild(): %s", len(trips), e)
+            raise
+        return len(requests)
+
+    def query(self, period: str = 'month', start: Optional[str] = None, end: Optional[str] = None
+              ) -> List[Dict[str, Any]]:
+        """
+        Rollup rows for one dimension, sorted by bucket, with money converted back to
+        dollars and averageCostPerKm derived.
+
+        Args:
+            period (str): 'day', 'week', 'month' or 'driver'
+            start (Optional[str]): First bucket to include, e.g. '2025-01'
+            end (Optional[str]): Last bucket to include
+        """
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}")
+        query = {'period': period}
+        if start is not None or end is not None:
+            query['bucket'] = {}
+            if start is not None:
+                query['bucket']['$gte'] = start
+            if end is not None:
+                query['bucket']['$lte'] = end
+        rows = []
+        for doc in self.coll.find(query).sort('bucket', ASCENDING):
+            row = {'period': doc['period'], 'bucket': doc['bucket'], 'trips': doc.get('trips', 0),
+                   'distanceKm': doc.get('distanceKm', 0.0), 'durationMin': doc.get('durationMin', 0.0)}
+            for field, counter in MONEY_FIELDS.items():
+                row[field] = doc.get(counter, 0) / 100
+            km = doc.get('distanceKm', 0.0)
+            row['averageCostPerKm'] = doc.get('totalCentsWithDistance', 0) / 100 / km if km else None
+            rows.append(row)
+        return rows
+
+    def _recompute(self) -> Dict[str, Dict[str, Any]]:
+        fields = {field: 1 for field in ROLLUP_SOURCE_FIELDS}
+        trips = self.client[self.db][self.tripsCollection].find({}, fields).batch_size(1000)
+        return aggregate(trips)
+
+    def rebuild(self) -> int:
+        """
+        Recompute every rollup from the trips collection into a scratch collection and
+        swap it in with one renameCollection, so readers never see the rollups half
+        rebuilt. Trips added while the recompute runs can still be missed; verify()
+        reports them. Returns the bucket count.
+        """
+        buckets = self._recompute()
+        scratch = self.client[self.db][f'{self.rollupCollection}_rebuild']
+        scratch.drop()
+        # Creates the collection even when there are no buckets, and the swap keeps the index
+        self.create_index(scratch)
+        if buckets:
+            scratch.insert_many([{'_id': key, **doc} for key, doc in buckets.items()], ordered=False)
+        scratch.rename(self.rollupCollection, dropTarget=True)
+        log.info("Rebuilt %s rollup bucket(s) in %s.%s", len(buckets), self.db, self.rollupCollection)
+        return len(buckets)
+
+    def verify(self, tolerance: float = 1e-6) -> List[Dict[str, Any]]:
+        """
+        Compare the stored rollups with a full recomputation. Returns one entry per
+        bucket that differs (missing, extra or with different counters); empty when
+        the rollups are consistent.
+        """
+        expected = self._recompute()
+        stored = {doc['_id']: doc for doc in self.coll.find({})}
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key)
+            have = stored.get(key)
+            if want is None or have is None:
+                mismatches.append({'bucket': key, 'expected': want, 'stored': have})
+                continue
+            diff = {name: (value, have.get(name)) for name, value in want.items()
+                    if name not in ('period', 'bucket') and abs(value - have.get(name, 0)) > tolerance}
+            if diff:
+                mismatches.append({'bucket': key, 'diff': diff})
+        return mismatches
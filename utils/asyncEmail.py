@@ -0,0 +1,241 @@
+import re
+import ssl
+import asyncio
+import imaplib
+
+from utils.email_agent import Email, HEADER_FIELDS, FETCH_SEQ_REGEX, FETCH_UID_REGEX, log
+from utils.mimeParts import parse_bodystructures, part_text
+from utils.metrics import metrics
+
+IMAP_SSL_PORT = 993
+LITERAL_REGEX = re.compile(rb'\{(\d+)\}\r\n$')
+# SEARCH responses list every matching id on one line
+LINE_LIMIT = 1 << 24
+
+
+class AsyncIMAP():
+    """
+    Minimal asyncio IMAP4rev1 connection: tagged commands, untagged responses and
+    {n} literals, which is all the search + FETCH flow needs. Commands on one
+    connection are serialized; open several connections for parallel fetches.
+
+    command() returns (status, untagged, text) where every untagged response is a
+    (line, literals) pair, e.g. (b'12 FETCH (UID 40 RFC822 )', [b'<raw message>']).
+    """
+    def __init__(self, host, port=IMAP_SSL_PORT, use_ssl=True):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.reader = None
+        self.writer = None
+        self._tag = 0
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=context,
+                                                                 limit=LINE_LIMIT)
+        line, _ = await self._read_response()
+        if not line.startswith(b'* OK') and not line.startswith(b'* PREAUTH'):
+            raise imaplib.IMAP4.error(f"Unexpected greeting {line!r}")
+        return self
+
+    async def _read_response(self):
+        text = b''
+        literals = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connection closed by server")
+            found = LITERAL_REGEX.search(line)
+            if not found:
+                return text + line.rstrip(b'\r\n'), literals
+            text += line[:found.start()]
+            literals.append(await self.reader.readexactly(int(found.group(1))))
+
+    async def command(self, name, *args):
+        async with self._lock:
+            self._tag += 1
+            tag = f'A{self._tag:04d}'.encode()
+            self.writer.write(b' '.join([tag, name.encode(), *(str(a).encode() for a in args)]) + b'\r\n')
+            await self.writer.drain()
+            untagged = []
+            while True:
+                line, literals = await self._read_response()
+                if line.startswith(tag + b' '):
+                    status, _, text = line[len(tag) + 1:].partition(b' ')
+                    return status.decode(), untagged, text
+                if line.startswith(b'* '):
+                    untagged.append((line[2:], literals))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+
+class AsyncEmail(Email):
+    """
+    asyncio variant of Email over AsyncIMAP: login, logout, the date range +
+    keyword search and the batched header/body fetch are coroutines, so IMAP
+    round trips can overlap with parsing and Mongo writes on one event loop.
+    Subject decoding, keyword/regex filtering and message-set building are
+    inherited from Email; the blocking imaplib methods of Email are not usable
+    on an AsyncEmail.
+
+    Usage:
+        client = AsyncEmail(address, app_password, 'imap.gmail.com')
+        await client.login()
+        async for batch in client.iter_search_by_date_range_keywords_regex(from_date, to_date, keywords, regex):
+            ...
+        await client.logout()
+    """
+    def __init__(self, email, app_password, imap, port=IMAP_SSL_PORT, use_ssl=True, mime_parts=False):
+        super().__init__(email, app_password, imap, mime_parts=mime_parts)
+        self.port = port
+        self.use_ssl = use_ssl
+
+    async def login(self, mailbox="inbox"):
+        try:
+            self.mail = await AsyncIMAP(self.imap, self.port, self.use_ssl).connect()
+            status, _, text = await self.mail.command("LOGIN", self.email, self._quote(self.app_password))
+            if status != "OK":
+                raise imaplib.IMAP4.error(text.decode(errors="ignore"))
+            await self.select(mailbox)
+        except Exception as e:
+            log.error("Error encountered while loggining in %s", e)
+            raise
+        return self.mail
+
+    async def select(self, mailbox="inbox"):
+        status, _, text = await self.mail.command("SELECT", mailbox)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Unable to select mailbox {mailbox}: {text.decode(errors='ignore')}")
+
+    async def logout(self):
+        try:
+            await self.mail.command("LOGOUT")
+        except Exception as e:
+            log.warning("Error encountered while logging out  %s", e)
+        else:
+            log.info('Successfully logged out of %s', self.email)
+        finally:
+            if isinstance(self.mail, AsyncIMAP):
+                await self.mail.close()
+            self.mail = ''
+
+    @staticmethod
+    def _quote(arg):
+        return '"' + arg.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    async def search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex,
+                                                  require_all_keywords=False, header_batch_size=500,
+                                                  body_batch_size=50):
+        results = [hit async for batch in self.iter_search_by_date_range_keywords_regex(
+                       from_date, to_date, keywords, subject_regex, require_all_keywords,
+                       header_batch_size, body_batch_size)
+                   for hit in batch]
+        log.info("Final results: %s emails after filtering", len(results))
+        return results
+
+    async def iter_search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex,
+                                                       require_all_keywords=False, header_batch_size=500,
+                                                       body_batch_size=50):
+        """Async generator with the same batches as Email.iter_search_by_date_range_keywords_regex"""
+        ids = await self._search_ids(from_date, to_date, keywords)
+        if not ids:
+            return
+        pattern = re.compile(subject_regex, re.IGNORECASE) if subject_regex else None
+        for chunk, message_set in self._message_sets(ids, header_batch_size):
+            try:
+                headers = await self._fetch_set(message_set, HEADER_FIELDS)
+            except Exception as e:
+                log.warning("Error fetching headers for %s: %s", message_set, e)
+                continue
+            matched = self._match_headers(chunk, headers, keywords, pattern, require_all_keywords)
+
+            for start in range(0, len(matched), body_batch_size):
+                hits = matched[start:start + body_batch_size]
+                texts = await self._fetch_text_parts([h["id"] for h in hits]) if self.mime_parts else {}
+                rest = [h["id"] for h in hits if h["id"] not in texts]
+                bodies = {}
+                if rest:
+                    _, body_set = next(self._message_sets(rest, body_batch_size))
+                    try:
+                        bodies = await self._fetch_set(body_set, "(RFC822)")
+                    except Exception as e:
+                        log.warning("Error fetching bodies for %s: %s", body_set, e)
+                for hit in hits:
+                    if hit["id"] in texts:
+                        hit["text"] = texts[hit["id"]]
+                        log.debug("✓ Added: %s | From: %s", hit['subject'], hit['from'])
+                        continue
+                    raw_email = bodies.get(hit["id"])
+                    if raw_email is None:
+                        # Server skipped this id in the batch, fall back to a single fetch
+                        raw_email = (await self._fetch_set(hit["id"], "(RFC822)")).get(hit["id"], b"")
+                    hit["text"] = self._raw_text(raw_email)
+                    log.debug("✓ Added: %s | From: %s", hit['subject'], hit['from'])
+                yield hits
+
+    async def _search_ids(self, from_date, to_date, keywords):
+        criteria, from_str, before_str = self._date_range_criteria(from_date, to_date, keywords)
+        flat_criteria = self._flatten_criteria(criteria)
+        log.debug("Flat IMAP criteria: %s", flat_criteria)
+        with metrics.stage('imap_search'):
+            status, untagged, _ = await self.mail.command("SEARCH", *flat_criteria)
+        if status != "OK":
+            # Fallback: search with just date range
+            with metrics.stage('imap_search'):
+                status, untagged, _ = await self.mail.command("SEARCH", "SINCE", from_str, "BEFORE", before_str)
+            log.info("Fallback: Using date range only")
+        ids = [i for line, _ in untagged if line.startswith(b"SEARCH") for i in line.split()[1:]]
+        if status != "OK" or not ids:
+            log.info("No emails found by IMAP search")
+            return []
+        log.info("IMAP found %s emails", len(ids))
+        return ids
+
+    async def _fetch_set(self, message_set, parts, uid=False):
+        """Async Email._fetch_set: one FETCH for the whole set, returns {id: payload bytes}"""
+        with metrics.stage('imap_fetch') as stage:
+            if uid:
+                status, untagged, _ = await self.mail.command("UID", "FETCH", message_set, parts)
+            else:
+                status, untagged, _ = await self.mail.command("FETCH", message_set, parts)
+            if status != "OK":
+                return {}
+            id_regex = FETCH_UID_REGEX if uid else FETCH_SEQ_REGEX
+            payloads = {}
+            for line, literals in untagged:
+                if not literals or b"FETCH" not in line:
+                    continue
+                found = id_regex.search(line) if uid else id_regex.match(line)
+                if found:
+                    payloads[found.group(1).decode()] = literals[0]
+            stage.add(items=len(payloads), nbytes=sum(len(p) for p in payloads.values()))
+        return payloads
+
+    async def _fetch_text_parts(self, ids, uid=False):
+        """Async Email._fetch_text_parts: BODYSTRUCTURE first, then only the text part of each message"""
+        _, message_set = next(self._message_sets(ids, len(ids)))
+        prefix = ("UID",) if uid else ()
+        with metrics.stage('imap_fetch'):
+            status, untagged, _ = await self.mail.command(*prefix, "FETCH", message_set, "(BODYSTRUCTURE)")
+        if status != "OK":
+            return {}
+        # Structures carrying {n} literals are left to the RFC822 fallback
+        structures = parse_bodystructures([line for line, literals in untagged if not literals],
+                                          FETCH_UID_REGEX if uid else FETCH_SEQ_REGEX, uid=uid)
+        texts = {}
+        for section, members in self._group_text_parts(ids, structures).items():
+            _, section_set = next(self._message_sets([id_str for id_str, _ in members], len(members)))
+            payloads = await self._fetch_set(section_set, f"(BODY.PEEK[{section}])", uid=uid)
+            for id_str, part in members:
+                if id_str in payloads:
+                    with metrics.stage('mime_decode', items=1, nbytes=len(payloads[id_str])):
+                        texts[id_str] = part_text(payloads[id_str], part)
+        return texts
@@ -0,0 +1,122 @@
+import gzip
+import time
+import asyncio
+import functools
+
+from utils.parsePool import parse_trips
+from utils.tripDedup import FINGERPRINT_FIELD
+
+
+_DONE = object()
+
+
+async def ingest(emailClient, dbOps, db, collection, from_date, to_date, keywords, subject_regex,
+                 require_all_keywords=False, compressionAlgo=gzip, keyFields=None, insert_batch_size=500,
+                 queue_size=4, executor=None, header_batch_size=500, body_batch_size=50, parse_cache=None,
+                 dedup=None):
+    """
+    asyncio version of IngestPipeline: fetch -> parse -> write as three tasks joined
+    by bounded asyncio queues on one event loop.
+
+    emailClient is a logged-in AsyncEmail and dbOps an AsyncDBOperations, so IMAP
+    and Mongo round trips overlap instead of adding up. Parsing is CPU bound and runs
+    off the loop in a thread, fanned out to `executor` (a ProcessPoolExecutor) when
+    one is given. parse_cache (a ParseCache) skips extraction of bodies seen before,
+    and dedup (a TripDeduplicator) drops trips whose fingerprint is already stored.
+
+    Returns:
+        The IngestPipeline.run() stats dict: 'emails', 'trips', 'insert_batches',
+        'inserted', 'matched', 'duplicate', 'failed', 'prefiltered', 'failures' and 'elapsed'.
+
+    Raises:
+        The first exception raised by any stage, after the other stages are cancelled.
+    """
+    hitQueue = asyncio.Queue(maxsize=queue_size)
+    tripQueue = asyncio.Queue(maxsize=queue_size)
+    stats = {'emails': 0, 'trips': 0, 'insert_batches': 0, 'inserted': 0, 'matched': 0, 'duplicate': 0,
+             'failed': 0, 'prefiltered': 0, 'failures': [], 'elapsed': 0.0}
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+
+    async def fetch_stage():
+        try:
+            async for batch in emailClient.iter_search_by_date_range_keywords_regex(
+                    from_date, to_date, keywords, subject_regex, require_all_keywords,
+                    header_batch_size, body_batch_size):
+                if batch:
+                    stats['emails'] += len(batch)
+                    await hitQueue.put(batch)
+        except Exception:
+            await hitQueue.put(_DONE)
+            raise
+        await hitQueue.put(_DONE)
+
+    async def parse_stage():
+        try:
+            while True:
+                batch = await hitQueue.get()
+                if batch is _DONE:
+                    break
+                trips, failures = await loop.run_in_executor(None, functools.partial(
+                    parse_trips, batch, workers=1, compressionAlgo=compressionAlgo, executor=executor,
+                    cache=parse_cache))
+                stats['failures'].extend(failures)
+                if trips:
+                    await tripQueue.put(trips)
+        except Exception:
+            await tripQueue.put(_DONE)
+            raise
+        await tripQueue.put(_DONE)
+
+    async def write(trips):
+        stats['trips'] += len(trips)
+        stats['insert_batches'] += 1
+        if dedup is not None:
+            trips, duplicates, maybe = dedup.check(trips)
+            if maybe:
+                # One indexed $in lookup settles every fingerprint not known from this run
+                docs = await dbOps.findItemsByQuery(dedup.stored_query(maybe), db, collection,
+                                                    projection={FINGERPRINT_FIELD: 1, '_id': 0})
+                confirmedFresh, confirmed = dedup.confirm(maybe, {doc[FINGERPRINT_FIELD] for doc in docs})
+                trips += confirmedFresh
+                duplicates += confirmed
+            stats['prefiltered'] += len(duplicates)
+            if not trips:
+                return
+        if keyFields:
+            result = await dbOps.bulk_upsert(trips, db, collection, keyFields, batch_size=insert_batch_size)
+            for name in ('inserted', 'matched', 'duplicate', 'failed'):
+                stats[name] += result[f'{name}_count']
+            written = result['upserted_records']
+        else:
+            written = (await dbOps.insert(trips, db, collection))['inserted_records']
+        if dedup is not None:
+            dedup.record(written)
+
+    async def write_stage():
+        pending = []
+        while True:
+            trips = await tripQueue.get()
+            if trips is _DONE:
+                break
+            pending.extend(trips)
+            while len(pending) >= insert_batch_size:
+                await write(pending[:insert_batch_size])
+                pending = pending[insert_batch_size:]
+        if pending:
+            await write(pending)
+
+    tasks = [asyncio.create_task(fetch_stage()), asyncio.create_task(parse_stage())]
+    try:
+        await write_stage()
+        # parse first: if it failed, fetch may still be blocked on a full queue
+        for task in reversed(tasks):
+            await task
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
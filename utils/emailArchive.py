@@ -0,0 +1,201 @@
+import os
+import time
+import zlib
+import struct
+import sqlite3
+import threading
+
+from utils.metrics import get_logger, metrics
+
+
+# Record framing in a segment: magic, key length, blob length, crc32 of the blob,
+# then the key (the trip _id as text) and the blob (emailText exactly as stored)
+RECORD_HEADER = struct.Struct('>4sHII')
+RECORD_MAGIC = b'UMA1'
+SEGMENT_FORMAT = 'segment-{:06d}.blob'
+
+log = get_logger('emailArchive')
+
+
+class EmailArchive():
+    """
+    Cold storage for the compressed emailText of old trips: append-only segment
+    files in a local directory plus a SQLite offset index.
+
+    Blobs are appended to the newest segment until it reaches `segment_bytes`,
+    then a new segment is started; nothing is rewritten in place. Each append
+    batch is fsynced before its offsets are committed to the index, and the trip
+    document only gets its reference ({'segment', 'offset', 'length', 'crc'})
+    after that, so every reference in Mongo points at a complete, indexed record.
+    Bytes a crash left after the last indexed record are cut off on open.
+    Appending a key that is already archived returns its existing reference, which
+    makes an interrupted migration safe to re-run.
+
+    A read is one positioned read of the record, checked against its key and
+    crc32; read_many() sorts the requested records by segment and offset first.
+    The blob comes back exactly as it was stored, still compressed with the
+    trip's compressorName/compressorDict.
+
+    Usage:
+        archive = EmailArchive('./config/emailArchive')
+        refs = archive.append_many([(str(trip['_id']), trip['emailText'])])
+        blob = archive.read(str(trip['_id']), refs[str(trip['_id'])])
+    """
+    def __init__(self, directory, segment_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._readers = {}
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                crc INTEGER NOT NULL,
+                archived REAL NOT NULL
+            ) WITHOUT ROWID""")
+        self._db.execute('CREATE INDEX IF NOT EXISTS blobs_position ON blobs (segment, offset)')
+        self._db.commit()
+        self._segment, self._size = self._recover()
+        self._writer = None
+
+    def _path(self, segment):
+        return os.path.join(self.directory, SEGMENT_FORMAT.format(segment))
+
+    def _recover(self):
+        """Newest segment and its indexed size, cutting off whatever a crash left past the last indexed record"""
+        row = self._db.execute('SELECT segment, offset, length, key FROM blobs ORDER BY segment DESC, offset DESC '
+                               'LIMIT 1').fetchone()
+        if row is None:
+            segment, end = 1, 0
+        else:
+            segment, offset, length, key = row
+            end = offset + RECORD_HEADER.size + len(key.encode('utf-8')) + length
+        path = self._path(segment)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            log.warning("Truncating %s from %s to %s bytes (unindexed tail)", path, os.path.getsize(path), end)
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        # A segment started by a batch that never reached the index holds nothing referenced
+        later = segment + 1
+        while os.path.exists(self._path(later)):
+            log.warning("Removing unindexed segment %s", self._path(later))
+            os.remove(self._path(later))
+            later += 1
+        return segment, end
+
+    def locate(self, key):
+        """Reference of an archived key, or None"""
+        with self._lock:
+            row = self._db.execute('SELECT segment, offset, length, crc FROM blobs WHERE key = ?', (key,)).fetchone()
+        return dict(zip(('segment', 'offset', 'length', 'crc'), row)) if row else None
+
+    def append_many(self, items):
+        """
+        Archive [(key, blob)] and return {key: reference}. Keys archived before keep
+        their first reference and are not appended again.
+        """
+        items = list(items)
+        refs = {}
+        with self._lock, metrics.stage('tier_write') as stage:
+            keys = [key for key, _ in items]
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                for key, segment, offset, length, crc in self._db.execute(
+                        f'SELECT key, segment, offset, length, crc FROM blobs WHERE key IN ({marks})', chunk):
+                    refs[key] = {'segment': segment, 'offset': offset, 'length': length, 'crc': crc}
+
+            rows = []
+            written = 0
+            for key, blob in items:
+                if key in refs:
+                    continue
+                blob = bytes(blob)
+                encoded = key.encode('utf-8')
+                crc = zlib.crc32(blob)
+                record = RECORD_HEADER.pack(RECORD_MAGIC, len(encoded), len(blob), crc) + encoded + blob
+                if self._size and self._size + len(record) > self.segment_bytes:
+                    self._roll()
+                writer = self._open_writer()
+                writer.write(record)
+                refs[key] = {'segment': self._segment, 'offset': self._size, 'length': len(blob), 'crc': crc}
+                rows.append((key, self._segment, self._size, len(blob), crc, time.time()))
+                self._size += len(record)
+                written += len(record)
+            if rows:
+                # Durable on disk before the index (and then Mongo) may point at it
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+                self._db.executemany('INSERT INTO blobs (key, segment, offset, length, crc, archived) '
+                                     'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                self._db.commit()
+            stage.add(items=len(rows), nbytes=written)
+        return refs
+
+    def _open_writer(self):
+        if self._writer is None:
+            self._writer = open(self._path(self._segment), 'ab')
+        return self._writer
+
+    def _roll(self):
+        # The current batch may already have records in the segment being closed
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer = None
+        self._segment += 1
+        self._size = 0
+
+    def _reader(self, segment):
+        if segment not in self._readers:
+            self._readers[segment] = os.open(self._path(segment), os.O_RDONLY)
+        return self._readers[segment]
+
+    def read(self, key, ref=None):
+        """The archived blob of `key`, located through `ref` or else the offset index"""
+        if ref is None:
+            ref = self.locate(key)
+            if ref is None:
+                raise KeyError(f"{key} is not in the email archive {self.directory}")
+        encoded = key.encode('utf-8')
+        with self._lock:
+            if self._writer is not None and ref['segment'] == self._segment:
+                self._writer.flush()
+            fd = self._reader(ref['segment'])
+        with metrics.stage('tier_read', items=1, nbytes=ref['length']):
+            record = os.pread(fd, RECORD_HEADER.size + len(encoded) + ref['length'], ref['offset'])
+        magic, keyLength, length, crc = RECORD_HEADER.unpack_from(record)
+        blob = record[RECORD_HEADER.size + keyLength:]
+        if magic != RECORD_MAGIC or record[RECORD_HEADER.size:RECORD_HEADER.size + keyLength] != encoded or \
+                length != ref['length'] or len(blob) != length or zlib.crc32(blob) != crc:
+            raise ValueError(f"Archived emailText of {key} is corrupt or misplaced "
+                             f"(segment {ref['segment']}, offset {ref['offset']})")
+        return blob
+
+    def read_many(self, refs):
+        """{key: blob} for {key: reference}, read in segment and offset order"""
+        ordered = sorted(refs.items(), key=lambda item: (item[1]['segment'], item[1]['offset']))
+        return {key: self.read(key, ref) for key, ref in ordered}
+
+    def stats(self):
+        with self._lock:
+            records, blobBytes = self._db.execute('SELECT COUNT(*), COALESCE(SUM(length), 0) FROM blobs').fetchone()
+        segments = sorted(name for name in os.listdir(self.directory) if name.startswith('segment-'))
+        return {'records': records, 'blob_bytes': blobBytes, 'segments': len(segments),
+                'segment_bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in segments)}
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers = {}
+            self._db.close()
@@ -4,13 +4,29 @@ import os
 from email.header import decode_header
 from datetime import datetime, timedelta
 import re
+from utils.headerIndex import filter_signature
+from utils.mimeParts import parse_bodystructures, text_part, part_text, html_to_text
+from utils.metrics import get_logger, metrics
+
+HEADER_FIELDS = '(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])'
+FETCH_SEQ_REGEX = re.compile(rb'^\s*(\d+)\s')
+FETCH_UID_REGEX = re.compile(rb'UID\s+(\d+)')
+
+log = get_logger('email_agent')
 
 class Email(): 
-    def __init__(self, email, app_password, imap):
+    def __init__(self, email, app_password, imap, mime_parts=False, header_index=None, narrow_from=False):
         self.email = email 
         self.app_password = app_password
         self.imap = imap
         self.mail = ''
+        self.pending_sync = None
+        # Batched fetches read BODYSTRUCTURE and download only the text part instead of the whole RFC822
+        self.mime_parts = mime_parts
+        # HeaderIndex: batched searches only fetch the headers of UIDs it has not seen yet
+        self.header_index = header_index
+        # Add a FROM constraint to the searches when the header index shows it is selective
+        self.narrow_from = narrow_from
 
     def login(self):
         # First time login
@@ -19,7 +35,7 @@ class Email():
                 self.mail = imaplib.IMAP4_SSL(self.imap)
                 self.mail.login(self.email,self.app_password)
             except Exception as e: 
-                print(f"Error encountered while loggining in {e}")
+                log.error("Error encountered while loggining in %s", e)
             else : 
                 self.mail.select("inbox")
             return self.mail 
@@ -31,7 +47,7 @@ class Email():
                 try:  
                     self.mail.login(self.email,self.app_password)
                 except Exception as e : 
-                    print(f'We request you to consider and resolve the following error {e}')
+                    log.error('We request you to consider and resolve the following error %s', e)
             else : 
                 return self.mail
                 
@@ -39,14 +55,112 @@ class Email():
         try:
             self.mail.logout()
         except Exception as e: 
-            print(f"Error encountered while logging out  {e}")
+            log.warning("Error encountered while logging out  %s", e)
         else :
-            print(f'Successfully logged out of {self.email}')
+            log.info('Successfully logged out of %s', self.email)
             # for data security purchases, clear the mail object to wipe out any information about the most recent interaction
             del self.mail
 
-    def search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex, require_all_keywords=False):
+    def search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex, require_all_keywords=False,
+                                            batched=False, header_batch_size=500, body_batch_size=50, mailbox="inbox"):
+        # batched=True fetches headers for whole message-set ranges (e.g. 1:500) in one
+        # command and bodies in chunks of body_batch_size, instead of 2 round trips per email.
+        # `mailbox` names the selected mailbox for the header index
         
+        ids = self._search_ids(from_date, to_date, keywords, mailbox)
+        if not ids:
+            return []
+
+        # --- Local filtering ---
+        if subject_regex:
+            pattern = re.compile(subject_regex, re.IGNORECASE)
+        else:
+            pattern = None
+
+        if batched:
+            results = self._collect_batched(ids, keywords, pattern, require_all_keywords,
+                                            header_batch_size, body_batch_size, scope=self._index_scope(mailbox))
+            log.info("Final results: %s emails after filtering", len(results))
+            return results
+
+        results = []
+
+        for mid in ids:
+            try:
+                with metrics.stage('imap_fetch', items=1):
+                    status, msg_data = self.mail.fetch(mid, HEADER_FIELDS)
+                if status != "OK" or not msg_data or not msg_data[0]:
+                    continue
+
+                msg = email.message_from_bytes(msg_data[0][1])
+                subject = self._decode_subject(msg)
+                from_field = msg.get("From", "").strip()
+
+                if not self._subject_matches(subject, keywords, pattern, require_all_keywords):
+                    continue
+
+                id_str = mid.decode() if isinstance(mid, bytes) else str(mid)
+                email_text = self._get_text(id_str)
+                
+                results.append({
+                    "id": id_str,
+                    "subject": subject,
+                    "from": from_field,
+                    "date": msg.get("Date", "").strip(),
+                    "text": email_text
+                })
+                
+                log.debug("✓ Added: %s | From: %s", subject, from_field)
+                
+            except Exception as e:
+                log.warning("Error processing email %s: %s", mid, e)
+                continue
+
+        log.info("Final results: %s emails after filtering", len(results))
+        return results
+
+    def _search_ids(self, from_date, to_date, keywords, mailbox="inbox", uid=False):
+        """
+        Run the IMAP date range + SUBJECT keyword search and return the matching message ids.
+        With uid=True the search is a UID SEARCH and the ids are UIDs, which stay valid when
+        other messages are expunged before the fetch.
+        """
+        search = (lambda *args: self.mail.uid("SEARCH", *args)) if uid else self.mail.search
+        criteria, from_str, before_str = self._date_range_criteria(from_date, to_date, keywords)
+        criteria.extend(self._sender_criteria(mailbox)[0])
+
+        log.debug("IMAP Search Criteria: %s", criteria)
+
+        # --- Search in IMAP ---
+        try:
+            # Convert nested lists to flat command for IMAP
+            flat_criteria = self._flatten_criteria(criteria)
+            log.debug("Flat IMAP criteria: %s", flat_criteria)
+            
+            with metrics.stage('imap_search'):
+                status, data = search(None, *flat_criteria)
+        except Exception as e:
+            log.warning("IMAP search error: %s", e)
+            # Fallback: search with just date range
+            try:
+                with metrics.stage('imap_search'):
+                    status, data = search(None, "SINCE", from_str, "BEFORE", before_str)
+                log.info("Fallback: Using date range only")
+            except Exception as e2:
+                log.error("Fallback search also failed: %s", e2)
+                return []
+
+        if status != "OK" or not data or not data[0]:
+            log.info("No emails found by IMAP search")
+            return []
+
+        ids = data[0].split()
+        log.info("IMAP found %s emails", len(ids))
+        return ids
+
+
+    def _date_range_criteria(self, from_date, to_date, keywords):
+        """SINCE/BEFORE + SUBJECT keyword criteria; returns (criteria, since, before) IMAP date strings"""
         # --- Convert to IMAP date strings ---
         def _to_imap_date(d):
             if isinstance(d, str):
@@ -67,138 +181,226 @@ class Email():
         # --- Build IMAP criteria ---
         criteria = ["SINCE", from_str, "BEFORE", before_str]
 
-        # FIXED: Better IMAP OR query building
-        def _build_keyword_criteria(keywords):
-            if not keywords:
-                return []
-            
-            if len(keywords) == 1:
-                return ["SUBJECT", keywords[0]]
-            
-            # Build proper OR chain: OR (SUBJECT kw1) (SUBJECT kw2) for 2 keywords
-            # For more keywords: OR (OR (SUBJECT kw1) (SUBJECT kw2)) (SUBJECT kw3)
-            result = ["OR", ["SUBJECT", keywords[0]], ["SUBJECT", keywords[1]]]
-            for kw in keywords[2:]:
-                result = ["OR", result, ["SUBJECT", kw]]
-            return result
-
         # Add keyword criteria if provided
         if keywords:
-            keyword_criteria = _build_keyword_criteria(keywords)
+            keyword_criteria = self._build_keyword_criteria(keywords)
             if keyword_criteria:
                 criteria.extend(keyword_criteria)
+        return criteria, from_str, before_str
 
-        print(f"IMAP Search Criteria: {criteria}")
+    def iter_search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex,
+                                                 require_all_keywords=False, header_batch_size=500,
+                                                 body_batch_size=50, mailbox="inbox"):
+        """
+        Streaming variant of search_by_date_range_keywords_regex(batched=True).
 
-        # --- Search in IMAP ---
-        try:
-            # Convert nested lists to flat command for IMAP
-            flat_criteria = self._flatten_criteria(criteria)
-            print(f"Flat IMAP criteria: {flat_criteria}")
+        Yields lists of at most body_batch_size result dicts as soon as each body
+        chunk has been fetched, so only one header chunk and one body chunk are held
+        in memory at a time no matter how large the mailbox is.
+        """
+        ids = self._search_ids(from_date, to_date, keywords, mailbox)
+        if not ids:
+            return
+        pattern = re.compile(subject_regex, re.IGNORECASE) if subject_regex else None
+        yield from self._iter_batched(ids, keywords, pattern, require_all_keywords,
+                                      header_batch_size, body_batch_size, scope=self._index_scope(mailbox))
+
+    def sync_new_messages(self, keywords, subject_regex, state, mailbox="inbox", require_all_keywords=False,
+                          from_date=None, header_batch_size=500, body_batch_size=50):
+        """
+        Incremental mailbox sync using IMAP UIDs and UIDVALIDITY.
+
+        Only messages with a UID above the high-water mark stored in `state` (a
+        SyncState) are searched and fetched, so a steady-state run costs O(new mail).
+        If the server reports a different UIDVALIDITY the stored mark is discarded
+        and the mailbox is re-synced from `from_date` (or from the start).
+
+        Args:
+            keywords (list): IMAP SUBJECT pre-filter terms
+            subject_regex (str): Local subject regex applied after the IMAP search
+            state (SyncState): Persistent store of the last-seen UID per mailbox
+            mailbox (str): Mailbox/folder to sync
+            require_all_keywords (bool): Require every keyword in the subject
+            from_date (str | date | datetime): Lower bound used for the first/full sync
             
-            status, data = self.mail.search(None, *flat_criteria)
-        except Exception as e:
-            print(f"IMAP search error: {e}")
-            # Fallback: search with just date range
-            try:
-                status, data = self.mail.search(None, "SINCE", from_str, "BEFORE", before_str)
-                print("Fallback: Using date range only")
-            except Exception as e2:
-                print(f"Fallback search also failed: {e2}")
-                return []
+        Returns:
+            list[dict]: Same result dicts as search_by_date_range_keywords_regex with
+            additional 'uid' and 'uidvalidity' keys; 'id' is the UID. The high-water
+            mark is not advanced: call commit_sync(state) once the results are stored.
+        """
+        results = [hit for batch in self.iter_new_messages(keywords, subject_regex, state, mailbox,
+                                                             require_all_keywords, from_date,
+                                                             header_batch_size, body_batch_size)
+                   for hit in batch]
+        log.info("Final results: %s new emails after filtering", len(results))
+        return results
 
-        if status != "OK" or not data or not data[0]:
-            print("No emails found by IMAP search")
-            return []
+    def iter_new_messages(self, keywords, subject_regex, state, mailbox="inbox", require_all_keywords=False,
+                          from_date=None, header_batch_size=500, body_batch_size=50):
+        """
+        Streaming variant of sync_new_messages: yields batches of new result dicts.
 
-        ids = data[0].split()
-        print(f"IMAP found {len(ids)} emails")
+        The high-water mark is NOT advanced here; once the batches have been stored
+        downstream call commit_sync(state) so an interrupted run is simply retried.
+        """
+        self.pending_sync = None
+        found = self._new_uids(keywords, state, mailbox, from_date)
+        if found is None:
+            return
+        state_key, uidvalidity, uids, stored_uid = found
+        if not uids:
+            return
 
-        # --- Local filtering ---
-        if subject_regex:
-            pattern = re.compile(subject_regex, re.IGNORECASE)
+        pattern = re.compile(subject_regex, re.IGNORECASE) if subject_regex else None
+        scope = (state_key, uidvalidity) if self.header_index is not None else None
+        failed = []
+        for batch in self._iter_batched(uids, keywords, pattern, require_all_keywords,
+                                        header_batch_size, body_batch_size, uid=True, scope=scope,
+                                        failed=failed):
+            for result in batch:
+                result["uid"] = int(result["id"])
+                result["uidvalidity"] = uidvalidity
+            yield batch
+
+        # Advance past everything the search returned, matched or not, so filtered
+        # out messages are not reconsidered on the next run; but never past a message
+        # whose fetch failed, so it is retried (with the ones after it) next time
+        last_uid = max(stored_uid, *(int(u) for u in uids))
+        if failed:
+            last_uid = min(int(u) for u in failed) - 1
+            log.warning("%d messages of %s could not be fetched, holding its sync mark at UID %d",
+                        len(set(failed)), state_key, last_uid)
+        self.pending_sync = (state_key, uidvalidity, last_uid)
+
+    def _new_uids(self, keywords, state, mailbox="inbox", from_date=None):
+        """
+        Select `mailbox` and UID SEARCH past its stored high-water mark.
+
+        Returns (state_key, uidvalidity, uids, last_uid) with uids sorted ascending
+        and last_uid the stored mark (0 on a first or full resync), or None when the
+        mailbox cannot be selected or searched. When a FROM constraint has just
+        expired, mail since it was chosen is searched again, and UIDs at or below
+        the mark that the narrowed searches never indexed are returned too.
+        """
+        status, _ = self.mail.select(mailbox)
+        if status != "OK":
+            log.error("Unable to select mailbox %s", mailbox)
+            return None
+        uidvalidity = self._uidvalidity(mailbox)
+
+        state_key = f"{self.email}/{mailbox}"
+        if self.header_index is not None:
+            self.header_index.prune(state_key, uidvalidity)
+        mark = state.get(state_key)
+        if mark is None or mark["uidvalidity"] != uidvalidity:
+            if mark is not None:
+                log.warning("UIDVALIDITY changed for %s, resyncing", state_key)
+            last_uid = 0
         else:
-            pattern = None
+            last_uid = mark["last_uid"]
 
-        results = []
+        senders, narrowed_since = self._sender_criteria(mailbox)
+        # Mail from senders an expired FROM constraint left out can sit below the mark
+        recheck = narrowed_since is not None and last_uid > 0
+        if recheck:
+            # A day early, for mail whose date precedes its delivery
+            criteria = ["UID", "1:*", "SINCE", (narrowed_since - timedelta(days=1)).strftime("%d-%b-%Y")]
+        else:
+            criteria = ["UID", f"{last_uid + 1}:*"]
+        if last_uid == 0 and from_date is not None:
+            if isinstance(from_date, str):
+                from_date = datetime.fromisoformat(from_date)
+            if isinstance(from_date, datetime):
+                from_date = from_date.date()
+            criteria.extend(["SINCE", from_date.strftime("%d-%b-%Y")])
+        criteria.extend(self._build_keyword_criteria(keywords))
+        criteria.extend(senders)
 
-        for mid in ids:
-            try:
-                status, msg_data = self.mail.fetch(mid, '(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])')
-                if status != "OK" or not msg_data or not msg_data[0]:
-                    continue
+        with metrics.stage('imap_search'):
+            status, data = self.mail.uid("SEARCH", None, *self._flatten_criteria(criteria))
+        if status != "OK":
+            log.error("IMAP UID search failed for %s", state_key)
+            return None
 
-                msg = email.message_from_bytes(msg_data[0][1])
-                subject_parts = decode_header(msg.get("Subject", ""))
-                subject = "".join(
-                    s.decode(enc or "utf-8", errors="ignore") if isinstance(s, bytes) else s
-                    for s, enc in subject_parts
-                ).strip()
+        found = data[0].split() if data and data[0] else []
+        # "n:*" always matches the newest message, even when its UID is below n
+        uids = [u for u in found if int(u) > last_uid]
+        if recheck:
+            # Below the mark, what the narrowed searches indexed was already read
+            older = [u for u in found if int(u) <= last_uid]
+            known = self.header_index.get_many(state_key, uidvalidity, older)
+            uids += [u for u in older if int(u) not in known]
+        uids.sort(key=int)
+        log.info("IMAP found %s new emails in %s since UID %s", len(uids), state_key, last_uid)
+        return state_key, uidvalidity, uids, last_uid
 
-                from_field = msg.get("From", "").strip()
-                
-                # IMPROVED: Better keyword filtering
-                subj_lc = subject.lower()
-                if keywords:
-                    if require_all_keywords:
-                        if not all(k.lower() in subj_lc for k in keywords):
-                            continue
-                    else:
-                        if not any(k.lower() in subj_lc for k in keywords):
-                            continue
+    def _uidvalidity(self, mailbox):
+        """UIDVALIDITY of the selected `mailbox`, from the SELECT response or else a STATUS"""
+        _, validity_data = self.mail.response("UIDVALIDITY")
+        if not validity_data or validity_data[0] is None:
+            _, status_data = self.mail.status(mailbox, "(UIDVALIDITY)")
+            validity_data = re.findall(rb"UIDVALIDITY\s+(\d+)", status_data[0] if status_data else b"")
+        return int(validity_data[-1])
 
-                # IMPROVED: Only apply regex if provided
-                if pattern and not pattern.search(subject):
-                    continue
+    def _index_scope(self, mailbox):
+        """(mailbox key, UIDVALIDITY) header index rows of the selected mailbox live under; None without an index"""
+        if self.header_index is None:
+            return None
+        key = f"{self.email}/{mailbox}"
+        uidvalidity = self._uidvalidity(mailbox)
+        removed = self.header_index.prune(key, uidvalidity)
+        if removed:
+            log.warning("UIDVALIDITY changed for %s, dropped %s indexed headers", key, removed)
+        return key, uidvalidity
 
-                # Get full email text
-                def get_text(eid):
-                    try:
-                        result, msg_data = self.mail.fetch(eid, "(RFC822)")
-                        raw_email = msg_data[0][1]
-                        msg = email.message_from_bytes(raw_email)
-                        
-                        text_content = ""
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                if part.get_content_type() == "text/plain":
-                                    payload = part.get_payload(decode=True)
-                                    if payload:
-                                        text_content = payload.decode(errors="ignore")
-                                        break
-                                elif part.get_content_type() == "text/html" and not text_content:
-                                    payload = part.get_payload(decode=True)
-                                    if payload:
-                                        text_content = payload.decode(errors="ignore")
-                        else:
-                            payload = msg.get_payload(decode=True)
-                            if payload:
-                                text_content = payload.decode(errors="ignore")
-                        
-                        return text_content
-                    except Exception as e:
-                        print(f"Error getting text for email {eid}: {e}")
-                        return ""
+    def commit_sync(self, state):
+        """Persist the high-water mark reached by the last fully consumed iter_new_messages"""
+        pending = getattr(self, "pending_sync", None)
+        if pending:
+            state.set(*pending)
+            self.pending_sync = None
 
-                id_str = mid.decode() if isinstance(mid, bytes) else str(mid)
-                email_text = get_text(id_str)
-                
-                results.append({
-                    "id": id_str,
-                    "subject": subject,
-                    "from": from_field,
-                    "date": msg.get("Date", "").strip(),
-                    "text": email_text
-                })
-                
-                print(f"✓ Added: {subject} | From: {from_field}")
-                
-            except Exception as e:
-                print(f"Error processing email {mid}: {e}")
-                continue
+    def _build_keyword_criteria(self, keywords):
+        """Build an IMAP OR chain of SUBJECT criteria for the given keywords"""
+        return self._or_criteria("SUBJECT", keywords)
 
-        print(f"Final results: {len(results)} emails after filtering")
-        return results
+    def _or_criteria(self, key, values):
+        """IMAP OR chain of `key` criteria, e.g. SUBJECT or FROM, matching any of the values"""
+        if not values:
+            return []
+        
+        if len(values) == 1:
+            return [key, values[0]]
+        
+        # Build proper OR chain: OR (SUBJECT kw1) (SUBJECT kw2) for 2 keywords
+        # For more keywords: OR (OR (SUBJECT kw1) (SUBJECT kw2)) (SUBJECT kw3)
+        result = ["OR", [key, values[0]], [key, values[1]]]
+        for value in values[2:]:
+            result = ["OR", result, [key, value]]
+        return result
+
+    def _sender_criteria(self, mailbox):
+        """
+        (criteria, narrowed_since): a FROM constraint for searches of `mailbox` when
+        narrow_from is on and the header index shows the matching mail comes from a
+        few senders that send little of the rest, [] otherwise. Receipts from a
+        sender the index has never seen match no longer while it is in place, hence
+        opt-in; the constraint expires after HeaderIndex.sender_filter_max_age, and
+        that search runs without it. narrowed_since is then when it was chosen,
+        else None.
+        """
+        if not self.narrow_from or self.header_index is None:
+            return [], None
+        key = f"{self.email}/{mailbox}"
+        expired = self.header_index.expire_sender_filter(key)
+        if expired is not None:
+            narrowed_since = datetime.fromtimestamp(expired)
+            log.warning("FROM constraint of %s expired, searching without it since %s", key, narrowed_since.date())
+            return [], narrowed_since
+        senders = self.header_index.sender_filter(key)
+        if senders:
+            log.info("Narrowing the search of %s to FROM %s; mail from other senders is skipped", key, senders)
+        return self._or_criteria("FROM", senders), None
 
     def _flatten_criteria(self, criteria):
         """Convert nested criteria list to flat list for IMAP"""
@@ -210,6 +412,308 @@ class Email():
                 result.append(item)
         return result
 
+    def _decode_subject(self, msg):
+        """Decode a possibly RFC 2047 encoded Subject header into a plain string"""
+        subject_parts = decode_header(msg.get("Subject", ""))
+        return "".join(
+            s.decode(enc or "utf-8", errors="ignore") if isinstance(s, bytes) else s
+            for s, enc in subject_parts
+        ).strip()
+
+    def _subject_matches(self, subject, keywords, pattern, require_all_keywords):
+        """Local keyword and regex filter applied on top of the IMAP search"""
+        subj_lc = subject.lower()
+        if keywords:
+            if require_all_keywords:
+                if not all(k.lower() in subj_lc for k in keywords):
+                    return False
+            else:
+                if not any(k.lower() in subj_lc for k in keywords):
+                    return False
+
+        # Only apply regex if provided
+        if pattern and not pattern.search(subject):
+            return False
+        return True
+
+    def _raw_text(self, raw_email):
+        """MIME-parse raw RFC822 bytes and return their text, timed as the mime_decode stage"""
+        with metrics.stage('mime_decode', items=1, nbytes=len(raw_email)):
+            return self._message_text(email.message_from_bytes(raw_email))
+
+    def _message_text(self, msg):
+        """Pull the text/plain part (falling back to text/html) out of a parsed message"""
+        text_content = ""
+        if msg.is_multipart():
+            for part in msg.walk():
+                if part.get_content_type() == "text/plain":
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        text_content = payload.decode(errors="ignore")
+                        break
+                elif part.get_content_type() == "text/html" and not text_content:
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        # HTML-only receipt: flatten the markup so the extraction regexes see text
+                        text_content = html_to_text(payload.decode(errors="ignore"))
+        else:
+            payload = msg.get_payload(decode=True)
+            if payload:
+                text_content = payload.decode(errors="ignore")
+                if msg.get_content_type() == "text/html":
+                    text_content = html_to_text(text_content)
+        return text_content
+
+    def _get_text(self, eid):
+        """Fetch the full message for a single id and return its text body"""
+        try:
+            with metrics.stage('imap_fetch', items=1) as stage:
+                result, msg_data = self.mail.fetch(eid, "(RFC822)")
+                raw_email = msg_data[0][1]
+                stage.add(nbytes=len(raw_email))
+            return self._raw_text(raw_email)
+        except Exception as e:
+            log.warning("Error getting text for email %s: %s", eid, e)
+            return ""
+
+    @staticmethod
+    def _message_sets(ids, size):
+        """
+        Split sorted message ids into chunks of at most `size` ids and render each
+        chunk as a compact IMAP message set, collapsing consecutive runs into ranges.
+
+        >>> list(Email._message_sets([b'1', b'2', b'3', b'7'], 500))
+        [(['1', '2', '3', '7'], '1:3,7')]
+        """
+        ids = [i.decode() if isinstance(i, bytes) else str(i) for i in ids]
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            spans = []
+            run_start = prev = int(chunk[0])
+            for num in map(int, chunk[1:]):
+                if num == prev + 1:
+                    prev = num
+                    continue
+                spans.append(f"{run_start}:{prev}" if run_start != prev else str(run_start))
+                run_start = prev = num
+            spans.append(f"{run_start}:{prev}" if run_start != prev else str(run_start))
+            yield chunk, ",".join(spans)
+
+    def _fetch_set(self, message_set, parts, uid=False):
+        """
+        Issue a single FETCH for a whole message set and return {id: payload bytes}.
+        imaplib returns one (meta, payload) tuple per message followed by b')'.
+        With uid=True the set holds UIDs and the result is keyed by UID.
+        """
+        with metrics.stage('imap_fetch') as stage:
+            if uid:
+                status, msg_data = self.mail.uid("FETCH", message_set, parts)
+            else:
+                status, msg_data = self.mail.fetch(message_set, parts)
+            if status != "OK" or not msg_data:
+                return {}
+            id_regex = FETCH_UID_REGEX if uid else FETCH_SEQ_REGEX
+            payloads = {}
+            for item in msg_data:
+                if not isinstance(item, tuple) or len(item) < 2:
+                    continue
+                found = id_regex.search(item[0]) if uid else id_regex.match(item[0])
+                if found:
+                    payloads[found.group(1).decode()] = item[1]
+            stage.add(items=len(payloads), nbytes=sum(len(p) for p in payloads.values()))
+        return payloads
+
+    def _fetch_text_parts(self, ids, uid=False):
+        """
+        Two-stage body fetch: one FETCH (BODYSTRUCTURE) for the whole set, then one
+        BODY.PEEK[section] per distinct text part section (usually a single command),
+        so inline images, attachments and the HTML alternative are never downloaded.
+        Returns {id: text} for the ids whose text part could be located; the caller
+        falls back to RFC822 for the rest.
+        """
+        _, message_set = next(self._message_sets(ids, len(ids)))
+        try:
+            with metrics.stage('imap_fetch'):
+                if uid:
+                    status, data = self.mail.uid("FETCH", message_set, "(BODYSTRUCTURE)")
+                else:
+                    status, data = self.mail.fetch(message_set, "(BODYSTRUCTURE)")
+        except Exception as e:
+            log.warning("Error fetching body structure for %s: %s", message_set, e)
+            return {}
+        if status != "OK":
+            return {}
+        structures = parse_bodystructures(data, FETCH_UID_REGEX if uid else FETCH_SEQ_REGEX, uid=uid)
+
+        texts = {}
+        for section, members in self._group_text_parts(ids, structures).items():
+            _, section_set = next(self._message_sets([id_str for id_str, _ in members], len(members)))
+            try:
+                payloads = self._fetch_set(section_set, f"(BODY.PEEK[{section}])", uid=uid)
+            except Exception as e:
+                log.warning("Error fetching part %s for %s: %s", section, section_set, e)
+                continue
+            for id_str, part in members:
+                if id_str in payloads:
+                    with metrics.stage('mime_decode', items=1, nbytes=len(payloads[id_str])):
+                        texts[id_str] = part_text(payloads[id_str], part)
+        return texts
+
+    @staticmethod
+    def _group_text_parts(ids, structures):
+        """{section: [(id, part)]} of the text part to download for each id, so one FETCH covers a section"""
+        by_section = {}
+        for id_str in ids:
+            part = text_part(structures[id_str]) if id_str in structures else None
+            if part is not None:
+                by_section.setdefault(part[0], []).append((id_str, part))
+        return by_section
+
+    def _collect_batched(self, ids, keywords, pattern, require_all_keywords, header_batch_size, body_batch_size,
+                         uid=False, scope=None):
+        """Batched header filtering followed by chunked body fetches; same result dicts as the per-id path"""
+        return [hit for batch in self._iter_batched(ids, keywords, pattern, require_all_keywords,
+                                                    header_batch_size, body_batch_size, uid=uid, scope=scope)
+                for hit in batch]
+
+    def _match_headers(self, ids, headers, keywords, pattern, require_all_keywords):
+        """Result dicts (without text) for the ids whose fetched header passes the subject filter"""
+        matched = []
+        for id_str in ids:
+            raw_header = headers.get(id_str)
+            if not raw_header:
+                continue
+            msg = email.message_from_bytes(raw_header)
+            subject = self._decode_subject(msg)
+            if not self._subject_matches(subject, keywords, pattern, require_all_keywords):
+                continue
+            matched.append({
+                "id": id_str,
+                "subject": subject,
+                "from": msg.get("From", "").strip(),
+                "date": msg.get("Date", "").strip(),
+                "text": ""
+            })
+        return matched
+
+    def _fetch_uids(self, message_set):
+        """{sequence number: UID} for a message set, in one FETCH (UID)"""
+        with metrics.stage('imap_fetch'):
+            status, data = self.mail.fetch(message_set, "(UID)")
+        if status != "OK" or not data:
+            return {}
+        uids = {}
+        for item in data:
+            line = item[0] if isinstance(item, tuple) else item
+            if not isinstance(line, bytes):
+                continue
+            seq, uid = FETCH_SEQ_REGEX.match(line), FETCH_UID_REGEX.search(line)
+            if seq and uid:
+                uids[seq.group(1).decode()] = int(uid.group(1))
+        return uids
+
+    def _match_indexed(self, ids, message_set, scope, keywords, pattern, require_all_keywords, uid=False):
+        """
+        _match_headers through the header index: verdicts of UIDs indexed before are
+        read locally (and recomputed from the stored subject if the filter changed),
+        only the headers of unseen UIDs are fetched, and those are indexed.
+        Sequence-number searches first map the chunk to UIDs with one FETCH (UID).
+        """
+        mailbox, uidvalidity = scope
+        uids = {id_str: int(id_str) for id_str in ids} if uid else self._fetch_uids(message_set)
+        signature = filter_signature(keywords, pattern, require_all_keywords)
+        with metrics.stage('header_index') as stage:
+            known = self.header_index.get_many(mailbox, uidvalidity, uids.values())
+            stage.add(items=len(known))
+        unseen = [id_str for id_str in ids if id_str in uids and uids[id_str] not in known]
+        headers = {}
+        if unseen:
+            _, unseen_set = next(self._message_sets(unseen, len(unseen)))
+            headers = self._fetch_set(unseen_set, HEADER_FIELDS, uid=uid)
+
+        updates = {}
+        matched = []
+        for id_str in ids:
+            # No UID: expunged since the search
+            if id_str not in uids:
+                continue
+            entry = known.get(uids[id_str])
+            if entry is None:
+                raw_header = headers.get(id_str)
+                if not raw_header:
+                    continue
+                msg = email.message_from_bytes(raw_header)
+                entry = {"subject": self._decode_subject(msg), "from": msg.get("From", "").strip(),
+                         "date": msg.get("Date", "").strip(), "signature": None}
+            if entry["signature"] != signature:
+                entry["verdict"] = self._subject_matches(entry["subject"], keywords, pattern, require_all_keywords)
+                entry["signature"] = signature
+                updates[uids[id_str]] = entry
+            if entry["verdict"]:
+                matched.append({"id": id_str, "subject": entry["subject"], "from": entry["from"],
+                                "date": entry["date"], "text": ""})
+        self.header_index.put_many(mailbox, uidvalidity, updates)
+        return matched
+
+    def _iter_batched(self, ids, keywords, pattern, require_all_keywords, header_batch_size, body_batch_size,
+                      uid=False, scope=None, failed=None):
+        """
+        Fetch headers one message-set chunk at a time and yield the matching hits in body-sized batches.
+        With a header index and the (mailbox key, UIDVALIDITY) `scope` of the selected mailbox,
+        headers already indexed are not fetched again. A chunk whose fetch fails is logged and
+        skipped; its ids are appended to the `failed` list when one is given.
+        """
+        for chunk, message_set in self._message_sets(ids, header_batch_size):
+            try:
+                if self.header_index is not None and scope is not None:
+                    matched = self._match_indexed(chunk, message_set, scope, keywords, pattern,
+                                                  require_all_keywords, uid=uid)
+                else:
+                    headers = self._fetch_set(message_set, HEADER_FIELDS, uid=uid)
+                    matched = self._match_headers(chunk, headers, keywords, pattern, require_all_keywords)
+            except Exception as e:
+                log.warning("Error fetching headers for %s: %s", message_set, e)
+                if failed is not None:
+                    failed.extend(chunk)
+                continue
+
+            for start in range(0, len(matched), body_batch_size):
+                hits = matched[start:start + body_batch_size]
+                texts = self._fetch_text_parts([h["id"] for h in hits], uid=uid) if self.mime_parts else {}
+                # Messages without a usable text part (or mime_parts off) are fetched whole
+                rest = [h["id"] for h in hits if h["id"] not in texts]
+                bodies = {}
+                unfetched = set()
+                if rest:
+                    _, body_set = next(self._message_sets(rest, body_batch_size))
+                    try:
+                        bodies = self._fetch_set(body_set, "(RFC822)", uid=uid)
+                    except Exception as e:
+                        log.warning("Error fetching bodies for %s: %s", body_set, e)
+                        if failed is not None:
+                            failed.extend(rest)
+                            unfetched.update(rest)
+
+                batch = []
+                for hit in hits:
+                    raw_email = bodies.get(hit["id"])
+                    if hit["id"] in texts:
+                        hit["text"] = texts[hit["id"]]
+                    elif hit["id"] in unfetched:
+                        # Reported as failed, not mistaken for an expunged message
+                        continue
+                    elif raw_email is None and not uid:
+                        # Server skipped this id in the batch, fall back to a single fetch
+                        hit["text"] = self._get_text(hit["id"])
+                    elif raw_email is None:
+                        # Message was expunged between the header and body fetch
+                        continue
+                    else:
+                        hit["text"] = self._raw_text(raw_email)
+                    batch.append(hit)
+                    log.debug("✓ Added: %s | From: %s", hit['subject'], hit['from'])
+                yield batch
+
     # NEW: Additional search methods for debugging
     def search_simple_date_range(self, from_date, to_date):
         """Simple date range search without keywords or regex"""
@@ -255,7 +759,7 @@ class Email():
                     "text": ""  # Don't fetch text for debugging
                 })
             except Exception as e:
-                print(f"Error in simple search for {mid}: {e}")
+                log.warning("Error in simple search for %s: %s", mid, e)
                 continue
 
         return results
\ No newline at end of file
@@ -0,0 +1,112 @@
+import re
+import json
+import hashlib
+from utils.utils import ADDRESS_PATTERN
+
+
+# Bump whenever extract() changes behaviour, so cached parse results are invalidated
+ENGINE_VERSION = 1
+
+
+# (trip key, label key in uberMailParser.yaml, regex key in UberBillAttr.Regex)
+LABEL_FIELDS = [
+    ('total', 'Total', 'PriceRegex'),
+    ('tripFare', 'Trip_Fare', 'PriceRegex'),
+    ('subtotal', 'Subtotal', 'PriceRegex'),
+    ('insurance', 'Insurance', 'PriceRegex'),
+    ('HST', 'HST', 'PriceRegex'),
+    ('TNC', 'tnc_recovery_fees', 'PriceRegex'),
+    ('driver', 'driver', 'DriverRegex'),
+    ('driverRating', 'driverRating', 'RatingRegex'),
+]
+
+
+class ExtractionEngine():
+    """
+    Single-pass receipt extractor built from uberMailParser.yaml.
+
+    Every label and value regex is compiled once when the engine is built. extract()
+    splits the email once and walks the lines a single time, filling each field from
+    the first line that carries its label, the distance/duration line and the first
+    two address lines. The result is identical to the per-field find_text,
+    find_distance_duration and pickUpDropOffInfo scans used by TripParser.
+    """
+    def __init__(self, parserConfig):
+        attrs = parserConfig['UberBillAttr']
+        regexes = attrs['Regex']
+        self.fields = [
+            (key, attrs[labelKey], re.compile(regexes[regexKey]))
+            for key, labelKey, regexKey in LABEL_FIELDS
+        ]
+        self.distanceLabel = attrs['distance']
+
+        # One C-level search tells us whether a line holds any label at all, so the
+        # per-field substring checks only run on the handful of lines that matter
+        labels = [label for _, label, _ in self.fields] + [self.distanceLabel]
+        self.anyLabel = re.compile('|'.join(re.escape(label) for label in labels))
+
+        # Hash of exactly what extract() depends on: editing unrelated keys in the
+        # yaml keeps it stable, changing a label or regex changes it
+        self.fingerprint = hashlib.sha256(json.dumps({
+            'version': ENGINE_VERSION,
+            'fields': [(key, label, regex.pattern) for key, label, regex in self.fields],
+            'distance': self.distanceLabel,
+            'address': ADDRESS_PATTERN.pattern,
+        }, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _pick_word(line, regex):
+        # Mirrors find_text: first word matching the regex, else the last word on the line
+        word = ''
+        for word in line.split():
+            if regex.search(word):
+                break
+        return word
+
+    def extract(self, emailText):
+        lines = emailText.split('\n')
+        values = {key: '' for key, _, _ in self.fields}
+        pending = self.fields
+        distance = duration = ''
+        distancePending = True
+        addresses = []
+        times = []
+
+        for index, line in enumerate(lines):
+            if (pending or distancePending) and self.anyLabel.search(line):
+                if pending:
+                    remaining = []
+                    for field in pending:
+                        key, label, regex = field
+                        if label in line:
+                            values[key] = self._pick_word(line, regex)
+                        else:
+                            remaining.append(field)
+                    pending = remaining
+                if distancePending and self.distanceLabel in line:
+                    distDurSplit = line.split('|')
+                    distance = distDurSplit[0]
+                    duration = distDurSplit[1][:-1]
+                    distancePending = False
+
+            if len(addresses) < 2:
+                stripped = line.lstrip()
+                if stripped and stripped[0].isdigit():
+                    addressMatch = ADDRESS_PATTERN.match(line)
+                    if addressMatch:
+                        addresses.append(addressMatch.groupdict())
+                        times.append(lines[index - 1])
+            elif not pending and not distancePending:
+                break
+
+        addresses += [{}] * (2 - len(addresses))
+        times += [''] * (2 - len(times))
+
+        trip = values
+        trip['distance'] = distance
+        trip['duration'] = duration
+        trip['pickupLocation'] = addresses[0]
+        trip['dropOffLocation'] = addresses[1]
+        trip['pickUpTime'] = times[0][:-1]
+        trip['dropTime'] = times[1][:-1]
+        return trip
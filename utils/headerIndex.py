@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from email.utils import parseaddr
+
+
+# A stored FROM constraint is dropped after this long, so one search runs without it
+# and picks up senders that started sending receipts since it was chosen
+SENDER_FILTER_MAX_AGE = 7 * 24 * 3600
+
+def filter_signature(keywords, pattern, require_all_keywords):
+    """Identifies the subject filter a verdict was computed with"""
+    regex = pattern.pattern if hasattr(pattern, 'pattern') else pattern
+    data = json.dumps([sorted(k.lower() for k in keywords or []), regex or '', bool(require_all_keywords)])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+def sender_address(from_field):
+    """'Uber Receipts <noreply@uber.com>' -> 'noreply@uber.com'"""
+    return parseaddr(from_field or '')[1].lower()
+
+
+class HeaderIndex():
+    """
+    Persistent index of the mailbox headers already fetched, in a local SQLite file.
+
+    Rows are keyed by (mailbox, UIDVALIDITY, UID) and hold the decoded subject,
+    From and Date headers plus the subject filter's verdict, so a later search only
+    downloads and decodes the headers of UIDs it has not seen before. A verdict
+    computed under another keyword/regex filter is recomputed from the stored
+    subject, without asking the server. When a mailbox reports a new UIDVALIDITY
+    its old rows are dropped, since the UIDs no longer name the same messages.
+
+    sender_filter() is the selectivity estimate behind the optional server-side
+    FROM constraint: if every matching message came from a few senders and those
+    senders account for a small share of all the candidates the SUBJECT search
+    returns, searching FROM them as well narrows what the server sends back. A
+    constraint older than `sender_filter_max_age` seconds expires (see
+    expire_sender_filter), so new senders are not shut out for good.
+
+    Usage:
+        index = HeaderIndex('./config/headerIndex.sqlite')
+        client = Email(address, app_password, 'imap.gmail.com', header_index=index)
+        ...
+        print(index.stats())
+    """
+    def __init__(self, path, sender_filter_max_age=SENDER_FILTER_MAX_AGE):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.sender_filter_max_age = sender_filter_max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Shared by every connection of an ImapConnectionPool
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS headers (
+                mailbox TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                subject TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                from_field TEXT NOT NULL,
+                date TEXT NOT NULL,
+                verdict INTEGER NOT NULL,
+                signature TEXT NOT NULL,
+                PRIMARY KEY (mailbox, uidvalidity, uid)
+            ) WITHOUT ROWID""")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS sender_filters (
+                mailbox TEXT PRIMARY KEY,
+                senders TEXT NOT NULL,
+                share REAL NOT NULL,
+                decided REAL NOT NULL
+            )""")
+        self._db.commit()
+
+    def get_many(self, mailbox, uidvalidity, uids):
+        """{uid: header dict} for the uids already indexed under mailbox/uidvalidity"""
+        uids = [int(uid) for uid in uids]
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(uids), 500):
+                chunk = uids[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                rows = self._db.execute(f'SELECT uid, subject, from_field, date, verdict, signature FROM headers '
+                                        f'WHERE mailbox = ? AND uidvalidity = ? AND uid IN ({marks})',
+                                        [mailbox, uidvalidity, *chunk]).fetchall()
+                found.update((uid, {'subject': subject, 'from': from_field, 'date': date, 'verdict': bool(verdict),
+                                    'signature': signature})
+                             for uid, subject, from_field, date, verdict, signature in rows)
+            self.hits += len(found)
+            self.misses += len(uids) - len(found)
+        return found
+
+    def put_many(self, mailbox, uidvalidity, entries):
+        """Store {uid: header dict with subject, from, date, verdict, signature}"""
+        if not entries:
+            return
+        rows = [(mailbox, uidvalidity, int(uid), entry['subject'], sender_address(entry['from']), entry['from'],
+                 entry['date'], int(entry['verdict']), entry['signature']) for uid, entry in entries.items()]
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO headers (mailbox, uidvalidity, uid, subject, sender, '
+                                 'from_field, date, verdict, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.commit()
+
+    def prune(self, mailbox, uidvalidity):
+        """Drop the rows of `mailbox` indexed under any other UIDVALIDITY; returns the number removed"""
+        with self._lock:
+            removed = self._db.execute('DELETE FROM headers WHERE mailbox = ? AND uidvalidity != ?',
+                                       (mailbox, uidvalidity)).rowcount
+            if removed:
+                self._db.execute('DELETE FROM sender_filters WHERE mailbox = ?', (mailbox,))
+            self._db.commit()
+        return removed
+
+    def sender_filter(self, mailbox, max_senders=3, min_matches=20, max_share=0.5):
+        """
+        Sender addresses to add as a FROM constraint to the searches of `mailbox`, or [].
+
+        Narrowing is chosen when at least `min_matches` indexed messages passed the
+        subject filter, all of them came from at most `max_senders` addresses, and
+        those addresses sent at most `max_share` of the indexed candidates. Once
+        chosen the constraint is stored and reused: later narrowed searches only
+        index mail from those senders, so the estimate could not be redone from
+        them. It lasts until expire_sender_filter() drops it; invalidate() (or a
+        new UIDVALIDITY) starts over.
+        """
+        with self._lock:
+            stored = self._db.execute('SELECT senders FROM sender_filters WHERE mailbox = ?', (mailbox,)).fetchone()
+            if stored:
+                return json.loads(stored[0])
+            rows = self._db.execute('SELECT sender, SUM(verdict), COUNT(*) FROM headers WHERE mailbox = ? '
+                                    'GROUP BY sender', (mailbox,)).fetchall()
+            candidates = sum(count for _, _, count in rows)
+            matched = [(sender, hits, count) for sender, hits, count in rows if hits]
+            matches = sum(hits for _, hits, _ in matched)
+            if not candidates or matches < min_matches or len(matched) > max_senders:
+                return []
+            # An address-less From cannot be searched for
+            if any(not sender for sender, _, _ in matched):
+                return []
+            share = sum(count for _, _, count in matched) / candidates
+            if share > max_share:
+                return []
+            senders = sorted(sender for sender, _, _ in matched)
+            self._db.execute('INSERT OR REPLACE INTO sender_filters (mailbox, senders, share, decided) '
+                             'VALUES (?, ?, ?, ?)', (mailbox, json.dumps(senders), share, time.time()))
+            self._db.commit()
+        return senders
+
+    def expire_sender_filter(self, mailbox, max_age=None):
+        """
+        Drop the FROM constraint of `mailbox` once it is older than `max_age` seconds
+        (default: sender_filter_max_age). Returns the time (epoch seconds) it was
+        chosen when it expired, else None; the search that follows should run without
+        a constraint from then on, and only after it has indexed the un-narrowed
+        candidates should sender_filter() decide again.
+        """
+        max_age = self.sender_filter_max_age if max_age is None else max_age
+        with self._lock:
+            stored = self._db.execute('SELECT decided FROM sender_filters WHERE mailbox = ?', (mailbox,)).fetchone()
+            if not stored or time.time() - stored[0] < max_age:
+                return None
+            self._db.execute('DELETE FROM sender_filters WHERE mailbox = ?', (mailbox,))
+            self._db.commit()
+        return stored[0]
+
+    def invalidate(self, mailbox=None):
+        """Drop every row (or every row of `mailbox`) and the stored FROM constraints; returns the number removed"""
+        with self._lock:
+            if mailbox is None:
+                removed = self._db.execute('DELETE FROM headers').rowcount
+                self._db.execute('DELETE FROM sender_filters')
+            else:
+                removed = self._db.execute('DELETE FROM headers WHERE mailbox = ?', (mailbox,)).rowcount
+                self._db.execute('DELETE FROM sender_filters WHERE mailbox = ?', (mailbox,))
+            self._db.commit()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            count = self._db.execute('SELECT COUNT(*) FROM headers').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {'entries': count, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,170 @@
+import gzip
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.parsePool import parse_trips
+
+
+_DONE = object()
+
+
+class IngestPipeline():
+    """
+    Streaming fetch -> filter -> parse -> compress -> bulk insert pipeline.
+
+    The fetch stage drains a generator of hit batches (e.g.
+    Email.iter_search_by_date_range_keywords_regex or Email.iter_new_messages, which
+    already apply the subject filter), the parse stage turns each batch into
+    compressed trip dicts and the write stage groups trips into insert batches.
+    Stages run in their own threads and are connected by bounded queues, so fetch,
+    parse and write overlap while at most `queue_size` batches wait between any
+    two stages. Peak memory depends on the batch sizes, not on the mailbox size.
+
+    Usage:
+        pipeline = IngestPipeline(dbOps, dbName, collectionName, insert_batch_size=500)
+        stats = pipeline.run(client.iter_search_by_date_range_keywords_regex(...))
+    """
+    def __init__(self, dbOps, db, collection, compressionAlgo=gzip, insert_batch_size=500, queue_size=4,
+                 parse_workers=1, keyFields=None, parse_cache=None, dedup=None):
+        self.dbOps = dbOps
+        self.db = db
+        self.collection = collection
+        self.compressionAlgo = compressionAlgo
+        self.insert_batch_size = insert_batch_size
+        self.queue_size = queue_size
+        self.parse_workers = parse_workers
+        # With the unique index fields set, batches go through bulk_upsert instead of insert
+        self.keyFields = keyFields
+        # Optional ParseCache consulted before parsing each batch
+        self.parse_cache = parse_cache
+        # Optional TripDeduplicator: trips whose fingerprint is already stored are dropped before the write
+        self.dedup = dedup
+
+    def run(self, batches):
+        """
+        Push every batch from `batches` through the pipeline.
+
+        Returns:
+            Dict containing 'emails', 'trips', 'insert_batches', 'failures' (parse
+            failures as reported by parse_trips) and 'elapsed' seconds. When
+            keyFields is set it also sums the bulk_upsert 'inserted', 'matched',
+            'duplicate' and 'failed' counts. 'prefiltered' counts trips the dedup
+            filter dropped without a round trip.
+
+        Raises:
+            The first exception raised by any stage, after all stages have stopped.
+        """
+        hitQueue = queue.Queue(maxsize=self.queue_size)
+        tripQueue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        stats = {'emails': 0, 'trips': 0, 'insert_batches': 0, 'inserted': 0, 'matched': 0, 'duplicate': 0,
+                 'failed': 0, 'prefiltered': 0, 'failures': [], 'elapsed': 0.0}
+        start = time.perf_counter()
+
+        def put(q, item):
+            # Bounded put that gives up once another stage has failed
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def fetch_stage():
+            try:
+                for batch in batches:
+                    if batch:
+                        stats['emails'] += len(batch)
+                        if not put(hitQueue, batch):
+                            return
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(hitQueue, _DONE)
+
+        def parse_stage(executor):
+            try:
+                while True:
+                    batch = get(hitQueue)
+                    if batch is _DONE:
+                        break
+                    trips, failures = parse_trips(batch, workers=self.parse_workers,
+                                                  compressionAlgo=self.compressionAlgo, executor=executor,
+                                                  cache=self.parse_cache)
+                    stats['failures'].extend(failures)
+                    if trips and not put(tripQueue, trips):
+                        return
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(tripQueue, _DONE)
+
+        def write_stage():
+            pending = []
+            try:
+                while True:
+                    trips = get(tripQueue)
+                    if trips is _DONE:
+                        break
+                    pending.extend(trips)
+                    while len(pending) >= self.insert_batch_size:
+                        self._write(pending[:self.insert_batch_size], stats)
+                        pending = pending[self.insert_batch_size:]
+                if pending and not stop.is_set():
+                    self._write(pending, stats)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        executor = ProcessPoolExecutor(max_workers=self.parse_workers) if self.parse_workers > 1 else None
+        try:
+            threads = [
+                threading.Thread(target=fetch_stage, name='ingest-fetch', daemon=True),
+                threading.Thread(target=parse_stage, args=(executor,), name='ingest-parse', daemon=True),
+            ]
+            for thread in threads:
+                thread.start()
+            write_stage()
+            for thread in threads:
+                thread.join()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        stats['elapsed'] = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        return stats
+
+    def _write(self, trips, stats):
+        stats['trips'] += len(trips)
+        stats['insert_batches'] += 1
+        if self.dedup is not None:
+            trips, duplicates = self.dedup.filter(trips, self.dbOps, self.db, self.collection)
+            stats['prefiltered'] += len(duplicates)
+            if not trips:
+                return
+        if self.keyFields:
+            result = self.dbOps.bulk_upsert(trips, self.db, self.collection, self.keyFields,
+                                            batch_size=self.insert_batch_size)
+            for name in ('inserted', 'matched', 'duplicate', 'failed'):
+                stats[name] += result[f'{name}_count']
+            written = result['upserted_records']
+        else:
+            written = self.dbOps.insert(trips, self.db, self.collection)['inserted_records']
+        if self.dedup is not None:
+            self.dedup.record(written)
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import mmap
+import bisect
+import hashlib
+from datetime import datetime, timedelta
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+
+from utils.email_agent import Email
+from utils.metrics import get_logger, metrics
+
+
+# End of the header block; mbox files usually use bare \n, .eml files CRLF
+HEADER_END_REGEX = re.compile(rb'\r?\n\r?\n')
+LONE_LF_REGEX = re.compile(r'(?<!\r)\n')
+INDEX_VERSION = 2
+
+log = get_logger('localMailbox')
+
+
+class LocalMailbox(Email):
+    """
+    Offline stand-in for Email that reads a local archive instead of logging in to
+    IMAP: a Maildir (cur/ and new/), an mbox file, a directory of .eml files, or a
+    single .eml file. search_by_date_range_keywords_regex and
+    iter_search_by_date_range_keywords_regex return the same result dicts and
+    batches as Email, so backfills, parser regression runs and benchmarks can
+    replay an archive through TripParser and DBOperations with no network.
+
+    On first use the archive is indexed once: the position (file, start, end) of
+    every message together with its decoded subject, From and Date, sorted by
+    date. An mbox is memory-mapped and split on its "From " lines, so only the
+    headers of each message are parsed; bodies are read from the map for the
+    messages that pass the date range and subject filter. With index_dir the
+    index is saved and reused while the archive's size and mtime are unchanged.
+    Message ids (and so trip eids) are 'archive:<Message-ID>', or 'archive:sha256:<digest
+    of the raw message>' without one: they do not collide with IMAP UIDs and do not
+    shift when the archive gains or loses messages.
+
+    Usage:
+        client = LocalMailbox('~/Mail/uber.mbox')
+        hits = client.search_by_date_range_keywords_regex(from_date, to_date, keywords, subject_regex)
+    """
+    def __init__(self, path, index_dir=None):
+        super().__init__('', '', path)
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.index_dir = index_dir
+        self.entries = None
+        self._dates = None
+        self._maps = {}
+
+    def login(self):
+        self._load_index()
+        return self
+
+    def logout(self):
+        for handle, mapped in self._maps.values():
+            mapped.close()
+            handle.close()
+        self._maps = {}
+        log.info('Closed local archive %s', self.path)
+
+    # --- index ---
+
+    def _files(self):
+        """(path, is_mbox) for every message file of the archive, in archive order"""
+        if os.path.isfile(self.path):
+            return [(self.path, not self.path.lower().endswith('.eml'))]
+        if os.path.isdir(os.path.join(self.path, 'cur')) or os.path.isdir(os.path.join(self.path, 'new')):
+            # Maildir: one message per file, tmp/ holds deliveries in progress
+            return [(os.path.join(self.path, sub, name), False) for sub in ('cur', 'new')
+                    if os.path.isdir(os.path.join(self.path, sub))
+                    for name in sorted(os.listdir(os.path.join(self.path, sub))) if not name.startswith('.')]
+        return [(os.path.join(self.path, name), False) for name in sorted(os.listdir(self.path))
+                if name.lower().endswith('.eml')]
+
+    def _map(self, path):
+        if path not in self._maps:
+            handle = open(path, 'rb')
+            self._maps[path] = (handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[path][1]
+
+    @staticmethod
+    def _mbox_spans(data):
+        """(start, end) of every message body after its "From " separator line"""
+        starts = []
+        pos = 0 if data[:5] == b'From ' else data.find(b'\nFrom ')
+        while pos != -1:
+            line_end = data.find(b'\n', pos + 1)
+            if line_end == -1:
+                break
+            starts.append((pos, line_end + 1))
+            pos = data.find(b'\nFrom ', line_end)
+        # A message ends at the newline that precedes the next separator
+        ends = [separator for separator, _ in starts[1:]] + [len(data)]
+        return [(start, end) for (_, start), end in zip(starts, ends)]
+
+    def _index_entry(self, path, start, end, data, is_mbox):
+        found = HEADER_END_REGEX.search(data, start, end)
+        header = BytesHeaderParser().parsebytes(data[start:found.end() if found else end])
+        date = header.get('Date', '').strip()
+        try:
+            # IMAP SINCE/BEFORE compare the calendar day, so index on the day in the sender's timezone
+            day = parsedate_to_datetime(date).date().isoformat()
+        except (TypeError, ValueError, IndexError):
+            day = ''
+        return {'id': self._message_id(header, data, start, end), 'file': path, 'mbox': is_mbox,
+                'start': start, 'end': end, 'day': day, 'date': date,
+                'subject': self._decode_subject(header), 'from': header.get('From', '').strip()}
+
+    @staticmethod
+    def _message_id(header, data, start, end):
+        """'archive:' namespaced Message-ID, else a digest of the raw message"""
+        message_id = (header.get('Message-ID') or '').strip().strip('<>').strip()
+        if message_id:
+            return f'archive:{message_id}'
+        return f'archive:sha256:{hashlib.sha256(data[start:end]).hexdigest()}'
+
+    def _build_index(self):
+        entries = []
+        for path, is_mbox in self._files():
+            if os.path.getsize(path) == 0:
+                continue
+            if is_mbox:
+                data = self._map(path)
+                for start, end in self._mbox_spans(data):
+                    entries.append(self._index_entry(path, start, end, data, True))
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                entries.append(self._index_entry(path, 0, len(data), data, False))
+        return entries
+
+    def _signature(self):
+        # Size and mtime of every file; any change rebuilds the index
+        return [[path, os.path.getsize(path), os.path.getmtime(path)] for path, _ in self._files()]
+
+    def _index_path(self):
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', self.path.strip(os.sep))
+        return os.path.join(self.index_dir, f'{name}.index.json')
+
+    def _load_index(self):
+        if self.entries is not None:
+            return self.entries
+        entries = None
+        signature = self._signature() if self.index_dir else None
+        if self.index_dir and os.path.exists(self._index_path()):
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('version') == INDEX_VERSION and saved.get('signature') == signature:
+                entries = saved['entries']
+        if entries is None:
+            entries = self._build_index()
+            if self.index_dir:
+                os.makedirs(self.index_dir, exist_ok=True)
+                tmp_path = self._index_path() + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': INDEX_VERSION, 'signature': signature, 'entries': entries}, f)
+                os.replace(tmp_path, self._index_path())
+        # Date-sorted view for range lookups; the sort is stable, so ties keep archive order
+        self.entries = sorted(entries, key=lambda entry: entry['day'])
+        self._dates = [entry['day'] for entry in self.entries]
+        log.info("Indexed %s messages in %s", len(self.entries), self.path)
+        return self.entries
+
+    # --- search ---
+
+    @staticmethod
+    def _day(value):
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.date() if isinstance(value, datetime) else value
+
+    def _in_range(self, from_date, to_date):
+        """Index entries dated from_date through to_date inclusive, in date order"""
+        self._load_index()
+        low = bisect.bisect_left(self._dates, self._day(from_date).isoformat())
+        high = bisect.bisect_left(self._dates, (self._day(to_date) + timedelta(days=1)).isoformat())
+        return self.entries[low:high]
+
+    def _read(self, entry):
+        with metrics.stage('archive_read', items=1, nbytes=entry['end'] - entry['start']):
+            if entry['mbox']:
+                return self._map(entry['file'])[entry['start']:entry['end']]
+            with open(entry['file'], 'rb') as f:
+                return f.read()
+
+    def _text(self, raw):
+        text = self._raw_text(raw)
+        # Archives often store bare \n; the extraction regexes expect the CRLF an IMAP body has
+        return LONE_LF_REGEX.sub('\r\n', text)
+
+    def search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex,
+                                            require_all_keywords=False, batched=True, header_batch_size=500,
+                                            body_batch_size=50):
+        results = [hit for batch in self.iter_search_by_date_range_keywords_regex(
+                       from_date, to_date, keywords, subject_regex, require_all_keywords,
+                       header_batch_size, body_batch_size)
+                   for hit in batch]
+        log.info("Final results: %s emails after filtering", len(results))
+        return results
+
+    def iter_search_by_date_range_keywords_regex(self, from_date, to_date, keywords, subject_regex,
+                                                 require_all_keywords=False, header_batch_size=500,
+                                                 body_batch_size=50):
+        """Same batches as Email.iter_search_by_date_range_keywords_regex; header_batch_size is unused"""
+        pattern = re.compile(subject_regex, re.IGNORECASE) if subject_regex else None
+        matched = [entry for entry in self._in_range(from_date, to_date)
+                   if self._subject_matches(entry['subject'], keywords, pattern, require_all_keywords)]
+        log.info("Archive matched %s emails", len(matched))
+        for start in range(0, len(matched), body_batch_size):
+            batch = []
+            for entry in matched[start:start + body_batch_size]:
+                hit = {'id': entry['id'], 'subject': entry['subject'], 'from': entry['from'],
+                       'date': entry['date'], 'text': self._text(self._read(entry))}
+                batch.append(hit)
+                log.debug("✓ Added: %s | From: %s", hit['subject'], hit['from'])
+            yield batch
+
+    def sync_new_messages(self, *args, **kwargs):
+        raise NotImplementedError("Incremental UID sync needs IMAP; replay a date range instead")
+
+    iter_new_messages = sync_new_messages
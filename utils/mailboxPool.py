@@ -0,0 +1,366 @@
+import re
+import time
+import queue
+import imaplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.email_agent import Email
+from utils.metrics import get_logger
+
+
+_TASK_DONE = object()
+log = get_logger('mailboxPool')
+
+# imaplib commands that cost a round trip against the provider's rate limit
+THROTTLED_COMMANDS = ('select', 'examine', 'search', 'fetch', 'uid', 'status', 'noop')
+
+
+class Throttle():
+    """
+    Token bucket limiting one connection to `rate` IMAP commands per second with
+    bursts of up to `burst` commands. rate=None disables throttling.
+    """
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            self.waited += delay
+            time.sleep(delay)
+
+
+class ThrottledIMAP():
+    """Wraps an imaplib connection so every round-trip command waits on its Throttle first"""
+    def __init__(self, conn, throttle):
+        self._conn = conn
+        self.throttle = throttle
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name.lower() not in THROTTLED_COMMANDS or not callable(attr):
+            return attr
+
+        def throttled(*args, **kwargs):
+            self.throttle.wait()
+            return attr(*args, **kwargs)
+        return throttled
+
+
+class ImapConnectionPool():
+    """
+    Bounded pool of authenticated IMAP connections over one or more accounts.
+
+    At most `max_connections` connections are open in total and at most
+    `per_account` per account (providers cap concurrent sessions per login).
+    Connections are opened lazily on first acquire, handed out one thread at a
+    time and reused until close(). Each one is throttled to `rate` commands per
+    second.
+
+    Usage:
+        pool = ImapConnectionPool([{'EMAIL': ..., 'APP_PASSWORD': ..., 'IMAP_SERVER': ...}],
+                                  max_connections=8, per_account=2, rate=10)
+        with pool.connection('me@gmail.com') as client:
+            client.mail.select('inbox')
+        pool.close()
+    """
+    def __init__(self, accounts, max_connections=8, per_account=2, rate=None, burst=5, connect=None,
+                 mime_parts=False, header_index=None, narrow_from=False):
+        self.accounts = {account['EMAIL']: account for account in accounts}
+        self.max_connections = max_connections
+        self.per_account = per_account
+        self.rate = rate
+        self.burst = burst
+        # connect(account) -> logged-in imaplib connection; default is IMAP4_SSL + LOGIN
+        self.connect = connect or self._connect
+        # Passed on to every Email: fetch only the text MIME part of each message
+        self.mime_parts = mime_parts
+        # Shared HeaderIndex (and its optional FROM narrowing) for every connection
+        self.header_index = header_index
+        self.narrow_from = narrow_from
+        self._idle = {address: [] for address in self.accounts}
+        self._open = {address: 0 for address in self.accounts}
+        self._all = []
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _connect(account):
+        conn = imaplib.IMAP4_SSL(account['IMAP_SERVER'])
+        conn.login(account['EMAIL'], account['APP_PASSWORD'])
+        return conn
+
+    def acquire(self, address):
+        """Borrow a connection for `address`, blocking while its account or the pool is at capacity"""
+        if address not in self.accounts:
+            raise KeyError(f"Unknown account {address}")
+        with self._cond:
+            while True:
+                if self._idle[address]:
+                    return self._idle[address].pop()
+                if self._open[address] < self.per_account and sum(self._open.values()) < self.max_connections:
+                    self._open[address] += 1
+                    break
+                self._cond.wait()
+
+        account = self.accounts[address]
+        try:
+            conn = self.connect(account)
+        except Exception:
+            with self._cond:
+                self._open[address] -= 1
+                self._cond.notify_all()
+            raise
+        client = Email(account['EMAIL'], account['APP_PASSWORD'], account['IMAP_SERVER'], mime_parts=self.mime_parts,
+                       header_index=self.header_index, narrow_from=self.narrow_from)
+        client.mail = ThrottledIMAP(conn, Throttle(self.rate, self.burst))
+        with self._cond:
+            self._all.append(client)
+        return client
+
+    def release(self, client, broken=False):
+        """Return a borrowed connection; broken=True drops it so the next acquire reconnects"""
+        with self._cond:
+            if broken:
+                self._open[client.email] -= 1
+                if client in self._all:
+                    self._all.remove(client)
+            else:
+                self._idle[client.email].append(client)
+            self._cond.notify_all()
+        if broken:
+            try:
+                client.mail.logout()
+            except Exception:
+                pass
+
+    def connection(self, address):
+        return _Lease(self, address)
+
+    def throttle_wait(self):
+        """Total seconds connections have spent waiting on their rate limit"""
+        with self._cond:
+            return sum(client.mail.throttle.waited for client in self._all)
+
+    def close(self):
+        with self._cond:
+            clients, self._all = self._all, []
+            self._idle = {address: [] for address in self.accounts}
+            self._open = {address: 0 for address in self.accounts}
+        for client in clients:
+            try:
+                client.mail.logout()
+            except Exception as e:
+                log.warning("Error encountered while logging out of %s: %s", client.email, e)
+
+
+class _Lease():
+    def __init__(self, pool, address):
+        self.pool = pool
+        self.address = address
+        self.client = None
+
+    def __enter__(self):
+        self.client = self.pool.acquire(self.address)
+        return self.client
+
+    def __exit__(self, exc_type, exc, tb):
+        # imaplib errors can leave the session mid-response, so never reuse it
+        broken = exc_type is not None and issubclass(exc_type, (imaplib.IMAP4.error, OSError))
+        self.pool.release(self.client, broken=broken)
+        return False
+
+
+class MailboxIngestCoordinator():
+    """
+    Runs the search + batched fetch of many (account, mailbox) sources concurrently
+    over an ImapConnectionPool and merges their hits into one stream of batches,
+    ready for IngestPipeline.run().
+
+    Each source is searched once with UID SEARCH; its UIDs are then cut into up to
+    `splits` disjoint, contiguous ranges that are fetched on separate connections.
+    UIDs, unlike sequence numbers, do not shift when a message is expunged between
+    the search and a fetch. With a SyncState the search is the incremental UID
+    search of Email.iter_new_messages, otherwise the from_date/to_date search.
+    Since UIDs are only unique within a mailbox, hit ids (and so trip eids) of
+    several sources are namespaced as '<email>/<mailbox>/<uid>'; a single source
+    keeps the bare UID, the eid Email.iter_new_messages stores. `namespace`
+    overrides that choice. Every hit carries 'account', 'mailbox' and 'uid'.
+
+    A source whose search or fetch fails, including a single header or body chunk,
+    is reported in `errors`; its high-water mark is not advanced, so commit_sync()
+    only moves sources that were fully read.
+
+    Usage:
+        coordinator = MailboxIngestCoordinator(pool, [('me@gmail.com', 'inbox'), ('me@gmail.com', 'Receipts')],
+                                               keywords, subject_regex, state=syncState, splits=2)
+        stats = IngestPipeline(dbOps, dbName, collectionName, keyFields=index).run(coordinator.iter_batches())
+        coordinator.commit_sync(syncState)
+    """
+    def __init__(self, pool, sources, keywords, subject_regex, state=None, from_date=None, to_date=None,
+                 require_all_keywords=False, splits=1, header_batch_size=500, body_batch_size=50, queue_size=8,
+                 namespace=None):
+        self.pool = pool
+        self.sources = [tuple(source) for source in sources]
+        self.namespace = len(self.sources) > 1 if namespace is None else namespace
+        self.keywords = keywords
+        self.pattern = re.compile(subject_regex, re.IGNORECASE) if subject_regex else None
+        self.state = state
+        self.from_date = from_date
+        self.to_date = to_date
+        self.require_all_keywords = require_all_keywords
+        self.splits = max(1, splits)
+        self.header_batch_size = header_batch_size
+        self.body_batch_size = body_batch_size
+        self.queue_size = queue_size
+        self.stats = {}
+        self.errors = []
+        self.pending_sync = {}
+
+    def iter_batches(self):
+        """Yield hit batches from all sources as soon as any connection has fetched them"""
+        if self.state is None and (self.from_date is None or self.to_date is None):
+            raise ValueError("from_date and to_date are required without a SyncState")
+        self.stats = {f"{address}/{mailbox}": {'ids': 0, 'hits': 0, 'ranges': 0, 'elapsed': 0.0}
+                      for address, mailbox in self.sources}
+        self.errors = []
+        self.pending_sync = {}
+        out = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        lock = threading.Lock()
+        remaining = {}
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fail(source, e):
+            with lock:
+                remaining.pop(source, None)
+            self.errors.append({'source': f"{source[0]}/{source[1]}", 'error': f"{type(e).__name__}: {e}"})
+            log.error("Error ingesting %s/%s: %s", source[0], source[1], e)
+
+        def plan(source):
+            new_tasks = 0
+            try:
+                address, mailbox = source
+                with self.pool.connection(address) as client:
+                    ids, mark = self._search(client, mailbox)
+                key = f"{address}/{mailbox}"
+                ranges = self._split(ids)
+                with lock:
+                    self.stats[key]['ids'] = len(ids)
+                    self.stats[key]['ranges'] = len(ranges)
+                    remaining[source] = [len(ranges), mark]
+                for ids_range in ranges:
+                    executor.submit(fetch, source, ids_range)
+                    new_tasks += 1
+            except Exception as e:
+                fail(source, e)
+            finally:
+                put((_TASK_DONE, new_tasks))
+
+        def fetch(source, ids_range):
+            address, mailbox = source
+            key = f"{address}/{mailbox}"
+            start = time.perf_counter()
+            try:
+                with self.pool.connection(address) as client:
+                    status, _ = client.mail.select(mailbox)
+                    if status != "OK":
+                        raise imaplib.IMAP4.error(f"Unable to select mailbox {mailbox}")
+                    failed = []
+                    for batch in client._iter_batched(ids_range, self.keywords, self.pattern,
+                                                      self.require_all_keywords, self.header_batch_size,
+                                                      self.body_batch_size, uid=True,
+                                                      scope=client._index_scope(mailbox), failed=failed):
+                        if stop.is_set():
+                            return
+                        for hit in batch:
+                            hit['uid'] = int(hit['id'])
+                            if self.namespace:
+                                hit['id'] = f"{key}/{hit['id']}"
+                            hit['account'] = address
+                            hit['mailbox'] = mailbox
+                        with lock:
+                            self.stats[key]['hits'] += len(batch)
+                        if batch and not put(batch):
+                            return
+                if failed:
+                    # The hits already yielded stand, but the source is not marked as read
+                    raise imaplib.IMAP4.error(f"{len(set(failed))} messages could not be fetched")
+                with lock:
+                    pending = remaining.get(source)
+                    if pending is not None:
+                        pending[0] -= 1
+                        if pending[0] == 0 and pending[1] is not None:
+                            self.pending_sync[key] = pending[1]
+            except Exception as e:
+                fail(source, e)
+            finally:
+                with lock:
+                    self.stats[key]['elapsed'] += time.perf_counter() - start
+                put((_TASK_DONE, 0))
+
+        executor = ThreadPoolExecutor(max_workers=self.pool.max_connections, thread_name_prefix='mailbox')
+        try:
+            outstanding = 0
+            for source in self.sources:
+                executor.submit(plan, source)
+                outstanding += 1
+            while outstanding:
+                item = out.get()
+                if isinstance(item, tuple) and item and item[0] is _TASK_DONE:
+                    outstanding += item[1] - 1
+                    continue
+                yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    def _search(self, client, mailbox):
+        """UIDs to fetch for one mailbox and the high-water mark to store once they are all read"""
+        if self.state is not None:
+            found = client._new_uids(self.keywords, self.state, mailbox, self.from_date)
+            if found is None:
+                raise imaplib.IMAP4.error(f"Unable to search mailbox {mailbox}")
+            state_key, uidvalidity, uids, last_uid = found
+            mark = (state_key, uidvalidity, max(last_uid, int(uids[-1]))) if uids else None
+            return uids, mark
+        status, _ = client.mail.select(mailbox)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Unable to select mailbox {mailbox}")
+        uids = sorted(client._search_ids(self.from_date, self.to_date, self.keywords, mailbox, uid=True), key=int)
+        return uids, None
+
+    def _split(self, ids):
+        """Cut sorted ids into up to `splits` contiguous ranges of roughly equal size"""
+        if not ids:
+            return []
+        # No point in a range smaller than one body fetch
+        parts = min(self.splits, -(-len(ids) // self.body_batch_size))
+        size = -(-len(ids) // parts)
+        return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    def commit_sync(self, state):
+        """Persist the high-water marks of every source that was read completely"""
+        for state_key, uidvalidity, last_uid in self.pending_sync.values():
+            state.set(state_key, uidvalidity, last_uid)
+        self.pending_sync = {}
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import logging
+import threading
+
+
+LOGGER_NAME = 'uberMail'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+# Stages recorded by the ingest code; any other name works too
+STAGES = ('imap_search', 'imap_fetch', 'header_index', 'archive_read', 'mime_decode', 'parse', 'compress', 'mongo_insert',
+          'mongo_find', 'mongo_aggregate', 'tier_write', 'tier_read')
+
+
+def get_logger(name):
+    """Logger under the project namespace, e.g. get_logger('email_agent') -> 'uberMail.email_agent'"""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+def configure_logging(level=None, stream=None):
+    """
+    Console handler for the project loggers. level defaults to $UBERMAIL_LOG_LEVEL,
+    else WARNING, so production runs skip the per-email progress lines; INFO shows
+    progress and DEBUG every matched email and parsed line.
+    """
+    level = level or os.environ.get('UBERMAIL_LOG_LEVEL', 'WARNING')
+    root = logging.getLogger(LOGGER_NAME)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if not root.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False
+    return root
+
+
+class _NoopStage():
+    """Shared stand-in returned by Metrics.stage() while metrics are off"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, items=0, nbytes=0):
+        pass
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage():
+    __slots__ = ('metrics', 'name', 'items', 'nbytes', 'start')
+
+    def __init__(self, metrics, name, items, nbytes):
+        self.metrics = metrics
+        self.name = name
+        self.items = items
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start, self.items, self.nbytes)
+        return False
+
+    def add(self, items=0, nbytes=0):
+        """Count items/bytes discovered inside the block, e.g. messages returned by a FETCH"""
+        self.items += items
+        self.nbytes += nbytes
+
+
+class Metrics():
+    """
+    Per-stage counters: calls, seconds, items and bytes for IMAP search and fetch,
+    MIME decode, parse, compress and Mongo insert/find. Thread safe; off by default
+    ($UBERMAIL_METRICS=1 or metrics.enabled = True), and while off stage() hands
+    back a shared no-op context manager so instrumented code pays one attribute
+    check.
+
+    Usage:
+        with metrics.stage('imap_fetch') as stage:
+            payloads = ...
+            stage.add(items=len(payloads), nbytes=sum(map(len, payloads.values())))
+        print(metrics.to_prometheus())
+        metrics.log_summary()
+    """
+    FIELDS = ('calls', 'seconds', 'items', 'bytes')
+
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get('UBERMAIL_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def stage(self, name, items=0, nbytes=0):
+        """Context manager timing one call of stage `name`"""
+        if not self.enabled:
+            return _NOOP_STAGE
+        return _Stage(self, name, items, nbytes)
+
+    def record(self, name, seconds, items=0, nbytes=0, calls=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            totals = self._stages.get(name)
+            if totals is None:
+                totals = self._stages[name] = [0, 0.0, 0, 0]
+            totals[0] += calls
+            totals[1] += seconds
+            totals[2] += items
+            totals[3] += nbytes
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, charging the time spent producing each item to stage `name`"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        seconds = 0.0
+        items = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    break
+                seconds += time.perf_counter() - start
+                items += 1
+                yield item
+        finally:
+            self.record(name, seconds, items)
+
+    def snapshot(self):
+        """{stage: {'calls', 'seconds', 'items', 'bytes'}}"""
+        with self._lock:
+            return {name: dict(zip(self.FIELDS, totals)) for name, totals in self._stages.items()}
+
+    def since(self, before):
+        """What was recorded after `before` (an earlier snapshot)"""
+        delta = {}
+        for name, totals in self.snapshot().items():
+            earlier = before.get(name, {})
+            change = {field: totals[field] - earlier.get(field, 0) for field in self.FIELDS}
+            if change['calls']:
+                delta[name] = change
+        return delta
+
+    def merge(self, snapshot):
+        """Add a snapshot taken elsewhere, e.g. in a parse worker process"""
+        for name, totals in (snapshot or {}).items():
+            self.record(name, totals['seconds'], totals['items'], totals['bytes'], totals['calls'])
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def to_prometheus(self, prefix='ubermail_stage'):
+        """Prometheus text exposition format, e.g. for a node_exporter textfile collector"""
+        helps = {
+            'calls': ('calls_total', 'Instrumented calls per ingest stage'),
+            'seconds': ('seconds_total', 'Wall time spent per ingest stage'),
+            'items': ('items_total', 'Messages, documents or records handled per ingest stage'),
+            'bytes': ('bytes_total', 'Payload bytes handled per ingest stage'),
+        }
+        snapshot = self.snapshot()
+        lines = []
+        for field in self.FIELDS:
+            suffix, text = helps[field]
+            lines.append(f'# HELP {prefix}_{suffix} {text}')
+            lines.append(f'# TYPE {prefix}_{suffix} counter')
+            for name in sorted(snapshot):
+                lines.append(f'{prefix}_{suffix}{{stage="{name}"}} {snapshot[name][field]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, prefix='ubermail_stage'):
+        # Swap the file in whole so a scraper never reads half of it
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus(prefix))
+        os.replace(tmp_path, path)
+
+    def log_summary(self, logger=None, level=logging.WARNING):
+        """
+        One structured (JSON) log record per stage. Logged at WARNING by default, the
+        default level of configure_logging, so turning metrics on is enough to see it.
+        """
+        logger = logger or get_logger('metrics')
+        if not logger.isEnabledFor(level):
+            return
+        for name, totals in sorted(self.snapshot().items()):
+            seconds = totals['seconds']
+            logger.log(level, json.dumps({
+                'event': 'stage_metrics', 'stage': name, **totals,
+                'items_per_sec': totals['items'] / seconds if seconds > 0 else None,
+                'mb_per_sec': totals['bytes'] / seconds / 1e6 if seconds > 0 and totals['bytes'] else None,
+            }))
+
+
+metrics = Metrics()
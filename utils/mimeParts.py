@@ -0,0 +1,174 @@
+import re
+import html
+import base64
+import binascii
+
+
+# IMAP s-expression tokens: parentheses, quoted strings, {n} literal markers and atoms
+SEXP_TOKEN_REGEX = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}|[^\s()"]+')
+# Start of one message's FETCH response; imaplib drops the FETCH keyword, AsyncIMAP keeps it
+FETCH_START_REGEX = re.compile(rb'^\s*\d+\s+(?:FETCH\s+)?\(')
+
+# HTML -> text, compiled once; receipts are table layouts so cells and rows become
+# spaces and newlines and everything else is stripped
+HTML_DROP_REGEX = re.compile(r'<(script|style|head|title)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+HTML_BREAK_REGEX = re.compile(r'<\s*(?:br|/p|/div|/tr|/h[1-6]|/li|/table)\b[^>]*>', re.IGNORECASE)
+HTML_CELL_REGEX = re.compile(r'<\s*/t[dh]\s*>', re.IGNORECASE)
+HTML_TAG_REGEX = re.compile(r'<[^>]+>')
+HTML_SPACES_REGEX = re.compile(r'[ \t\r\f\v\xa0]+')
+HTML_BLANK_LINES_REGEX = re.compile(r'\n\s*\n+')
+
+
+def _parse_sexp(data):
+    """Parse one IMAP parenthesized list into nested Python lists of str/None"""
+    stack = [[]]
+    for token in SEXP_TOKEN_REGEX.findall(data):
+        if token == b'(':
+            stack.append([])
+        elif token == b')':
+            if len(stack) == 1:
+                break
+            done = stack.pop()
+            stack[-1].append(done)
+        elif token.startswith(b'"'):
+            stack[-1].append(token[1:-1].replace(b'\\"', b'"').replace(b'\\\\', b'\\').decode(errors='ignore'))
+        elif token.upper() == b'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token.decode(errors='ignore'))
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def _quote_literal(literal):
+    return b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def fetch_responses(fetch_data):
+    """
+    Reassemble imaplib FETCH data into one bytes line per message. Strings the
+    server sent as {n} literals are inlined as quoted strings.
+    """
+    responses = []
+    for item in fetch_data or []:
+        if isinstance(item, tuple):
+            meta, literal = item[0], item[1]
+            meta = re.sub(rb'\{\d+\}$', b'', meta)
+            piece = meta + _quote_literal(literal)
+        elif isinstance(item, bytes):
+            piece = item
+        else:
+            continue
+        if responses and not FETCH_START_REGEX.match(piece):
+            responses[-1] += piece
+        else:
+            responses.append(piece)
+    return responses
+
+
+def parse_bodystructures(fetch_data, id_regex, uid=False):
+    """
+    {id: bodystructure} from the data of a FETCH ... (BODYSTRUCTURE) command, keyed
+    the same way as Email._fetch_set (sequence number, or UID with uid=True).
+    """
+    structures = {}
+    for line in fetch_responses(fetch_data):
+        found = id_regex.search(line) if uid else id_regex.match(line)
+        if not found:
+            continue
+        start = line.find(b'(')
+        items = _parse_sexp(line[start + 1:]) if start >= 0 else []
+        for name, value in zip(items[::2], items[1::2]):
+            if isinstance(name, str) and name.upper() == 'BODYSTRUCTURE' and isinstance(value, list):
+                structures[found.group(1).decode()] = value
+    return structures
+
+
+def _params(value):
+    if not isinstance(value, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(value[::2], value[1::2])}
+
+
+def _leaf_parts(structure, section=''):
+    """Yield (section, type, subtype, encoding, charset) for every leaf in MIME walk order"""
+    if structure and isinstance(structure[0], list):
+        # multipart: the leading lists are the children, then come the subtype and
+        # extension data (which can hold lists of its own, e.g. the boundary param)
+        children = []
+        for part in structure:
+            if not isinstance(part, list):
+                break
+            children.append(part)
+        for number, child in enumerate(children, start=1):
+            yield from _leaf_parts(child, f'{section}.{number}' if section else str(number))
+        return
+    if len(structure) < 7:
+        return
+    mainType = str(structure[0] or '').lower()
+    subType = str(structure[1] or '').lower()
+    encoding = str(structure[5] or '7bit').lower()
+    charset = _params(structure[2]).get('charset')
+    here = section or '1'
+    if mainType == 'message' and subType == 'rfc822' and len(structure) > 8 and isinstance(structure[8], list):
+        inner = structure[8]
+        if inner and isinstance(inner[0], list):
+            yield from _leaf_parts(inner, here)
+        else:
+            yield from _leaf_parts(inner, f'{here}.1')
+        return
+    yield here, mainType, subType, encoding, charset
+
+
+def text_part(structure):
+    """
+    The part Email._message_text would read: the first text/plain leaf, otherwise
+    the first text/html leaf. Returns (section, subtype, encoding, charset) or None.
+    """
+    html_part = None
+    for section, mainType, subType, encoding, charset in _leaf_parts(structure):
+        if mainType != 'text':
+            continue
+        if subType == 'plain':
+            return section, subType, encoding, charset
+        if subType == 'html' and html_part is None:
+            html_part = (section, subType, encoding, charset)
+    return html_part
+
+
+def decode_part(payload, encoding, charset=None):
+    """Undo the Content-Transfer-Encoding of a fetched part and decode it to str"""
+    encoding = (encoding or '7bit').lower()
+    try:
+        if encoding == 'base64':
+            payload = base64.b64decode(payload)
+        elif encoding == 'quoted-printable':
+            payload = binascii.a2b_qp(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return payload.decode('utf-8', errors='ignore')
+
+
+def html_to_text(markup):
+    """Fast regex HTML -> text: drops head/script/style, one line per row/paragraph, CRLF line endings"""
+    text = HTML_DROP_REGEX.sub(' ', markup)
+    text = HTML_BREAK_REGEX.sub('\n', text)
+    text = HTML_CELL_REGEX.sub(' ', text)
+    text = HTML_TAG_REGEX.sub(' ', text)
+    text = html.unescape(text)
+    text = HTML_SPACES_REGEX.sub(' ', text)
+    text = HTML_BLANK_LINES_REGEX.sub('\n', '\n'.join(line.strip() for line in text.split('\n'))).strip()
+    # CRLF like a decoded text/plain part, which is what the extraction regexes expect
+    return text.replace('\n', '\r\n') + '\r\n'
+
+
+def part_text(payload, part):
+    """Decoded text of a fetched part described by text_part(); HTML is flattened to text"""
+    _, subType, encoding, charset = part
+    text = decode_part(payload, encoding, charset)
+    return html_to_text(text) if subType == 'html' else text
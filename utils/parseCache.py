@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def body_hash(emailText):
+    """Content address of an email body"""
+    data = emailText.encode('utf-8', errors='surrogatepass') if isinstance(emailText, str) else emailText
+    return hashlib.sha256(data).hexdigest()
+
+
+class ParseCache():
+    """
+    Persistent, size-bounded cache of parse results in a local SQLite file.
+
+    Entries are keyed by (sha256 of the email body, ExtractionEngine.fingerprint,
+    compressor name) and hold the extracted fields plus the compressed emailText,
+    so re-running a window or an overlapping date range skips both extraction and
+    compression for every email seen before. A parser config change only misses for
+    the extractions it actually affects: the fingerprint covers the labels and
+    regexes extract() reads, not the whole yaml. Least recently used entries are
+    evicted once the cache holds more than `max_entries` entries or `max_bytes`
+    bytes of results. eid and date come from the message headers and are always
+    rebuilt.
+
+    Usage:
+        cache = ParseCache('./config/parseCache.sqlite')
+        trips, failures = parse_trips(hits, cache=cache)
+        print(cache.stats())
+    """
+    def __init__(self, path, max_entries=200000, max_bytes=256 * 1024 * 1024):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # Used from the ingest parse thread as well as the caller's thread
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS parses (
+                body TEXT NOT NULL,
+                config TEXT NOT NULL,
+                compressor TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                text BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                used REAL NOT NULL,
+                PRIMARY KEY (body, config, compressor)
+            ) WITHOUT ROWID""")
+        self._db.execute('CREATE INDEX IF NOT EXISTS parses_used ON parses (used)')
+        self._db.commit()
+        # Running totals so a put only scans the table when a bound may have been crossed
+        self._count, self._bytes = self._totals()
+
+    def _totals(self):
+        return self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM parses').fetchone()
+
+    def get_many(self, keys, config, compressor):
+        """{body hash: (fields, compressed text)} for the keys cached under config/compressor; marks them used"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                rows = self._db.execute(f'SELECT body, fields, text FROM parses WHERE config = ? AND compressor = ? '
+                                        f'AND body IN ({marks})', [config, compressor, *chunk]).fetchall()
+                found.update((body, (json.loads(fields), text)) for body, fields, text in rows)
+            if found:
+                now = time.time()
+                self._db.executemany('UPDATE parses SET used = ? WHERE body = ? AND config = ? AND compressor = ?',
+                                     [(now, body, config, compressor) for body in found])
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries, config, compressor):
+        """Store {body hash: (fields, compressed text)} under config/compressor, then evict down to the bounds"""
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for body, (fields, text) in entries.items():
+            data = json.dumps(fields, separators=(',', ':'))
+            rows.append((body, config, compressor, data, text, len(data) + len(text), now))
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO parses (body, config, compressor, fields, text, size, used) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            # Replaced rows make these an overestimate, which only triggers an exact recount
+            self._count += len(rows)
+            self._bytes += sum(row[5] for row in rows)
+            if (self.max_entries and self._count > self.max_entries) or \
+                    (self.max_bytes and self._bytes > self.max_bytes):
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        count, size = self._totals()
+        excess = max(0, count - self.max_entries) if self.max_entries else 0
+        if self.max_bytes and size > self.max_bytes:
+            # Drop the oldest entries until their sizes cover the overflow
+            overflow = size - self.max_bytes
+            freed = 0
+            dropped = 0
+            for (entrySize,) in self._db.execute('SELECT size FROM parses ORDER BY used'):
+                if freed >= overflow:
+                    break
+                freed += entrySize
+                dropped += 1
+            excess = max(excess, dropped)
+        if excess:
+            self._db.execute('DELETE FROM parses WHERE (body, config, compressor) IN '
+                             '(SELECT body, config, compressor FROM parses ORDER BY used LIMIT ?)', (excess,))
+            self.evicted += excess
+        self._count, self._bytes = self._totals()
+
+    def invalidate(self, keep_config=None):
+        """Drop every entry (or every entry not parsed under `keep_config`); returns the number removed"""
+        with self._lock:
+            if keep_config is None:
+                removed = self._db.execute('DELETE FROM parses').rowcount
+            else:
+                removed = self._db.execute('DELETE FROM parses WHERE config != ?', (keep_config,)).rowcount
+            self._db.commit()
+            self._count, self._bytes = self._totals()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            count, size = self._totals()
+        lookups = self.hits + self.misses
+        return {'entries': count, 'bytes': size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0, 'evicted': self.evicted}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
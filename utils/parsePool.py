@@ -0,0 +1,119 @@
+import os
+import gzip
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.tripParser import TripParser, get_extraction_engine
+from utils.parseCache import body_hash
+from utils.textCodecs import get_codec
+from utils.tripFields import TYPED_FIELDS
+from utils.metrics import get_logger, metrics
+
+
+# Fields TripParser sets from the hit or derives after extraction; the parse cache only keeps the rest
+BASE_FIELDS = ('eid', 'date', 'emailText', 'compressorName', 'compressorDict', 'fingerprint', *TYPED_FIELDS)
+log = get_logger('parsePool')
+
+
+def _parse_hit(hit, codec):
+    """Parse one search hit; never raises so a bad email cannot kill the batch"""
+    try:
+        trip = TripParser(hit['id'], hit['date'], hit['text'], codec, fields=hit.get('fields'))
+        return True, trip.trip
+    except Exception as e:
+        return False, {
+            'eid': hit.get('id'),
+            'error': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+        }
+
+
+def _parse_chunk(args):
+    hits, codec, parentPid, metricsOn = args
+    if os.getpid() == parentPid:
+        return [_parse_hit(hit, codec) for hit in hits], None
+    # Worker process: hand the parse/compress metrics of this chunk back to the parent
+    metrics.enabled = metricsOn
+    before = metrics.snapshot()
+    outcomes = [_parse_hit(hit, codec) for hit in hits]
+    return outcomes, metrics.since(before) if metricsOn else None
+
+
+def _merge_chunks(results):
+    outcomes = []
+    for chunkOutcomes, chunkMetrics in results:
+        outcomes.extend(chunkOutcomes)
+        metrics.merge(chunkMetrics)
+    return outcomes
+
+
+def parse_trips(hits, workers=None, chunksize=None, compressionAlgo=gzip, executor=None, cache=None):
+    """
+    Parse email search hits into trip dicts, spreading TripParser work over a
+    process pool.
+
+    Args:
+        hits (list[dict]): Result dicts from Email.search_by_date_range_keywords_regex
+        workers (int): Number of worker processes (default: os.cpu_count()); 1 parses inline
+        chunksize (int): Hits sent to a worker per task (default: spread ~4 tasks per worker)
+        compressionAlgo (Codec | str | module): Codec for emailText, e.g. gzip, 'zstd' or a
+            trained textCodecs dictionary codec
+        executor (ProcessPoolExecutor): Reuse an existing pool instead of starting one per call
+        cache (ParseCache): Bodies parsed before under the same parser config and
+            codec are served from the cache in the calling process; only misses
+            go to the workers and their results are added after the batch.
+
+    Returns:
+        tuple(list[dict], list[dict]): (trips, failures). Trips keep the order of
+        `hits` regardless of worker count; each failure holds the 'eid', 'error'
+        and 'traceback' of an email that could not be parsed.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Codecs pickle to the workers with their dictionary, if any
+    codec = get_codec(compressionAlgo)
+    # Only ship what TripParser needs across the process boundary
+    hits = [{'id': h['id'], 'date': h['date'], 'text': h['text']} for h in hits]
+    outcomes = [None] * len(hits)
+    pending = list(range(len(hits)))
+    if cache is not None:
+        keys = [body_hash(h['text']) for h in hits]
+        fingerprint = get_extraction_engine().fingerprint
+        cached = cache.get_many(keys, fingerprint, codec.key)
+        pending = []
+        for index, (hit, key) in enumerate(zip(hits, keys)):
+            if key in cached:
+                # Cached fields and already compressed text: nothing left to do but build the dict
+                fields, text = cached[key]
+                outcomes[index] = _parse_hit({**hit, 'text': text, 'fields': fields}, codec)
+            else:
+                pending.append(index)
+    todo = [hits[index] for index in pending]
+
+    parentPid = os.getpid()
+    if executor is None and (workers == 1 or len(todo) <= 1):
+        parsed, _ = _parse_chunk((todo, codec, parentPid, metrics.enabled))
+    else:
+        if not chunksize:
+            chunksize = max(1, len(todo) // (workers * 4))
+        chunks = [(todo[i:i + chunksize], codec, parentPid, metrics.enabled) for i in range(0, len(todo), chunksize)]
+        if executor is not None:
+            parsed = _merge_chunks(executor.map(_parse_chunk, chunks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = _merge_chunks(pool.map(_parse_chunk, chunks))
+    for index, outcome in zip(pending, parsed):
+        outcomes[index] = outcome
+
+    trips = []
+    failures = []
+    for ok, value in outcomes:
+        if ok:
+            trips.append(value)
+        else:
+            log.warning("Failed to parse email %s: %s", value['eid'], value['error'])
+            failures.append(value)
+    if cache is not None:
+        fresh = {keys[index]: ({k: v for k, v in value.items() if k not in BASE_FIELDS}, value['emailText'])
+                 for index, (ok, value) in ((index, outcomes[index]) for index in pending) if ok}
+        cache.put_many(fresh, fingerprint, codec.key)
+    return trips, failures
@@ -0,0 +1,45 @@
+import json
+import os
+import threading
+
+
+class SyncState():
+    """
+    Local JSON file holding the IMAP high-water mark per mailbox:
+
+        {"me@gmail.com/inbox": {"uidvalidity": 1712345678, "last_uid": 10423}}
+
+    Writes go to a temp file and are swapped in with os.replace so an interrupted
+    run never leaves a truncated state file behind.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self.marks = {}
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                self.marks = json.load(f)
+
+    def get(self, key):
+        return self.marks.get(key)
+
+    def set(self, key, uidvalidity, last_uid):
+        with self._lock:
+            self.marks[key] = {"uidvalidity": int(uidvalidity), "last_uid": int(last_uid)}
+            self._save()
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None:
+                self.marks = {}
+            else:
+                self.marks.pop(key, None)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.marks, f, indent=2)
+        os.replace(tmp_path, self.file_path)
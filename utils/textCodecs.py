@@ -0,0 +1,219 @@
+import gzip
+import lzma
+import zlib
+import hashlib
+import threading
+from collections import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+
+# zlib can only reference the last 32 KiB, so a longer preset dictionary is wasted
+ZLIB_DICT_SIZE = 32 * 1024
+ZSTD_DICT_SIZE = 64 * 1024
+
+
+def dictionary_id(dictionary):
+    """Stable id of a trained dictionary, stored with every record compressed against it"""
+    return hashlib.sha256(dictionary).hexdigest()[:16]
+
+
+def _zstd_compress(data, level=3):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _lz4_compress(data, level=0):
+    return lz4frame.compress(data, compression_level=level)
+
+
+class Codec():
+    """
+    A named compress/decompress pair for emailText. `name` is what TripParser
+    stores as compressorName; codecs trained with a dictionary also carry its
+    `dict_id` (stored as compressorDict). Codecs are picklable so they can be
+    shipped to parse_trips worker processes.
+    """
+    dict_id = None
+
+    def __init__(self, name, compress, decompress):
+        self.name = name
+        self._compress = compress
+        self._decompress = decompress
+
+    @property
+    def key(self):
+        """Name plus dictionary id: what a compressed blob needs to be read back"""
+        return f'{self.name}:{self.dict_id}' if self.dict_id else self.name
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def decompress(self, data):
+        return self._decompress(data)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.key!r})'
+
+
+class DictCodec(Codec):
+    """
+    Codec primed with a shared dictionary trained on sample receipts. Small,
+    near-identical receipts compress far better against a dictionary holding
+    their boilerplate than one at a time. Primed (de)compressors are built once
+    per thread and process and are not pickled.
+    """
+    def __init__(self, name, dictionary, level=None):
+        self.name = name
+        self.dictionary = bytes(dictionary)
+        self.dict_id = dictionary_id(self.dictionary)
+        self.level = level
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k != '_local'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _primed(self):
+        primed = getattr(self._local, 'primed', None)
+        if primed is None:
+            primed = self._local.primed = self._prime()
+        return primed
+
+    def _prime(self):
+        if self.name == 'zstd':
+            data = zstandard.ZstdCompressionDict(self.dictionary)
+            level = 3 if self.level is None else self.level
+            return (zstandard.ZstdCompressor(level=level, dict_data=data),
+                    zstandard.ZstdDecompressor(dict_data=data))
+        level = 6 if self.level is None else self.level
+        # zlib streams with the preset dictionary loaded once; every message works on a copy
+        return (zlib.compressobj(level, zlib.DEFLATED, 15, 8, zlib.Z_DEFAULT_STRATEGY, self.dictionary),
+                zlib.decompressobj(15, self.dictionary))
+
+    def compress(self, data):
+        compressor, _ = self._primed()
+        if self.name == 'zstd':
+            return compressor.compress(data)
+        compressor = compressor.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        _, decompressor = self._primed()
+        if self.name == 'zstd':
+            return decompressor.decompress(data)
+        decompressor = decompressor.copy()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def _train_zlib(samples, size):
+    """
+    Preset dictionary for deflate: the lines most receipts share (labels, footer,
+    boilerplate), most frequent last since deflate prefers near matches.
+    """
+    counts = Counter(line for sample in samples for line in set(sample.splitlines(keepends=True)))
+    shared = [line for line, count in counts.items() if count > 1]
+    shared.sort(key=lambda line: (counts[line], len(line)))
+    dictionary = b''.join(shared)
+    return dictionary[-size:]
+
+
+class CodecRegistry():
+    """
+    Codecs by name: gzip, zlib and lzma always, zstd and lz4 when the zstandard /
+    lz4 packages are installed, plus dictionary codecs that were trained or loaded.
+
+    Usage:
+        codec = registry.get('zstd')
+        codec = registry.train(sample_texts)            # zstd if available, else zlib
+        text = registry.decompress(blob, record['compressorName'], record.get('compressorDict'))
+    """
+    DICT_CODECS = ('zstd', 'zlib')
+
+    def __init__(self):
+        self._codecs = {}
+        self._lock = threading.Lock()
+        # The gzip/zlib/lzma defaults match calling the modules directly, which is
+        # how records written before the registry were compressed
+        self.register(Codec('gzip', gzip.compress, gzip.decompress))
+        self.register(Codec('zlib', zlib.compress, zlib.decompress))
+        self.register(Codec('lzma', lzma.compress, lzma.decompress))
+        if zstandard is not None:
+            self.register(Codec('zstd', _zstd_compress, _zstd_decompress))
+        if lz4frame is not None:
+            self.register(Codec('lz4', _lz4_compress, lz4frame.decompress))
+
+    def register(self, codec):
+        with self._lock:
+            self._codecs[codec.key] = codec
+        return codec
+
+    def available(self):
+        """Names of the codecs usable in this environment"""
+        return sorted({codec.name for codec in self._codecs.values()})
+
+    def has(self, name, dict_id=None):
+        return (f'{name}:{dict_id}' if dict_id else name) in self._codecs
+
+    def get(self, name, dict_id=None):
+        """The codec for a compressorName (and compressorDict); raises ValueError when unknown"""
+        codec = self._codecs.get(f'{name}:{dict_id}' if dict_id else name)
+        if codec is None:
+            if dict_id:
+                raise ValueError(f"Dictionary {dict_id} for {name} is not loaded")
+            raise ValueError(f"Unknown or unavailable codec {name!r}; available: {', '.join(self.available())}")
+        return codec
+
+    def add_dictionary(self, name, dictionary, level=None):
+        """Register a dictionary codec, e.g. one loaded back from the database"""
+        if name not in self.DICT_CODECS or not self.has(name):
+            raise ValueError(f"Codec {name!r} has no dictionary mode here")
+        return self.register(DictCodec(name, dictionary, level))
+
+    def train(self, samples, name=None, size=None, level=None):
+        """
+        Train a shared dictionary on sample receipt texts (str or bytes) and
+        register it. name defaults to zstd when available, otherwise zlib.
+        """
+        name = name or ('zstd' if self.has('zstd') else 'zlib')
+        samples = [s.encode('utf-8') if isinstance(s, str) else bytes(s) for s in samples]
+        if not samples:
+            raise ValueError("Cannot train a dictionary without samples")
+        if name == 'zstd' and self.has('zstd'):
+            trained = zstandard.train_dictionary(size or ZSTD_DICT_SIZE, samples)
+            dictionary = trained.as_bytes()
+        else:
+            dictionary = _train_zlib(samples, min(size or ZLIB_DICT_SIZE, ZLIB_DICT_SIZE))
+        return self.add_dictionary(name, dictionary, level)
+
+    def decompress(self, data, name, dict_id=None):
+        return self.get(name, dict_id).decompress(data)
+
+
+registry = CodecRegistry()
+
+
+def get_codec(compressionAlgo):
+    """
+    Normalize what callers pass as compressionAlgo: a Codec, a codec name, or a
+    module with compress() such as gzip (looked up by its name).
+    """
+    if isinstance(compressionAlgo, Codec):
+        return compressionAlgo
+    if isinstance(compressionAlgo, str):
+        return registry.get(compressionAlgo)
+    return registry.get(compressionAlgo.__name__)
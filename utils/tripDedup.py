@@ -0,0 +1,179 @@
+import re
+import json
+import math
+import hashlib
+
+from utils.utils import parseTripDate, parseMoneyCents
+
+
+# Trip field holding the content fingerprint; REPORT_INDEXES in database/indexManager.py indexes it uniquely
+FINGERPRINT_FIELD = 'fingerprint'
+# Bump whenever trip_fingerprint() canonicalizes differently
+FINGERPRINT_VERSION = 1
+WHITESPACE_REGEX = re.compile(r'\s+')
+
+
+def _canonical(value):
+    return WHITESPACE_REGEX.sub(' ', str(value)).strip().casefold() if value else ''
+
+
+def _location(location):
+    # Address parts in a fixed order, so dicts built in any order agree
+    if not isinstance(location, dict):
+        return _canonical(location)
+    return '|'.join(f'{key}={_canonical(location[key])}' for key in sorted(location) if location[key])
+
+
+def trip_fingerprint(trip):
+    """
+    Content fingerprint of a trip: a hash of its date, pickup and drop-off times
+    and locations, and total. Forwarded copies of one receipt get different IMAP
+    ids (eid) but the same fingerprint. Returns None when the trip has no date or
+    neither times nor a total, since such trips cannot be told apart.
+    """
+    tripDate = parseTripDate(trip.get('date'))
+    pickUpTime = _canonical(trip.get('pickUpTime'))
+    dropTime = _canonical(trip.get('dropTime'))
+    totalCents = parseMoneyCents(trip.get('total'))
+    if tripDate is None or not (pickUpTime or dropTime or totalCents is not None):
+        return None
+    payload = json.dumps([FINGERPRINT_VERSION, tripDate.strftime('%Y-%m-%d'), pickUpTime, dropTime,
+                          _location(trip.get('pickupLocation')), _location(trip.get('dropOffLocation')),
+                          totalCents])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class BloomFilter():
+    """
+    Fixed-size Bloom filter over strings. Membership tests can return false
+    positives (about error_rate while at most `capacity` keys were added, more once
+    it overfills) but never false negatives.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _hashes(self, key):
+        # Double hashing: the k positions come from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, key):
+        h1, h2 = self._hashes(key)
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        # Most new keys miss on the first probe or two
+        h1, h2 = self._hashes(key)
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+class TripDeduplicator():
+    """
+    Prefilter that drops trips whose fingerprint is already stored before they
+    reach Mongo. Nothing is preloaded, so startup does not grow with the stored
+    history: a repeat within a batch, or of a trip record() saw written earlier in
+    this run, is dropped from memory; every other fingerprint of the batch is
+    looked up with one $in query, answered from the unique fingerprint index.
+    Only trips a write actually stored are remembered, so a batch that fails to
+    write is not mistaken for stored on the next attempt. The default memory is
+    an exact set; with `capacity` a BloomFilter of that size holds the run's
+    fingerprints instead, and its hits are looked up like the rest, so a false
+    positive never drops a new trip.
+
+    The unique fingerprint index stays the source of truth: anything the filter
+    lets through that is a duplicate after all is rejected by the server (E11000).
+
+    Usage:
+        dedup = TripDeduplicator()
+        fresh, duplicates = dedup.filter(trips, dbOps, dbName, collectionName)
+        result = dbOps.bulk_upsert(fresh, dbName, collectionName, index)
+        dedup.record(result['upserted_records'])
+    """
+    def __init__(self, capacity=None, error_rate=0.001):
+        self.bloom = BloomFilter(capacity, error_rate) if capacity else None
+        self.seen = None if capacity else set()
+        self.stats = {'checked': 0, 'duplicates': 0, 'looked_up': 0, 'confirmed': 0}
+
+    def add(self, fingerprint):
+        if self.bloom is not None:
+            self.bloom.add(fingerprint)
+        else:
+            self.seen.add(fingerprint)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in (self.bloom if self.bloom is not None else self.seen)
+
+    def __len__(self):
+        return len(self.bloom if self.bloom is not None else self.seen)
+
+    def check(self, trips):
+        """
+        Split trips into (fresh, duplicates, maybe) without any I/O. `maybe` holds
+        the trips whose fingerprint has to be looked up in the collection (see
+        stored_query and confirm). A repeat within `trips`, or of a fingerprint the
+        exact set saw written, is a duplicate; trips without a fingerprint are fresh.
+        """
+        fresh, duplicates, maybe = [], [], []
+        batch = set()
+        for trip in trips:
+            fingerprint = trip.get(FINGERPRINT_FIELD)
+            if fingerprint is None:
+                fresh.append(trip)
+            elif fingerprint in batch:
+                duplicates.append(trip)
+            elif self.bloom is None and fingerprint in self:
+                duplicates.append(trip)
+                batch.add(fingerprint)
+            else:
+                maybe.append(trip)
+                batch.add(fingerprint)
+        self.stats['checked'] += len(trips)
+        self.stats['duplicates'] += len(duplicates)
+        self.stats['looked_up'] += len(maybe)
+        return fresh, duplicates, maybe
+
+    def record(self, written):
+        """Remember the fingerprints of trips that were written to the collection"""
+        for trip in written:
+            if trip.get(FINGERPRINT_FIELD) is not None:
+                self.add(trip[FINGERPRINT_FIELD])
+
+    def confirm(self, maybe, stored):
+        """Settle looked up trips given the subset of their fingerprints found in the collection"""
+        fresh = [trip for trip in maybe if trip[FINGERPRINT_FIELD] not in stored]
+        duplicates = [trip for trip in maybe if trip[FINGERPRINT_FIELD] in stored]
+        self.stats['duplicates'] += len(duplicates)
+        self.stats['confirmed'] += len(duplicates)
+        return fresh, duplicates
+
+    @staticmethod
+    def stored_query(maybe):
+        return {FINGERPRINT_FIELD: {'$in': [trip[FINGERPRINT_FIELD] for trip in maybe]}}
+
+    def filter(self, trips, dbOps=None, db=None, collection=None):
+        """(fresh, duplicates) for one batch, with a single $in lookup through dbOps"""
+        fresh, duplicates, maybe = self.check(trips)
+        if maybe:
+            docs = dbOps.findItemsByQuery(self.stored_query(maybe), db, collection,
+                                          projection={FINGERPRINT_FIELD: 1, '_id': 0})
+            confirmedFresh, confirmed = self.confirm(maybe, {doc[FINGERPRINT_FIELD] for doc in docs})
+            fresh += confirmedFresh
+            duplicates += confirmed
+        return fresh, duplicates
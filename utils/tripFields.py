@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from utils.utils import parseTripDate, parseMoneyCents, parseDistance, parseDuration
+
+
+# Bump whenever typed_fields() changes, so DBOperations.migrateTypedFields revisits every trip
+TYPED_VERSION = 2
+# trip field -> typed counterpart; money is kept in integer cents so sums stay exact
+MONEY_FIELDS = {
+    'total': 'totalCents',
+    'tripFare': 'tripFareCents',
+    'subtotal': 'subtotalCents',
+    'HST': 'HSTCents',
+    'TNC': 'TNCCents',
+    'insurance': 'insuranceCents',
+}
+# Every field typed_fields() can set
+TYPED_FIELDS = ('tripDate', 'tripStart', 'tripEnd', *MONEY_FIELDS.values(), 'distanceKm', 'durationMin',
+                'typedVersion')
+# Display fields typed_fields() reads
+SOURCE_FIELDS = ('date', 'pickUpTime', 'dropTime', 'distance', 'duration', *MONEY_FIELDS)
+TIME_FORMAT = '%I:%M %p'
+
+
+def parseClock(text):
+    # "8:05 AM" -> timedelta(hours=8, minutes=5); None when it is not a clock time
+    if not isinstance(text, str) or not text.strip():
+        return None
+    try:
+        clock = datetime.strptime(text.strip(), TIME_FORMAT)
+    except ValueError:
+        return None
+    return timedelta(hours=clock.hour, minutes=clock.minute)
+
+
+def typed_fields(trip):
+    """
+    Range-queryable BSON values next to the display strings of a trip: tripDate,
+    tripStart and tripEnd as datetimes (receipt wall-clock time, stored as naive
+    UTC), money as integer cents (totalCents, HSTCents, ...), distanceKm and
+    durationMin as floats. Values that cannot be parsed are left out, and
+    typedVersion records which conversion produced the rest.
+    """
+    typed = {'typedVersion': TYPED_VERSION}
+    tripDate = parseTripDate(trip.get('date'))
+    if tripDate is not None:
+        typed['tripDate'] = tripDate
+        start = parseClock(trip.get('pickUpTime'))
+        end = parseClock(trip.get('dropTime'))
+        if start is not None:
+            typed['tripStart'] = tripDate + start
+        if end is not None:
+            typed['tripEnd'] = tripDate + end
+            # A ride past midnight ends on the next day
+            if start is not None and end < start:
+                typed['tripEnd'] += timedelta(days=1)
+    for field, typedField in MONEY_FIELDS.items():
+        cents = parseMoneyCents(trip.get(field))
+        if cents is not None:
+            typed[typedField] = cents
+    distance = parseDistance(trip.get('distance'))
+    if distance is not None:
+        typed['distanceKm'] = distance
+    duration = parseDuration(trip.get('duration'))
+    if duration is not None:
+        typed['durationMin'] = duration
+    return typed
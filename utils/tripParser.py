@@ -1,35 +1,62 @@
 from utils.utils import *
+from utils.extractionEngine import ExtractionEngine
+from utils.textCodecs import get_codec
+from utils.tripDedup import trip_fingerprint, FINGERPRINT_FIELD
+from utils.tripFields import typed_fields
+from utils.metrics import metrics
 import copy
 
-mailParser = load_config('./uberMailParser.yaml')
+PARSER_CONFIG_PATH = './uberMailParser.yaml'
 
-class TripParser():
-    def __init__(self, eid ,date, emailText, compressionAlgo):
 
+_engine = None
+
+
+def get_extraction_engine():
+    """ExtractionEngine for PARSER_CONFIG_PATH, loaded on first use instead of at import"""
+    global _engine
+    if _engine is None:
+        _engine = ExtractionEngine(load_config(PARSER_CONFIG_PATH))
+    return _engine
+
+
+def set_extraction_engine(engine):
+    """Swap the engine TripParser extracts with, e.g. one built from another parser config"""
+    global _engine
+    _engine = engine
+
+
+class TripParser():
+    def __init__(self, eid ,date, emailText, compressionAlgo, fields=None):
+        # compressionAlgo: a textCodecs Codec, a codec name or a module such as gzip
+        codec = get_codec(compressionAlgo)
+        if isinstance(emailText, str):
+            raw = emailText.encode('utf-8')
+            with metrics.stage('compress', items=1, nbytes=len(raw)):
+                compressed = compressText(raw, codec)
+        else:
+            compressed = emailText
         self.trip = {
         'eid': eid,
         'date': formatDate(date),
-        'emailText': compressText(emailText.encode('utf-8'), compressionAlgo) if isinstance(emailText, str) else emailText,
-        'compressorName': compressionAlgo.__name__,
-        'total': find_text(mailParser['UberBillAttr']['Total'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'tripFare': find_text(mailParser['UberBillAttr']['Trip_Fare'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'subtotal': find_text(mailParser['UberBillAttr']['Subtotal'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'insurance': find_text(mailParser['UberBillAttr']['Insurance'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'HST': find_text(mailParser['UberBillAttr']['HST'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'TNC': find_text(mailParser['UberBillAttr']['tnc_recovery_fees'], emailText, mailParser['UberBillAttr']['Regex']['PriceRegex']),
-        'driver': find_text(mailParser['UberBillAttr']['driver'], emailText, mailParser['UberBillAttr']['Regex']['DriverRegex']),
-        'driverRating': find_text(mailParser['UberBillAttr']['driverRating'], emailText, mailParser['UberBillAttr']['Regex']['RatingRegex'])
+        'emailText': compressed,
+        'compressorName': codec.name,
         }
-        
-        distance, duration = find_distance_duration(mailParser['UberBillAttr']['distance'], emailText)
-        self.trip['distance'] = distance
-        self.trip['duration'] = duration
-        
-        pickupLocation, dropOffLocation, pickUpTime, dropTime = pickUpDropOffInfo(emailText)
-        self.trip['pickupLocation'] = pickupLocation
-        self.trip['dropOffLocation'] = dropOffLocation
-        self.trip['pickUpTime'] = pickUpTime
-        self.trip['dropTime'] = dropTime
+        if codec.dict_id:
+            # Needed to read emailText back, see DBOperations.findItemsByQuery(decompress=True)
+            self.trip['compressorDict'] = codec.dict_id
+        # total, fares, taxes, driver, distance/duration and pickup/drop-off info in one pass,
+        # unless the caller already has them from the parse cache
+        if fields is None:
+            with metrics.stage('parse', items=1, nbytes=len(emailText)):
+                fields = get_extraction_engine().extract(emailText)
+        self.trip.update(fields)
+        # Datetimes, integer cents, km and minutes next to the display strings, for range queries
+        self.trip.update(typed_fields(self.trip))
+        # Same receipt forwarded twice -> same fingerprint, whatever its eid
+        fingerprint = trip_fingerprint(self.trip)
+        if fingerprint is not None:
+            self.trip[FINGERPRINT_FIELD] = fingerprint
 
     def __str__(self):
         return copy.deepcopy(self.trip)
@@ -1,6 +1,13 @@
-import yaml 
 import re
 from datetime import datetime
+from utils.metrics import get_logger
+
+log = get_logger('utils')
+
+MONEY_REGEX = re.compile(r'-?\D{0,3}?(\d+(?:\.\d{1,2})?)')
+NUMBER_REGEX = re.compile(r'\d+(?:\.\d+)?')
+HOURS_REGEX = re.compile(r'(\d+)\s*h')
+MINUTES_REGEX = re.compile(r'(\d+(?:\.\d+)?)\s*min')
 
 
 def formatDate(date):
@@ -14,8 +21,47 @@ def formatDate(date):
 
 
 
+def parseTripDate(date):
+    # Inverse of formatDate: "Tue, 01 Jul 2025" -> datetime(2025, 7, 1)
+    try:
+        return datetime.strptime(date, "%a, %d %b %Y")
+    except (TypeError, ValueError):
+        return None
+
+
+def parseMoneyCents(text):
+    # "CA$23.45" / "$23.45" / "23.45" -> 2345; None when there is no amount
+    if not isinstance(text, str):
+        return None
+    match = MONEY_REGEX.search(text.replace(',', ''))
+    if not match:
+        return None
+    whole, _, fraction = match.group(1).partition('.')
+    cents = int(whole) * 100 + int((fraction + '00')[:2])
+    return -cents if match.group(0).startswith('-') else cents
+
+
+def parseDistance(text):
+    # "2.59 kilometres " -> 2.59
+    match = NUMBER_REGEX.search(text) if isinstance(text, str) else None
+    return float(match.group(0)) if match else None
+
+
+def parseDuration(text):
+    # " 13 min" -> 13.0, "13.5 min" -> 13.5, "1 hr 5 min" -> 65.0
+    if not isinstance(text, str):
+        return None
+    hours = HOURS_REGEX.search(text)
+    minutes = MINUTES_REGEX.search(text)
+    if not hours and not minutes:
+        return None
+    return (int(hours.group(1)) * 60 if hours else 0) + (float(minutes.group(1)) if minutes else 0.0)
+
+
 # Loads requested yaml file located at file_path
 def load_config(file_path: str) -> dict:
+    # yaml is only needed once a config is read, not by every importer of these helpers
+    import yaml
     with open(file_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
     
@@ -27,7 +73,7 @@ def find_text(query, text, regex):
         word = ''
         for line in split_text:
             if query in line:
-                print(line)
+                log.debug('%s', line)
                 
                 split_line = line.split()
                 for word in split_line:
@@ -49,18 +95,23 @@ def find_distance_duration(query, text):
      return distance, duration
 
 
+WS = r"(?:\s|\u00A0|\u202F)"
+
+# Canadian street address line, e.g. "123 Queen St W, Toronto, ON M5H 2N2, CA".
+# Compiled once at import instead of on every email.
+ADDRESS_PATTERN = re.compile(
+    rf'^\s*'
+    rf'(?P<street_number>\d{{1,6}})\s+(?P<street>[^,]+?),\s*'
+    rf'(?P<city>[A-Za-z][A-Za-z.\-\s\'’]+),\s*'  # allow apostrophes/curly apostrophes
+    rf'(?P<province>AB|BC|MB|NB|NL|NS|NT|NU|ON|PE|QC|SK|YT)\s+'
+    rf'(?P<postal>[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTVWXYZ]{WS}?\d[ABCEGHJ-NPRSTVWXYZ]\d)'
+    rf'\s*,\s*CA\s*$',
+    re.IGNORECASE
+)
+
+
 def pickUpDropOffInfo(billEmailText):
-    WS = r"(?:\s|\u00A0|\u202F)"
-
-    pattern = re.compile(
-        rf'^\s*'
-        rf'(?P<street_number>\d{{1,6}})\s+(?P<street>[^,]+?),\s*'
-        rf'(?P<city>[A-Za-z][A-Za-z.\-\s\'’]+),\s*'  # allow apostrophes/curly apostrophes
-        rf'(?P<province>AB|BC|MB|NB|NL|NS|NT|NU|ON|PE|QC|SK|YT)\s+'
-        rf'(?P<postal>[ABCEGHJ-NPRSTVXY]\d[ABCEGHJ-NPRSTVWXYZ]{WS}?\d[ABCEGHJ-NPRSTVWXYZ]\d)'
-        rf'\s*,\s*CA\s*$',
-        re.IGNORECASE
-    )
+    pattern = ADDRESS_PATTERN
 
     addressDict = {
         "fromAddress" : {}, 
@@ -75,7 +126,7 @@ def pickUpDropOffInfo(billEmailText):
     for index,line in enumerate(splitBillText):
         addressPatternMatch = pattern.match(line)
         if addressPatternMatch:
-            print(True)
+            log.debug('Address line matched: %s', line)
             if addressDict['fromAddress'] == {}:
                 addressDict['fromAddress'] = addressPatternMatch.groupdict()
                 timeDict['fromTime'] = splitBillText[index - 1]